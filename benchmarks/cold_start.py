@@ -0,0 +1,49 @@
+"""
+Cold start probe.
+
+Imports the bot, builds the Application and runs startup up to the point where updates would start being fetched,
+then prints the startup phases as one JSON line and shuts down. Expects the same environment as the bot; run.py
+points it at the fake servers and measures it in fresh processes.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def probe() -> None:
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    import bot
+
+    app = bot.create_application()
+    await app.initialize()
+    await app.post_init(app)
+    print(json.dumps(bot.startup.phases), flush=True)
+    await app.post_stop(app)
+    await app.shutdown()
+
+
+def measure(runs: int) -> list:
+    """
+    Starts the probe in fresh interpreters and returns, per run, the phases reported by the bot plus the wall
+    time from spawning the process until it was ready, which also covers interpreter startup.
+    """
+    results = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdout=subprocess.PIPE, text=True)
+        line = process.stdout.readline()
+        ready = time.perf_counter() - started
+        process.communicate(timeout=60)
+        if process.returncode or not line:
+            raise RuntimeError(f"Cold start probe failed with exit code {process.returncode}")
+        results.append({**json.loads(line), "process": round(ready, 4)})
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(probe())
@@ -0,0 +1,164 @@
+"""
+Local stand-in for the Telegram Bot API used by the benchmarks.
+"""
+import email
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def parse_body(content_type: str, body: bytes) -> dict:
+    """
+    Decodes the form, multipart or JSON body of a Bot API request into a flat dict.
+    """
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if content_type.startswith("multipart/form-data"):
+        message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        fields = {}
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename() is None:
+                fields[name] = part.get_payload(decode=True).decode("utf-8")
+        return fields
+    return {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+
+class FakeTelegramServer:
+    """
+    Answers Bot API methods with plausible results and records every call with its arrival time.
+    Every answer is delayed by latency plus uniform jitter, and error_rate of the calls fail with a 500.
+    With flood_limit set, a chat that gets more than that many messages or edits within one second is
+    answered with 429 and retry_after, like Telegram's flood control.
+    """
+
+    FLOOD_METHODS = ("sendMessage", "sendPhoto", "editMessageText")
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: int | None = None, flood_limit: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.flood_limit = flood_limit
+        self.flood_errors = 0
+        self._recent = defaultdict(list)
+        self._random = random.Random(seed)
+        self.calls = []
+        self.calls_by_chat = defaultdict(list)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._server = _Server((host, port), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/bot"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                fields = parse_body(self.headers.get("Content-Type", ""), self.rfile.read(length))
+                method = self.path.rsplit("/", 1)[-1]
+                delay, failed = server.fault() if method != "getMe" else (0.0, False)
+                if delay:
+                    time.sleep(delay)
+                if failed:
+                    server.record(method, fields)
+                    status = 500
+                    body = json.dumps({"ok": False, "error_code": 500, "description": "Injected fault"}).encode()
+                elif server.flooded(method, fields):
+                    status = 429
+                    body = json.dumps({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                       "parameters": {"retry_after": 1}}).encode()
+                else:
+                    status = 200
+                    body = json.dumps({"ok": True, "result": server.handle(method, fields)}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def fault(self) -> tuple:
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            failed = bool(self.error_rate) and self._random.random() < self.error_rate
+        return delay, failed
+
+    def flooded(self, method: str, fields: dict) -> bool:
+        if not self.flood_limit or method not in self.FLOOD_METHODS:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent[str(fields.get("chat_id"))]
+            recent[:] = [sent for sent in recent if sent > now - 1.0]
+            if len(recent) >= self.flood_limit:
+                self.flood_errors += 1
+                return True
+            recent.append(now)
+        return False
+
+    def record(self, method: str, fields: dict) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self.calls.append((now, method, fields))
+            if "chat_id" in fields:
+                self.calls_by_chat[str(fields["chat_id"])].append((now, method))
+
+    def handle(self, method: str, fields: dict):
+        self.record(method, fields)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "sendPhoto", "editMessageText"):
+            return self.message(method, fields)
+        return True
+
+    def message(self, method: str, fields: dict) -> dict:
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        chat_id = int(fields.get("chat_id", 0))
+        message = {
+            "message_id": int(fields.get("message_id", message_id)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if method == "sendPhoto":
+            message["photo"] = [{"file_id": f"photo-{message_id}", "file_unique_id": f"u{message_id}",
+                                 "width": 640, "height": 480}]
+        else:
+            message["text"] = fields.get("text", "")
+        return message
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,80 @@
+"""
+Intent classification benchmark.
+
+Classifies a synthetic corpus of free-text messages (mode requests in Ukrainian and English, with inflections,
+typos and unrelated chatter) with the bot's intent matcher and prints the throughput as one JSON line. Fails
+when the rate is below --min-rate messages per second.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHRASES = [
+    "Розкажи мені цікавий факт", "хочу випадковий факт", "give me a random fact",
+    "У мене є питання про Python", "хочу запитати chatgpt", "ask gpt something",
+    "Хочу поговорити з Гендальфом", "можна поспілкуватися з особистістю?", "let's talk",
+    "Перекладіть, будь ласка, цей текст", "перкладач", "translate this into English",
+    "Порадь якусь книгу", "порекомендуй фільм на вечір", "recommend some music",
+    "Привіт, як справи?", "дякую", "ok", "що ти вмієш?", "сьогодні гарна погода",
+]
+WORDS = "будь ласка мені зараз сьогодні дуже швидко please now today very".split()
+
+
+def corpus(size: int, seed: int) -> list:
+    """
+    Builds messages from the phrases with random filler words and occasional dropped letters, so most of
+    them are distinct and the per-word fuzzy cache is exercised as in real traffic.
+    """
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(size):
+        words = rng.choice(PHRASES).split() + rng.sample(WORDS, rng.randint(0, 3))
+        rng.shuffle(words)
+        if rng.random() < 0.2:
+            index = rng.randrange(len(words))
+            word = words[index]
+            if len(word) > 4:
+                position = rng.randrange(len(word))
+                words[index] = word[:position] + word[position + 1:]
+        messages.append(" ".join(words))
+    return messages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--min-rate", type=float, default=0, help="fail below this many messages per second")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    from handlers import INTENT_MATCHER
+
+    messages = corpus(args.messages, args.seed)
+    started = time.perf_counter()
+    matches = [INTENT_MATCHER.classify(message) for message in messages]
+    elapsed = time.perf_counter() - started
+    routed = {}
+    for match in matches:
+        name = match.name if match else None
+        routed[name] = routed.get(name, 0) + 1
+    result = {
+        "messages": len(messages),
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(messages) / elapsed),
+        "microseconds_per_message": round(elapsed / len(messages) * 1e6, 2),
+        "fuzzy": sum(1 for match in matches if match and match.fuzzy),
+        "routed": {str(name): count for name, count in sorted(routed.items(), key=lambda item: str(item[0]))},
+    }
+    print(json.dumps(result, ensure_ascii=False))
+    if result["messages_per_second"] < args.min_rate:
+        sys.exit(f"{result['messages_per_second']} messages/s is below --min-rate {args.min_rate}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Offline benchmark of the bot.
+
+Starts local stand-ins for the Telegram Bot API and the OpenAI chat completions endpoint, builds the real
+Application from src/bot.py and drives it with scripted user journeys. Reports throughput, per-handler and
+per-journey latency percentiles, OpenAI latency and tokens per mode, upstream call counts, memory and cold start
+time, and saves everything as JSON.
+Exits with status 1 when the median cold start exceeds --cold-start-budget.
+
+    python benchmarks/run.py --users 50 --output benchmarks/results/baseline.json
+    python benchmarks/run.py --users 50 --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cold_start  # noqa: E402
+from fake_telegram import FakeTelegramServer  # noqa: E402
+from tests.fake_openai import FakeOpenAIServer  # noqa: E402
+
+
+def percentiles(values: list) -> dict:
+    """
+    Summarizes durations in seconds as count and millisecond percentiles.
+    """
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+class Driver:
+    """
+    Feeds synthetic updates into a running Application and waits for their handlers to finish.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.handler_latency = defaultdict(list)
+        self.updates = 0
+        self._ids = itertools.count(1)
+        self._done = {}
+        for handlers in app.handlers.values():
+            for handler in handlers:
+                handler.callback = self._instrument(handler.callback)
+
+    def _instrument(self, callback):
+        @functools.wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                self.handler_latency[callback.__name__].append(time.perf_counter() - started)
+                event = self._done.pop(update.update_id, None)
+                if event is not None:
+                    event.set()
+        return timed
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "uk"}
+
+    def _message(self, user_id: int, text: str) -> dict:
+        message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return message
+
+    def message(self, user_id: int, text: str) -> dict:
+        return {"update_id": next(self._ids), "message": self._message(user_id, text)}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._ids),
+            "callback_query": {
+                "id": str(next(self._ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": self._message(user_id, "menu"),
+            }
+        }
+
+    async def submit(self, data: dict) -> None:
+        """
+        Enqueues an update like the updater would and waits until its handler has finished.
+        """
+        from telegram import Update
+
+        event = asyncio.Event()
+        self._done[data["update_id"]] = event
+        self.updates += 1
+        await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+        await event.wait()
+
+    async def burst(self, updates: list) -> None:
+        await asyncio.gather(*(self.submit(update) for update in updates))
+
+
+async def talk_journey(driver: Driver, user_id: int, messages: int) -> None:
+    await driver.submit(driver.message(user_id, "/start"))
+    await driver.submit(driver.message(user_id, "/talk"))
+    await driver.submit(driver.callback(user_id, "talk:pick:gandalf"))
+    for i in range(messages):
+        await driver.submit(driver.message(user_id, f"Розкажи про Середзем'я, частина {i}"))
+
+
+async def translator_journey(driver: Driver, user_id: int, messages: int) -> None:
+    await driver.submit(driver.message(user_id, "/translator"))
+    await driver.submit(driver.callback(user_id, "translator:lang:en"))
+    phrases = ["Доброго ранку", "Як справи?", "Дякую за допомогу", "Слава Україні"]
+    await driver.burst([driver.message(user_id, phrases[i % len(phrases)]) for i in range(messages)])
+
+
+async def random_journey(driver: Driver, user_id: int, messages: int) -> None:
+    await driver.submit(driver.message(user_id, "/random"))
+    for _ in range(messages):
+        await driver.submit(driver.callback(user_id, "random:more"))
+
+
+async def recommendation_journey(driver: Driver, user_id: int, messages: int) -> None:
+    await driver.submit(driver.message(user_id, "/recommendation"))
+    await driver.submit(driver.callback(user_id, "rec:category:movies"))
+    await driver.submit(driver.message(user_id, "комедія"))
+    for _ in range(messages):
+        await driver.submit(driver.callback(user_id, "rec:next"))
+
+
+JOURNEYS = {
+    "talk": talk_journey,
+    "translator": translator_journey,
+    "random": random_journey,
+    "recommendation": recommendation_journey,
+}
+
+
+def configure_environment(args, telegram: FakeTelegramServer, openai_server: FakeOpenAIServer, workdir: str):
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "CHATGPT_TOKEN": "bench",
+        "BOT_API_BASE_URL": telegram.base_url,
+        "OPENAI_BASE_URLS": openai_server.base_url,
+        "OPENAI_PROXIES": "",
+        "CONCURRENT_UPDATES": str(args.concurrent_updates),
+        "IMAGE_CACHE_PATH": os.path.join(workdir, "image_cache.json"),
+        "COMPLETION_CACHE_PATH": "",
+        # The journeys send far faster than real users; admission control would turn them into rejections.
+        "ADMISSION_LIMITS": "",
+        "ADMISSION_GLOBAL_RATE": "0",
+        "COALESCE_MODES": "",
+        "CHAT_MAX_QUEUED": "0",
+    })
+    if not args.telegram_flood_limit:
+        # Without emulated flood control there is nothing to pace for; keep the runs comparable.
+        os.environ.update({"TELEGRAM_GLOBAL_RATE": "0", "TELEGRAM_CHAT_RATE": "0", "TELEGRAM_GROUP_RATE": "0"})
+    os.chdir(workdir)
+
+
+async def run(args) -> dict:
+    if args.tracemalloc:
+        tracemalloc.start()
+    with FakeTelegramServer(latency=args.telegram_latency, jitter=args.telegram_jitter,
+                            error_rate=args.telegram_error_rate, seed=args.seed,
+                            flood_limit=args.telegram_flood_limit) as telegram, \
+            FakeOpenAIServer(delay=args.openai_latency, jitter=args.openai_jitter,
+                             error_rate=args.openai_error_rate, seed=args.seed, token_delay=args.openai_token_delay,
+                             content=answer_text(args.openai_answer_words)) as openai_server, \
+            tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, telegram, openai_server, workdir)
+        startup = cold_start.measure(args.cold_start_runs) if args.cold_start_runs else []
+        import bot
+        logging.getLogger().setLevel(logging.WARNING)
+
+        app = bot.create_application()
+        driver = Driver(app)
+        journey_latency = defaultdict(list)
+
+        async def timed_journey(name, user_id):
+            started = time.perf_counter()
+            await JOURNEYS[name](driver, user_id, args.messages)
+            journey_latency[name].append(time.perf_counter() - started)
+
+        async with app:
+            await app.post_init(app)
+            await app.start()
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                timed_journey(name, 10_000 + index * len(args.journeys) + offset)
+                for index in range(args.users)
+                for offset, name in enumerate(args.journeys)
+            ))
+            duration = time.perf_counter() - started
+            await app.stop()
+            await app.post_stop(app)
+
+        import metrics
+
+        modes = mode_report(metrics)
+        telegram_calls = Counter(method for _, method, _ in telegram.calls)
+        openai_requests = len(openai_server.requests)
+        telegram_flood_errors = telegram.flood_errors
+
+    peak = None
+    if args.tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return {
+        "commit": current_commit(),
+        "config": vars(args),
+        "duration_s": round(duration, 3),
+        "updates": driver.updates,
+        "throughput_updates_per_s": round(driver.updates / duration, 1),
+        "handlers": {name: percentiles(values) for name, values in sorted(driver.handler_latency.items())},
+        "journeys": {name: percentiles(values) for name, values in sorted(journey_latency.items())},
+        "modes": modes,
+        "upstream": {
+            "openai_requests": openai_requests,
+            "telegram_calls": dict(sorted(telegram_calls.items())),
+            "telegram_calls_total": sum(telegram_calls.values()),
+            "telegram_429": telegram_flood_errors,
+        },
+        "memory": {
+            "tracemalloc_peak_kb": peak,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        "cold_start": summarize_cold_start(startup, args.cold_start_budget),
+    }
+
+
+def answer_text(words: int) -> str:
+    if not words:
+        return "Це відповідь для бенчмарку " * 4
+    return " ".join(f"слово{i}" for i in range(words))
+
+
+def mode_report(metrics) -> dict:
+    """
+    Collects OpenAI requests, mean latency until the answer (or its first token) and tokens per mode and model
+    from the bot's metrics.
+    """
+    report = defaultdict(lambda: {"requests": 0, "mean_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0})
+    for (mode, model), (_, total, count) in metrics.gpt_requests.values.items():
+        report[f"{mode}/{model}"].update(requests=count, mean_ms=round(total / count * 1000, 2))
+    for (kind, mode, model), value in metrics.gpt_mode_tokens.values.items():
+        report[f"{mode}/{model}"][f"{kind}_tokens"] = int(value)
+    return dict(sorted(report.items()))
+
+
+def summarize_cold_start(runs: list, budget: float) -> dict:
+    """
+    Reduces the cold start runs to median milliseconds per phase and checks the process time against the budget.
+    """
+    if not runs:
+        return {"runs": 0}
+    median = {phase: round(sorted(run[phase] for run in runs)[len(runs) // 2] * 1000, 1) for phase in runs[0]}
+    return {"runs": len(runs), "median_ms": median, "budget_ms": budget * 1000,
+            "within_budget": median["process"] <= budget * 1000}
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous: dict) -> list:
+    """
+    Lists the relative change of the headline numbers against a previous result.
+    """
+    def change(new, old):
+        if not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    lines = [f"throughput: {previous['throughput_updates_per_s']} -> {current['throughput_updates_per_s']} "
+             f"({change(current['throughput_updates_per_s'], previous['throughput_updates_per_s'])})",
+             f"openai requests: {previous['upstream']['openai_requests']} -> {current['upstream']['openai_requests']}",
+             f"telegram calls: {previous['upstream']['telegram_calls_total']} -> "
+             f"{current['upstream']['telegram_calls_total']}"]
+    old_start = previous.get("cold_start", {}).get("median_ms")
+    new_start = current.get("cold_start", {}).get("median_ms")
+    if old_start and new_start:
+        lines.append(f"cold start: {old_start['process']} -> {new_start['process']} ms "
+                     f"({change(new_start['process'], old_start['process'])})")
+    for name, stats in current.get("modes", {}).items():
+        old = previous.get("modes", {}).get(name)
+        if old:
+            lines.append(f"mode {name}: {old['mean_ms']} -> {stats['mean_ms']} ms "
+                         f"({change(stats['mean_ms'], old['mean_ms'])}), completion tokens "
+                         f"{old['completion_tokens']} -> {stats['completion_tokens']}")
+    for section in ("handlers", "journeys"):
+        for name, stats in current[section].items():
+            old = previous.get(section, {}).get(name)
+            if old and stats.get("count") and old.get("count"):
+                lines.append(f"{section[:-1]} {name} p50: {old['p50_ms']} -> {stats['p50_ms']} ms "
+                             f"({change(stats['p50_ms'], old['p50_ms'])}), p99: {old['p99_ms']} -> "
+                             f"{stats['p99_ms']} ms ({change(stats['p99_ms'], old['p99_ms'])})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="users per journey")
+    parser.add_argument("--messages", type=int, default=5, help="messages per journey")
+    parser.add_argument("--journeys", nargs="+", default=list(JOURNEYS), choices=list(JOURNEYS))
+    parser.add_argument("--concurrent-updates", type=int, default=256)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--openai-jitter", type=float, default=0.2)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-token-delay", type=float, default=0.0, help="extra seconds per answer word")
+    parser.add_argument("--openai-answer-words", type=int, default=0,
+                        help="answer length in words before max_tokens applies (0: a short fixed answer)")
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--telegram-jitter", type=float, default=0.02)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-flood-limit", type=int, default=0,
+                        help="messages per chat and second before the fake Bot API answers 429 (0: no limit)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cold-start-runs", type=int, default=3, help="fresh processes to time startup in")
+    parser.add_argument("--cold-start-budget", type=float, default=2.0, help="seconds allowed until ready")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace Python allocations (slows the run down)")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--compare", help="previous JSON result to compare against")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    previous = os.path.abspath(args.compare) if args.compare else None
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+    if previous:
+        with open(previous, "r", encoding="utf-8") as file:
+            print("\n".join(compare(result, json.load(file))))
+    if not result["cold_start"].get("within_budget", True):
+        print(f"cold start over budget: {result['cold_start']['median_ms']['process']} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
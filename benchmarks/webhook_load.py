@@ -0,0 +1,160 @@
+"""
+Local load test for the webhook mode.
+
+Starts a fake Bot API server, runs src/bot.py in webhook mode against it, posts synthetic text updates
+to the webhook and reports updates/sec and p50/p99 handling latency (webhook POST to the bot's reply).
+
+    python benchmarks/webhook_load.py --updates 2000 --chats 200 --concurrent-updates 256
+    python benchmarks/webhook_load.py --updates 2000 --chats 200 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_telegram import FakeTelegramServer  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = "load-test-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def text_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": f"hello {update_id}"
+        }
+    }
+
+
+async def wait_for_port(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"Webhook did not start on port {port}")
+
+
+async def post_updates(url: str, updates: list, concurrency: int) -> dict:
+    sent = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+        rejected = await client.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        if rejected.status_code != 403:
+            raise RuntimeError(f"Webhook accepted a wrong secret token: {rejected.status_code}")
+
+        async def post(update):
+            async with semaphore:
+                chat_id = str(update["message"]["chat"]["id"])
+                sent.setdefault(chat_id, []).append(time.perf_counter())
+                response = await client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                response.raise_for_status()
+
+        await asyncio.gather(*(post(update) for update in updates))
+    return sent
+
+
+async def run(args) -> dict:
+    port = free_port()
+    with FakeTelegramServer() as telegram, tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "BOT_TOKEN": "123:fake",
+            "CHATGPT_TOKEN": "fake",
+            "OPENAI_PROXIES": "",
+            "BOT_MODE": "webhook",
+            "BOT_API_BASE_URL": telegram.base_url,
+            "WEBHOOK_PORT": str(port),
+            "WEBHOOK_URL": f"http://127.0.0.1:{port}/telegram",
+            "WEBHOOK_SECRET": SECRET,
+            "CONCURRENT_UPDATES": str(args.concurrent_updates),
+            "IMAGE_CACHE_PATH": os.path.join(workdir, "image_cache.json"),
+            "BOT_WORKERS": str(args.workers),
+            "WORKER_BASE_PORT": str(free_port()),
+        }
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "src", "bot.py")],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            await wait_for_port(port, timeout=30)
+            while sum(1 for _, method, _ in telegram.calls if method == "getMe") < args.workers:
+                await asyncio.sleep(0.1)
+            updates = [text_update(i + 1, 1000 + i % args.chats) for i in range(args.updates)]
+            started = time.perf_counter()
+            sent = await post_updates(f"http://127.0.0.1:{port}/telegram", updates, args.client_concurrency)
+
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline:
+                replies = sum(
+                    sum(1 for _, method in calls if method == "sendMessage")
+                    for calls in telegram.calls_by_chat.values()
+                )
+                if replies >= args.updates:
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    latencies = []
+    finished = started
+    for chat_id, post_times in sent.items():
+        reply_times = [at for at, method in telegram.calls_by_chat.get(chat_id, []) if method == "sendMessage"]
+        for posted, replied in zip(post_times, reply_times):
+            latencies.append(replied - posted)
+            finished = max(finished, replied)
+    if not latencies:
+        raise RuntimeError("The bot did not answer any update")
+    return {
+        "updates": args.updates,
+        "handled": len(latencies),
+        "chats": args.chats,
+        "concurrent_updates": args.concurrent_updates,
+        "workers": args.workers,
+        "updates_per_sec": round(len(latencies) / (finished - started), 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--concurrent-updates", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes behind a front process")
+    parser.add_argument("--client-concurrency", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=60)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
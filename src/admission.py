@@ -0,0 +1,164 @@
+"""
+Admission control in front of GPT calls: token bucket limits per user and mode and globally,
+plus a cap on upstream calls in flight.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted. notify is False for repeated rejections of the same user
+    within one limited period, so that the bot does not answer every spam message.
+    """
+
+    def __init__(self, reason: str, retry_after: float, notify: bool = True):
+        super().__init__(f"{reason}, retry after {retry_after:.1f} s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.notify = notify
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to burst requests and refills at rate requests per second.
+    """
+
+    def __init__(self, rate: float, burst: float, now: float | None = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        Returns 0 if a token is available, otherwise the seconds until one will be.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+def parse_limits(value: str) -> dict:
+    """
+    Parses "mode:rate/burst,..." into {mode: (rate, burst)}, e.g. "gpt:0.5/5,random:0.2/3".
+    """
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        mode, _, limit = item.partition(":")
+        rate, _, burst = limit.partition("/")
+        limits[mode.strip()] = (float(rate), float(burst or 1))
+    return limits
+
+
+class AdmissionController:
+    """
+    Decides whether a user's request in a mode may call GPT and limits how many calls run at once.
+
+    Modes without a configured limit are only subject to the global bucket. A user's bucket is per mode,
+    so chatting in /gpt does not use up the budget for translations.
+    """
+
+    def __init__(self, limits: dict | None = None, global_rate: float = 0.0, global_burst: float = 0.0,
+                 max_in_flight: int = 0, queue_timeout: float = 10.0, max_users: int = 10000):
+        self.limits = limits or {}
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = {}
+        self.rejected = {}
+        self._buckets = {}
+        self._limited = set()
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+
+    def check(self, mode: str, user_id) -> None:
+        """
+        Takes a token for the request or raises AdmissionRejected.
+        """
+        now = time.monotonic()
+        bucket = None
+        if mode in self.limits:
+            bucket = self._buckets.get((mode, user_id))
+            if bucket is None:
+                if len(self._buckets) >= self.max_users:
+                    self._prune(now)
+                bucket = self._buckets[(mode, user_id)] = TokenBucket(*self.limits[mode], now=now)
+            wait = bucket.wait_time(now)
+            if wait:
+                self._reject(mode, "user", wait, user_id)
+        if self.global_bucket is not None:
+            wait = self.global_bucket.wait_time(now)
+            if wait:
+                self._reject(mode, "global", wait, user_id)
+            self.global_bucket.take()
+        if bucket is not None:
+            bucket.take()
+        self._limited.discard(user_id)
+        self.admitted[mode] = self.admitted.get(mode, 0) + 1
+
+    def _reject(self, mode: str, reason: str, retry_after: float, user_id) -> None:
+        self.rejected[(mode, reason)] = self.rejected.get((mode, reason), 0) + 1
+        notify = user_id not in self._limited
+        self._limited.add(user_id)
+        raise AdmissionRejected(reason, retry_after, notify)
+
+    def _prune(self, now: float) -> None:
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if not bucket.full(now)}
+        if len(self._buckets) >= self.max_users:
+            self._buckets.clear()
+        self._limited.clear()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one of max_in_flight upstream call slots, waiting up to queue_timeout for it.
+        """
+        if self._semaphore is None:
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+            return
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected[("*", "overloaded")] = self.rejected.get(("*", "overloaded"), 0) + 1
+            raise AdmissionRejected("overloaded", self.queue_timeout) from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def collect_metrics(self) -> list:
+        return [
+            ("bot_admission_admitted_total", "counter", "Requests admitted to GPT by mode.",
+             {(("mode", mode),): count for mode, count in self.admitted.items()}),
+            ("bot_admission_rejected_total", "counter", "Requests rejected by admission control.",
+             {(("mode", mode), ("reason", reason)): count for (mode, reason), count in self.rejected.items()}),
+            ("bot_admission_in_flight", "gauge", "GPT calls holding an admission slot.", {(): self.in_flight}),
+            ("bot_admission_waiting", "gauge", "GPT calls waiting for an admission slot.", {(): self.waiting}),
+        ]
@@ -2,8 +2,16 @@
 Main entry point for the Telegram bot.
 Initializes the bot and registers all command and callback handlers.
 """
-from telegram import Update
-from telegram.ext import (
+import time
+
+STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+
+from telegram import Update  # noqa: E402
+from telegram.ext import (  # noqa: E402
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
@@ -11,35 +19,204 @@ from telegram.ext import (
     filters
 )
 
-from config import BOT_TOKEN
-from handlers import (
-    start, random, random_button, gpt, message_handler, talk, talk_button,
-    translator, translator_button, gpt_button, recommendation, recommendation_button
+from config import (  # noqa: E402
+    BOT_TOKEN, RESOURCE_RELOAD_INTERVAL, BOT_API_BASE_URL, BOT_MODE, CONCURRENT_UPDATES, WEBHOOK_LISTEN,
+    WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, DROP_PENDING_UPDATES, METRICS_HOST, METRICS_PORT,
+    METRICS_TRACE, LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_INFO_SAMPLE_RATE,
+    PERSISTENCE_INTERVAL, PERSISTENCE_RETENTION, CHAT_MAX_QUEUED, BOT_WORKERS, WORKER_BASE_PORT, WORKER_PORT,
+    WORKER_HEALTH_INTERVAL, WORKER_HEALTH_TIMEOUT, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+    TELEGRAM_GROUP_RATE, TELEGRAM_GROUP_BURST, TELEGRAM_MAX_RETRIES, CONCURRENT_GPT_UPDATES, ADMISSION_GLOBAL_RATE,
+    ADMISSION_GLOBAL_BURST, ADMISSION_MAX_IN_FLIGHT
 )
+from handlers import (  # noqa: E402
+    start, random, gpt, message_handler, talk, translator, recommendation, callbacks, update_priority, MAIN_MENU,
+    REQUIRED_RESOURCES
+)
+from logging_setup import setup_logging  # noqa: E402
+import metrics  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+from services import services  # noqa: E402
+from sharding import Front, serve_updates, wait_for_signal  # noqa: E402
+from update_processor import ChatOrderedUpdateProcessor  # noqa: E402
+from utils import OutboundScheduler, image_cache, register_default_menu, registry  # noqa: E402
 
+background_tasks = set()
+metrics_servers = []
+logger = logging.getLogger(__name__)
+startup = metrics.StartupTimer(STARTED)
+startup.mark("import")
 
-app = ApplicationBuilder().token(BOT_TOKEN).build()
-app.add_handler(CommandHandler("start", start))
-app.add_handler(CommandHandler("random", random))
-app.add_handler(CommandHandler("gpt", gpt))
-app.add_handler(CommandHandler("talk", talk))
-app.add_handler(CommandHandler("translator", translator))
-app.add_handler(CommandHandler("recommendation", recommendation))
 
-app.add_handler(CallbackQueryHandler(gpt_button, pattern='^start$'))
-app.add_handler(CallbackQueryHandler(random_button, pattern='^(random|start)$'))
-app.add_handler(
-    CallbackQueryHandler(talk_button, pattern='^talk_.*|^talk$|^start$')
-)
-app.add_handler(
-    CallbackQueryHandler(translator_button, pattern='^translator.*|^start$')
-)
-app.add_handler(
-    CallbackQueryHandler(
-        recommendation_button,
-        pattern='^rec_.*|^next_recommendation$|^recommendation_back$|^start$'
-    )
-)
-app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+async def post_init(application):
+    """
+    Builds the services before the first update arrives, then starts background watching of the resource
+    directory for hot reload, the metrics endpoint, periodic flushing of conversation histories and
+    registration of the default command menu.
+    """
+    startup.mark("initialize")
+    await asyncio.to_thread(lambda: services.chatgpt)
+    startup.mark("clients")
+    background_tasks.add(asyncio.create_task(register_default_menu(application.bot, MAIN_MENU, services.menus)))
+    if services.storage is not None:
+        background_tasks.add(asyncio.create_task(services.sessions.run_flusher(PERSISTENCE_INTERVAL)))
+    if RESOURCE_RELOAD_INTERVAL > 0:
+        background_tasks.add(asyncio.create_task(registry.watch(RESOURCE_RELOAD_INTERVAL)))
+    if METRICS_PORT:
+        metrics_servers.append(await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT))
+    startup.mark("background")
+    startup.report()
+
+
+async def post_stop(application):
+    """
+    Cancels background tasks and closes the metrics endpoint started in post_init,
+    then writes out the remaining conversation changes.
+    """
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    if services.built("sessions"):
+        await services.sessions.flush()
+    for server in metrics_servers:
+        server.close()
+    metrics_servers.clear()
+
+
+def create_application():
+    """
+    Builds the Application with all command, callback and message handlers registered. Services are not
+    constructed here; the slow imports they need are started in the background and finished in post_init.
+    """
+    services.prewarm()
+    registry.load()
+    registry.validate(REQUIRED_RESOURCES)
+    image_cache.load()
+    startup.mark("resources")
+    metrics.registry.register_collector(services.collect_metrics)
+    metrics.registry.register_collector(callbacks.collect_metrics)
+
+    if METRICS_TRACE:
+        metrics.set_tracing(True)
+    scheduler = OutboundScheduler(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE,
+                                  TELEGRAM_GROUP_BURST, TELEGRAM_MAX_RETRIES)
+    metrics.registry.register_collector(scheduler.collect_metrics)
+    builder = (ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).post_stop(post_stop)
+               .request(metrics.InstrumentedRequest(connection_pool_size=256))
+               .get_updates_request(metrics.InstrumentedRequest())
+               .rate_limiter(scheduler))
+    if services.storage is not None:
+        builder = builder.persistence(SQLitePersistence(services.storage, PERSISTENCE_INTERVAL, PERSISTENCE_RETENTION))
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    if CONCURRENT_UPDATES > 1:
+        processor = ChatOrderedUpdateProcessor(CONCURRENT_UPDATES, CHAT_MAX_QUEUED, CONCURRENT_GPT_UPDATES,
+                                               update_priority)
+        metrics.registry.register_collector(processor.collect_metrics)
+        builder = builder.concurrent_updates(processor)
+    if BOT_MODE == "worker":
+        builder = builder.updater(None)
+    app = builder.build()
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("random", random))
+    app.add_handler(CommandHandler("gpt", gpt))
+    app.add_handler(CommandHandler("talk", talk))
+    app.add_handler(CommandHandler("translator", translator))
+    app.add_handler(CommandHandler("recommendation", recommendation))
+
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = metrics.instrument_handler(handler.callback)
+    # Buttons are instrumented per route, so the metrics still tell the handlers apart.
+    callbacks.instrument(metrics.instrument_handler)
+    app.add_handler(CallbackQueryHandler(callbacks.dispatch))
+    startup.mark("build")
+    return app
+
+
+async def run_worker(app) -> None:
+    """
+    Runs the application as a worker: updates come from the front process instead of an updater.
+    """
+    parent_pid = os.getppid()
+    async with app:
+        await app.post_init(app)
+        await app.start()
+        try:
+            server = await serve_updates(app, "127.0.0.1", WORKER_PORT)
+            await wait_for_signal(parent_pid)
+            server.close()
+        finally:
+            await app.stop()
+            await app.post_stop(app)
+
+
+async def run_front() -> None:
+    """
+    Runs the front process: starts and supervises the workers and routes incoming updates to them by chat.
+    """
+    import httpx
+
+    front = Front(BOT_TOKEN, BOT_API_BASE_URL, BOT_WORKERS, WORKER_BASE_PORT, WORKER_HEALTH_INTERVAL,
+                  WORKER_HEALTH_TIMEOUT, {
+                      "TELEGRAM_GLOBAL_RATE": TELEGRAM_GLOBAL_RATE,
+                      "ADMISSION_GLOBAL_RATE": ADMISSION_GLOBAL_RATE,
+                      "ADMISSION_GLOBAL_BURST": ADMISSION_GLOBAL_BURST,
+                      "ADMISSION_MAX_IN_FLIGHT": ADMISSION_MAX_IN_FLIGHT,
+                  })
+    supervisors = [asyncio.create_task(worker.supervise()) for worker in front.workers]
+    if METRICS_PORT:
+        metrics.registry.register_collector(front.collect_metrics)
+        metrics_servers.append(await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT))
+    async with httpx.AsyncClient(timeout=30) as client:
+        if BOT_MODE == "webhook":
+            intake = await front.serve_webhook(client, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL or None,
+                                               WEBHOOK_SECRET or None, Update.ALL_TYPES, DROP_PENDING_UPDATES)
+        else:
+            intake = asyncio.create_task(front.poll(client, Update.ALL_TYPES, DROP_PENDING_UPDATES))
+        logger.info("Фронт запущено з %s воркерами", BOT_WORKERS)
+        await wait_for_signal()
+        if BOT_MODE == "webhook":
+            intake.stop()
+        else:
+            intake.cancel()
+    deadline = time.monotonic() + 5
+    while any(worker.pending for worker in front.workers) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    for task in supervisors:
+        task.cancel()
+    await asyncio.gather(*supervisors, return_exceptions=True)
+
+
+def main():
+    """
+    Runs the bot in polling or webhook mode depending on the configuration, as a single process,
+    as a front process with BOT_WORKERS worker processes, or as one of those workers.
+    """
+    listener = setup_logging(LOG_LEVEL, LOG_FILE or None, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+                             LOG_INFO_SAMPLE_RATE)
+    try:
+        if BOT_WORKERS > 1 and BOT_MODE != "worker":
+            asyncio.run(run_front())
+            return
+        app = create_application()
+        if BOT_MODE == "worker":
+            asyncio.run(run_worker(app))
+        elif BOT_MODE == "webhook":
+            app.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=WEBHOOK_URL or None,
+                secret_token=WEBHOOK_SECRET or None,
+                drop_pending_updates=DROP_PENDING_UPDATES,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            app.run_polling(drop_pending_updates=DROP_PENDING_UPDATES, allowed_updates=Update.ALL_TYPES)
+    finally:
+        listener.stop()
+
 
-app.run_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Content-addressed cache for deterministic completions with coalescing of identical in-flight requests.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk cache storage so cached completions survive restarts.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str, min_created: float) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM completions WHERE key = ? AND created >= ?", (key, min_created)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, created: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created) VALUES (?, ?, ?)", (key, value, created)
+            )
+            self._connection.commit()
+
+    def prune(self, min_created: float) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM completions WHERE created < ?", (min_created,))
+            self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class CompletionCache:
+    """
+    LRU cache of completions with a TTL, an optional disk backend and request coalescing.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400.0, backend: SQLiteCacheBackend = None,
+                 clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._waiters = {}
+        if backend is not None:
+            backend.prune(clock() - ttl)
+
+    @staticmethod
+    def key(messages: list, params: dict) -> str:
+        """
+        Builds the cache key from the request messages and the generation parameters.
+        """
+        payload = json.dumps([messages, params], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_memory(self, key: str, now: float) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if now - created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: str, created: float) -> None:
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute) -> str:
+        """
+        Returns the cached completion for the key, joining an identical request already in flight
+        or computing it once otherwise.
+        """
+        now = self._clock()
+        value = self._get_memory(key, now)
+        if value is not None:
+            self.hits += 1
+            return value
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._load_or_compute(key, compute, now))
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: self._forget(key))
+        return await self._wait(key, task)
+
+    async def _wait(self, key: str, task: asyncio.Future) -> str:
+        """
+        Awaits the shared task, cancelling it once every caller waiting on it has been cancelled.
+        """
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    task.cancel()
+            raise
+
+    def _forget(self, key: str) -> None:
+        self._inflight.pop(key, None)
+        self._waiters.pop(key, None)
+
+    async def _load_or_compute(self, key: str, compute, now: float) -> str:
+        if self.backend is not None:
+            value = await asyncio.to_thread(self.backend.get, key, now - self.ttl)
+            if value is not None:
+                self.hits += 1
+                self._set_memory(key, value, now)
+                return value
+        self.misses += 1
+        value = await compute()
+        created = self._clock()
+        self._set_memory(key, value, created)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.set, key, value, created)
+        return value
@@ -4,7 +4,97 @@ Configuration module for loading environment variables.
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# An explicit path skips find_dotenv()'s directory walk; variables already set in the environment win.
+load_dotenv(os.getenv("DOTENV_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")))
 
 CHATGPT_TOKEN = os.getenv("CHATGPT_TOKEN")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+OPENAI_BASE_URLS = [url.strip() or None for url in os.getenv("OPENAI_BASE_URLS", "").split(",")]
+OPENAI_PROXIES = [proxy.strip() or None for proxy in os.getenv("OPENAI_PROXIES", "").split(",")]
+OPENAI_ENDPOINTS = [(url, proxy) for url in OPENAI_BASE_URLS for proxy in OPENAI_PROXIES]
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "3"))
+OPENAI_ATTEMPT_TIMEOUT = float(os.getenv("OPENAI_ATTEMPT_TIMEOUT", "30"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+OPENAI_HEDGE_DELAY = float(os.getenv("OPENAI_HEDGE_DELAY", "0")) or None
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+
+# Per-mode overrides of the generation profiles, e.g. "translator: model=gpt-4o-mini; *: fallback=gpt-4o-mini slo=8".
+GENERATION_PROFILES = os.getenv("GENERATION_PROFILES", "")
+GENERATION_SLO_WINDOW = int(os.getenv("GENERATION_SLO_WINDOW", "20"))
+GENERATION_SLO_MISS_RATIO = float(os.getenv("GENERATION_SLO_MISS_RATIO", "0.25"))
+GENERATION_SLO_COOLDOWN = float(os.getenv("GENERATION_SLO_COOLDOWN", "60"))
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "bot_state.sqlite3")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+PERSISTENCE_RETENTION = float(os.getenv("PERSISTENCE_RETENTION", str(30 * 86400)))
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SUMMARIZE = os.getenv("CONTEXT_SUMMARIZE", "true").lower() in ("1", "true", "yes")
+
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", "image_cache.json")
+
+RESOURCE_RELOAD_INTERVAL = float(os.getenv("RESOURCE_RELOAD_INTERVAL", "0"))
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() in ("1", "true", "yes")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_GROUP_BURST = float(os.getenv("TELEGRAM_GROUP_BURST", "5"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8600"))
+WORKER_PORT = int(os.getenv("WORKER_PORT", "0"))
+WORKER_HEALTH_INTERVAL = float(os.getenv("WORKER_HEALTH_INTERVAL", "5"))
+WORKER_HEALTH_TIMEOUT = float(os.getenv("WORKER_HEALTH_TIMEOUT", "15"))
+
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "gpt:0.5/5,talk:0.5/5,translator:1/10,random:0.2/5,recommendation:0.2/5")
+ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "20"))
+ADMISSION_GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", "40"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+CHAT_MAX_QUEUED = int(os.getenv("CHAT_MAX_QUEUED", "10"))
+CONCURRENT_GPT_UPDATES = int(os.getenv("CONCURRENT_GPT_UPDATES", "64"))
+COALESCE_MODES = {mode.strip() for mode in os.getenv("COALESCE_MODES", "gpt,talk,translator").split(",") if mode.strip()}
+
+CACHED_MODES = {mode.strip() for mode in os.getenv("CACHED_MODES", "translator,recommendation").split(",") if mode.strip()}
+COMPLETION_CACHE_SIZE = int(os.getenv("COMPLETION_CACHE_SIZE", "1000"))
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", "86400"))
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH")
+
+TRANSLATOR_SEGMENT_LENGTH = int(os.getenv("TRANSLATOR_SEGMENT_LENGTH", "1500"))
+
+PREFETCH_CAPACITY = int(os.getenv("PREFETCH_CAPACITY", "3"))
+PREFETCH_LOW_WATER = int(os.getenv("PREFETCH_LOW_WATER", "1"))
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_TRACE = os.getenv("METRICS_TRACE", "false").lower() in ("1", "true", "yes")
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
@@ -0,0 +1,133 @@
+"""
+Token budgeting for conversation history: truncation to a fixed budget and rolling summarization.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+MESSAGE_OVERHEAD = 4
+SUMMARY_PREFIX = "Короткий зміст попередньої розмови: "
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding("cl100k_base") if tiktoken else None
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens in a text using tiktoken when available, otherwise a conservative estimate of one token per
+    two UTF-8 bytes, which also holds for Cyrillic text, where a token covers fewer characters than in English.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text.encode("utf-8")) // 2 + 1
+
+
+def message_tokens(content: str) -> int:
+    """
+    Counts tokens of a single chat message including the per-message framing overhead.
+    """
+    return count_tokens(content) + MESSAGE_OVERHEAD
+
+
+@dataclass
+class TurnUsage:
+    """
+    Token accounting for a single conversation turn.
+    """
+    budget: int
+    prompt_tokens: int
+    history_tokens: int
+    kept_turns: int
+    dropped_turns: int
+    completion_prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+class ContextWindow:
+    """
+    Builds request payloads that keep the system prompt, the cached summary and the most recent turns
+    within a token budget.
+    """
+
+    def __init__(self, budget: int = 3000, summary_prompt: str | None = None, keep_recent: float = 0.5):
+        self.budget = budget
+        self.summary_prompt = summary_prompt
+        self.keep_recent = keep_recent
+
+    def build(self, conversation, message_text: str) -> tuple[list, TurnUsage]:
+        """
+        Returns the messages to send for a new user message together with the token accounting.
+        """
+        head = []
+        if conversation.prompt:
+            head.append({"role": "system", "content": conversation.prompt})
+        if conversation.summary:
+            head.append({"role": "system", "content": conversation.summary})
+        fixed = sum(message_tokens(message["content"]) for message in head) + message_tokens(message_text)
+
+        remaining = self.budget - fixed
+        kept = 0
+        for role, content in reversed(conversation.turns):
+            tokens = message_tokens(content)
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            kept += 1
+
+        turns = conversation.turns[len(conversation.turns) - kept:] if kept else []
+        messages = head + [{"role": role, "content": content} for role, content in turns]
+        messages.append({"role": "user", "content": message_text})
+        usage = TurnUsage(
+            budget=self.budget,
+            prompt_tokens=fixed,
+            history_tokens=self.budget - fixed - remaining,
+            kept_turns=kept,
+            dropped_turns=len(conversation.turns) - kept
+        )
+        return messages, usage
+
+    def needs_compaction(self, conversation) -> bool:
+        """
+        Checks whether the history outgrew the budget and older turns should be folded into the summary.
+        """
+        history = sum(message_tokens(content) for _, content in conversation.turns)
+        return history > self.budget
+
+    def split_for_compaction(self, conversation, fraction: float) -> int:
+        """
+        Returns how many of the oldest turns fall outside the given fraction of the budget.
+        """
+        remaining = int(self.budget * fraction)
+        kept = 0
+        for _, content in reversed(conversation.turns):
+            remaining -= message_tokens(content)
+            if remaining < 0:
+                break
+            kept += 1
+        return len(conversation.turns) - kept
+
+    def summary_request(self, conversation, count: int) -> list:
+        """
+        Builds the messages asking the model to fold the oldest turns into the running summary.
+        """
+        lines = [conversation.summary] if conversation.summary else []
+        lines.extend(f"{role}: {content}" for role, content in conversation.turns[:count])
+        return [
+            {"role": "system", "content": self.summary_prompt},
+            {"role": "user", "content": "\n\n".join(lines)}
+        ]
+
+    @staticmethod
+    def format_summary(summary: str) -> str:
+        """
+        Labels a generated summary so the model can tell it apart from the system prompt.
+        """
+        return SUMMARY_PREFIX + summary
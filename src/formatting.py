@@ -0,0 +1,201 @@
+"""
+Preparing GPT answers for Telegram: splitting long Markdown into messages and rendering it as HTML.
+"""
+import html
+import re
+
+MESSAGE_LIMIT = 4096
+FENCE = "```"
+CLOSING_FENCE = "\n" + FENCE
+
+_CODE_BLOCK = re.compile(r"```([\w+#.-]*)[^\n]*\n(.*?)\n?```", re.S)
+_INLINE_CODE = re.compile(r"`([^`\n]+)`")
+# Content patterns exclude "<" and ">", so a pair never spans a tag inserted by an earlier substitution.
+_LINK = re.compile(r"\[([^\]\n<>]+)\]\((https?://[^\s)<>]+)\)")
+_BOLD = re.compile(r"\*\*(?=[^\s<>])([^<>\n]+?)(?<=[^\s<>])\*\*")
+_ITALIC = re.compile(r"(?<![*\w])\*(?=[^\s*<>])([^<>\n]+?)(?<=[^\s*<>])\*(?![*\w])")
+_STRIKE = re.compile(r"~~(?=[^\s<>])([^<>\n]+?)(?<=[^\s<>])~~")
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$", re.M)
+# Where text may be split into segments, from the most to the least preferred.
+_BREAKS = (re.compile(r"(\n[ \t]*\n\s*)"), re.compile(r"(\n\s*)"), re.compile(r"(?<=[.!?…])(\s+)"), re.compile(r"(\s+)"))
+
+
+def text_length(text: str) -> int:
+    """
+    Length as Telegram counts it, in UTF-16 code units.
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _prefix_end(text: str, limit: int) -> int:
+    """
+    Returns the largest index such that text[:index] fits into limit UTF-16 code units.
+    """
+    if text_length(text) <= limit:
+        return len(text)
+    used = 0
+    for index, char in enumerate(text):
+        used += 2 if ord(char) > 0xFFFF else 1
+        if used > limit:
+            return index
+    return len(text)
+
+
+def _cut_point(window: str, code_opener: str | None) -> int:
+    """
+    Picks where to end a chunk within the window: the last paragraph break outside a code block, else the last
+    line break, else the last space, as long as the chunk keeps at least a quarter of the window.
+    """
+    minimum = len(window) // 4
+    paragraph = line = -1
+    position = 0
+    in_code = code_opener is not None
+    for row in window.splitlines(keepends=True):
+        end = position + len(row)
+        if row.lstrip().startswith(FENCE):
+            in_code = not in_code
+        if row.endswith("\n") and end < len(window):
+            line = end
+            if not in_code and window.startswith("\n", end):
+                paragraph = end
+        position = end
+    for candidate in (paragraph, line, window.rfind(" ") + 1):
+        if candidate > minimum:
+            return candidate
+    return len(window)
+
+
+def _open_fence(text: str, code_opener: str | None) -> str | None:
+    """
+    Returns the opening fence line if text, started inside code_opener's block, ends inside a code block.
+    """
+    for row in text.splitlines():
+        if row.lstrip().startswith(FENCE):
+            code_opener = None if code_opener is not None else row.strip()
+    return code_opener
+
+
+def split_markdown(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Splits Markdown into chunks of at most limit characters, preferring paragraph, then line, then word
+    boundaries. A code block that has to be split is closed at the end of one chunk and reopened, with its
+    language, at the start of the next, so every chunk renders on its own.
+    """
+    chunks = []
+    rest = text.rstrip().lstrip("\n")
+    code_opener = None
+    while rest:
+        head = f"{code_opener}\n" if code_opener else ""
+        if text_length(head + rest) <= limit:
+            chunks.append(head + rest)
+            break
+        budget = limit - text_length(head) - text_length(CLOSING_FENCE)
+        cut = _cut_point(rest[:_prefix_end(rest, budget)], code_opener)
+        piece, rest = rest[:cut].rstrip(), rest[cut:]
+        rest = rest.lstrip("\n")
+        next_opener = _open_fence(piece, code_opener)
+        chunks.append(head + piece + (CLOSING_FENCE if next_opener else ""))
+        code_opener = next_opener
+    return chunks
+
+
+def _emit(parts: list, separator: str, segment: str) -> None:
+    if parts:
+        parts.append(separator)
+    parts.append(segment)
+
+
+def _split_segments(text: str, limit: int, level: int, separator: str, parts: list) -> None:
+    if len(text) <= limit or level == len(_BREAKS):
+        for index, start in enumerate(range(0, len(text), limit)):
+            _emit(parts, separator if index == 0 else "", text[start:start + limit])
+        return
+    items = _BREAKS[level].split(text)
+    current = pending = None
+    for piece, gap in zip(items[::2], items[1::2] + [""]):
+        if current is not None and len(current) + len(pending) + len(piece) <= limit:
+            current += pending + piece
+        else:
+            if current is not None:
+                _emit(parts, separator, current)
+                separator = pending
+            if len(piece) <= limit:
+                current = piece
+            else:
+                _split_segments(piece, limit, level + 1, separator, parts)
+                current, separator = None, gap
+        pending = gap
+    if current is not None:
+        _emit(parts, separator, current)
+
+
+def split_segments(text: str, limit: int) -> list:
+    """
+    Splits text into segments of at most limit characters that can be processed separately, at paragraph
+    breaks where possible, else at line breaks, sentence ends or spaces. Returns segments and the separators
+    between them alternating, [segment, separator, segment, ...], so the processed segments can be joined back
+    in the original layout.
+    """
+    parts = []
+    text = text.strip()
+    if text:
+        _split_segments(text, limit, 0, "", parts)
+    return _fold_blank_segments(parts)
+
+
+def _fold_blank_segments(parts: list) -> list:
+    """
+    Merges empty or whitespace-only segments into the separators around them, so that every segment has text.
+    """
+    folded = []
+    gap = ""
+    for index, segment in enumerate(parts[::2]):
+        if index:
+            gap += parts[2 * index - 1]
+        if not segment.strip():
+            gap += segment
+            continue
+        if folded:
+            folded.append(gap)
+        else:
+            segment = gap + segment
+        folded.append(segment)
+        gap = ""
+    if folded and gap:
+        folded[-1] += gap
+    return folded
+
+
+def _render_inline(text: str) -> str:
+    parts = _INLINE_CODE.split(text)
+    rendered = []
+    for index, part in enumerate(parts):
+        if index % 2:
+            rendered.append(f"<code>{html.escape(part, quote=False)}</code>")
+            continue
+        part = html.escape(part, quote=False)
+        part = _HEADING.sub(r"<b>\1</b>", part)
+        part = _BOLD.sub(r"<b>\1</b>", part)
+        part = _ITALIC.sub(r"<i>\1</i>", part)
+        part = _STRIKE.sub(r"<s>\1</s>", part)
+        part = _LINK.sub(lambda match: f'<a href="{match[2].replace(chr(34), "&quot;")}">{match[1]}</a>', part)
+        rendered.append(part)
+    return "".join(rendered)
+
+
+def markdown_to_html(text: str) -> str:
+    """
+    Renders the Markdown GPT produces as Telegram HTML: code blocks, inline code, links, bold, italic,
+    strikethrough and headings. Everything else is escaped, and only complete pairs of markers become tags,
+    so the result is always balanced.
+    """
+    rendered = []
+    position = 0
+    for match in _CODE_BLOCK.finditer(text):
+        rendered.append(_render_inline(text[position:match.start()]))
+        language, code = match[1], html.escape(match[2], quote=False)
+        attribute = f' class="language-{language}"' if language else ""
+        rendered.append(f"<pre><code{attribute}>{code}</code></pre>")
+        position = match.end()
+    rendered.append(_render_inline(text[position:]))
+    return "".join(rendered)
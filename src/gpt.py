@@ -1,40 +1,215 @@
 """
 Module for interacting with OpenAI's GPT API.
 """
-from openai import OpenAI
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import openai
+from openai import AsyncOpenAI
 import httpx
 
+import metrics
+from profiles import DEFAULT_PROFILES
+from resilience import CircuitBreaker, CircuitOpenError, LatencySLO, RateLimitedError, RetryPolicy, hedged
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+def retry_after(error: Exception) -> float | None:
+    """
+    Extracts the Retry-After delay in seconds from a rate-limit response, if present.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class Endpoint:
+    """
+    One way of reaching the OpenAI API: a base URL and a proxy with their own client and circuit breaker.
+    """
+    base_url: str | None
+    proxy: str | None
+    client: AsyncOpenAI
+    breaker: CircuitBreaker
+
+    @property
+    def label(self) -> str:
+        """
+        Names the endpoint in metrics: its base URL and, when it goes through a proxy, the proxy's address.
+        """
+        label = self.base_url or "default"
+        if self.proxy:
+            label += f" via {urlsplit(self.proxy).netloc.rpartition('@')[2] or self.proxy}"
+        return label
+
 
 class ChatGPTService:
     """
     Service for managing chat interactions with OpenAI's ChatGPT.
     """
-    client: OpenAI = None
+    client: AsyncOpenAI = None
     message_list: list = None
 
-    def __init__(self, token):
+    def __init__(self, token, proxy: str | None = None, base_url: str | None = None,
+                 max_connections: int = 100, max_keepalive_connections: int = 20,
+                 timeout: float = 60.0, connect_timeout: float = 10.0, context_window=None, completion_cache=None,
+                 endpoints: list | None = None, retry_policy: RetryPolicy = None, hedge_delay: float | None = None,
+                 breaker_threshold: int = 5, breaker_reset_timeout: float = 30.0, profiles: dict | None = None,
+                 slo_window: int = 20, slo_miss_ratio: float = 0.25, slo_cooldown: float = 60.0):
         """
-        Initializes the ChatGPTService with an OpenAI API token and a proxy.
+        Initializes the ChatGPTService with an OpenAI API token and a pooled async HTTP client
+        for every (base_url, proxy) endpoint to fail over between, and the generation profile of every mode.
         """
-        self.client = OpenAI(
-            http_client=httpx.Client(proxy="http://18.199.183.77:49232"),
-            api_key=token
-        )
+        self.endpoints = []
+        for endpoint_url, endpoint_proxy in endpoints or [(base_url, proxy)]:
+            http_client = httpx.AsyncClient(
+                proxy=endpoint_proxy,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections
+                ),
+                timeout=httpx.Timeout(timeout, connect=connect_timeout)
+            )
+            client = AsyncOpenAI(
+                http_client=http_client,
+                api_key=token,
+                base_url=endpoint_url,
+                max_retries=0
+            )
+            breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+            self.endpoints.append(Endpoint(endpoint_url, endpoint_proxy, client, breaker))
+        self.client = self.endpoints[0].client
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.hedge_delay = hedge_delay
         self.message_list = []
+        self.context_window = context_window
+        self.completion_cache = completion_cache
+        self.profiles = profiles or DEFAULT_PROFILES
+        self.slos = {
+            mode: LatencySLO(profile.slo, slo_window, slo_miss_ratio, slo_cooldown)
+            for mode, profile in self.profiles.items() if profile.fallback and profile.slo > 0
+        }
+        self._compacting = {}
+
+    async def _attempt(self, endpoint: Endpoint, operation):
+        """
+        Runs one upstream attempt within the per-attempt deadline, feeding the endpoint's circuit breaker.
+        The breaker's probe slot is taken here, so only endpoints actually tried reserve it.
+        """
+        if not endpoint.breaker.allow():
+            raise CircuitOpenError("OpenAI endpoint is unavailable")
+        label = endpoint.label
+        started = time.perf_counter()
+        metrics.gpt_in_flight.inc(label)
+        error = None
+        try:
+            result = await asyncio.wait_for(operation(endpoint.client), self.retry_policy.attempt_timeout)
+        except RETRYABLE_ERRORS as e:
+            error = type(e).__name__
+            endpoint.breaker.record_failure()
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            endpoint.breaker.release()
+            metrics.gpt_in_flight.dec(label)
+            metrics.gpt_latency.observe(label, value=time.perf_counter() - started)
+            if error is not None:
+                metrics.gpt_errors.inc(label, error)
+            metrics.add_span("openai", label, started, error)
+        endpoint.breaker.record_success()
+        return result
+
+    async def _call(self, operation):
+        """
+        Calls the upstream with retries, backoff, failover between endpoints and optional hedging.
+        """
+        policy = self.retry_policy
+        last_error = None
+        for attempt in range(policy.max_attempts):
+            start = attempt % len(self.endpoints)
+            ordered = self.endpoints[start:] + self.endpoints[:start]
+            available = [endpoint for endpoint in ordered if endpoint.breaker.available]
+            if not available:
+                raise CircuitOpenError("OpenAI endpoints are unavailable") from last_error
+            try:
+                if self.hedge_delay is not None and len(available) > 1:
+                    return await hedged(
+                        [lambda endpoint=endpoint: self._attempt(endpoint, operation) for endpoint in available],
+                        self.hedge_delay
+                    )
+                return await self._attempt(available[0], operation)
+            except (*RETRYABLE_ERRORS, CircuitOpenError) as e:
+                last_error = e
+                logger.warning("Спроба %s запиту до OpenAI невдала: %r", attempt + 1, e)
+                if attempt + 1 < policy.max_attempts:
+                    await asyncio.sleep(policy.delay(attempt, retry_after(e)))
+        if isinstance(last_error, openai.RateLimitError):
+            raise RateLimitedError("OpenAI rate limit exceeded") from last_error
+        raise last_error
+
+    def completion_params(self, mode: str = "default", input_text: str = "") -> tuple:
+        """
+        Returns the request parameters from the mode's generation profile and the latency objective to report
+        to. While the primary model misses its objective, the fallback model is used and nothing is reported.
+        """
+        profile = self.profiles.get(mode) or self.profiles["default"]
+        slo = self.slos.get(mode)
+        if slo is not None and slo.missed:
+            return profile.params(profile.fallback, input_text), None
+        return profile.params(profile.model, input_text), slo
+
+    async def create_completion(self, messages: list, mode: str = "default", input_text: str = ""):
+        """
+        Sends the given messages to OpenAI with the mode's generation profile and returns the raw completion.
+        """
+        params, slo = self.completion_params(mode, input_text)
+        started = time.perf_counter()
+        try:
+            completion = await self._call(lambda client: client.chat.completions.create(messages=messages, **params))
+        except Exception:
+            if slo is not None:
+                slo.record_miss()
+            raise
+        elapsed = time.perf_counter() - started
+        if slo is not None:
+            slo.record(elapsed)
+        metrics.gpt_requests.observe(mode, params["model"], value=elapsed)
+        metrics.record_tokens(completion.usage, mode, params["model"])
+        return completion
+
+    async def complete(self, messages: list, mode: str = "default", input_text: str = "") -> str:
+        """
+        Sends the given messages to OpenAI and returns the AI's response without touching the history.
+        """
+        completion = await self.create_completion(messages, mode, input_text)
+        return completion.choices[0].message.content
 
-    async def send_message_list(self) -> str:
+    async def send_message_list(self, mode: str = "default") -> str:
         """
         Sends the current message list to OpenAI and returns the AI's response.
         """
-        completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=self.message_list,
-            max_tokens=3000,
-            temperature=0.9
-        )
-        message = completion.choices[0].message
-        self.message_list.append(message)
-        return message.content
+        messages = self.message_list
+        content = await self.complete(list(messages), mode, messages[-1]["content"] if messages else "")
+        messages.append({"role": "assistant", "content": content})
+        return content
 
     def set_prompt(self, prompt_text: str) -> None:
         """
@@ -50,11 +225,145 @@ class ChatGPTService:
         self.message_list.append({"role": "user", "content": message_text})
         return await self.send_message_list()
 
-    async def send_question(self, prompt_text: str, message_text: str) -> str:
+    async def send_question(self, prompt_text: str, message_text: str, cache: bool = False,
+                            mode: str = "default") -> str:
         """
         Sends a single question with a specific system prompt, clearing previous history.
+        With cache enabled, identical questions are answered from the completion cache.
         """
-        self.message_list.clear()
-        self.message_list.append({"role": "system", "content": prompt_text})
-        self.message_list.append({"role": "user", "content": message_text})
-        return await self.send_message_list()
+        self.message_list = [
+            {"role": "system", "content": prompt_text},
+            {"role": "user", "content": message_text}
+        ]
+        if not cache or self.completion_cache is None:
+            return await self.send_message_list(mode)
+        messages = self.message_list
+        key = self.completion_cache.key(messages, self.completion_params(mode, message_text)[0])
+        content = await self.completion_cache.get_or_compute(
+            key, lambda: self.complete(list(messages), mode, message_text)
+        )
+        messages.append({"role": "assistant", "content": content})
+        return content
+
+    async def stream_completion(self, messages: list, on_usage=None, mode: str = "default"):
+        """
+        Streams the AI's response to the given messages as text deltas, generated with the mode's profile.
+        The latency reported for the mode is the time until the first delta; failing before it counts as a miss.
+        """
+        params, slo = self.completion_params(mode)
+        started = time.perf_counter()
+        first = True
+        try:
+            stream = await self._call(lambda client: client.chat.completions.create(
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params
+            ))
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    metrics.record_tokens(chunk.usage, mode, params["model"])
+                    if on_usage is not None:
+                        on_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        elapsed = time.perf_counter() - started
+                        if slo is not None:
+                            slo.record(elapsed)
+                        metrics.gpt_requests.observe(mode, params["model"], value=elapsed)
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            if first and slo is not None:
+                slo.record_miss()
+            raise
+
+    async def chat(self, conversation, message_text: str, mode: str = "default") -> str:
+        """
+        Sends a user message within the given conversation and records both turns once the AI responds.
+        """
+        messages, usage = self._prepare_chat(conversation, message_text)
+        completion = await self.create_completion(messages, mode, message_text)
+        content = completion.choices[0].message.content
+        self._record_chat(conversation, message_text, content, usage, completion.usage)
+        return content
+
+    async def chat_stream(self, conversation, message_text: str, mode: str = "default"):
+        """
+        Streams the AI's reply within the given conversation, recording both turns once the stream completes.
+        """
+        messages, usage = self._prepare_chat(conversation, message_text)
+        parts = []
+        completion_usage = []
+        async for delta in self.stream_completion(messages, on_usage=completion_usage.append, mode=mode):
+            parts.append(delta)
+            yield delta
+        self._record_chat(
+            conversation, message_text, "".join(parts), usage, completion_usage[-1] if completion_usage else None
+        )
+
+    def _prepare_chat(self, conversation, message_text: str) -> tuple:
+        """
+        Builds the request messages for a conversation turn, within the token budget if one is configured.
+        """
+        if self.context_window is None:
+            messages = conversation.messages()
+            messages.append({"role": "user", "content": message_text})
+            return messages, None
+        return self.context_window.build(conversation, message_text)
+
+    def _record_chat(self, conversation, message_text: str, content: str, usage, completion_usage) -> None:
+        """
+        Stores a finished turn in the conversation and keeps its history within the budget.
+        """
+        conversation.add("user", message_text)
+        conversation.add("assistant", content)
+        if usage is None:
+            return
+        if completion_usage is not None:
+            usage.completion_prompt_tokens = completion_usage.prompt_tokens
+            usage.completion_tokens = completion_usage.completion_tokens
+        conversation.usage = usage
+        logger.debug("Використання токенів за хід: %s", usage)
+        if self.context_window.needs_compaction(conversation):
+            self._schedule_compaction(conversation)
+
+    def _schedule_compaction(self, conversation) -> None:
+        """
+        Shrinks an overgrown history: summarizes it in the background or simply drops the oldest turns.
+        """
+        window = self.context_window
+        if window.summary_prompt is None:
+            conversation.fold(window.split_for_compaction(conversation, 1.0), None)
+            return
+        if conversation in self._compacting:
+            return
+        task = asyncio.create_task(self._compact(conversation))
+        self._compacting[conversation] = task
+        task.add_done_callback(lambda _: self._compacting.pop(conversation, None))
+
+    async def _compact(self, conversation) -> None:
+        """
+        Folds the oldest turns of a conversation into its cached summary.
+        """
+        window = self.context_window
+        turns = conversation.turns
+        count = window.split_for_compaction(conversation, window.keep_recent)
+        if count <= 0:
+            return
+        try:
+            summary = await self.complete(window.summary_request(conversation, count), "summary")
+        except Exception as e:
+            logger.warning("Не вдалося стиснути історію розмови: %s", e)
+            if conversation.turns is turns:
+                conversation.fold(window.split_for_compaction(conversation, 1.0), None)
+            return
+        if conversation.turns is turns:
+            conversation.fold(count, window.format_summary(summary))
+
+    async def aclose(self) -> None:
+        """
+        Closes the underlying HTTP connection pool.
+        """
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
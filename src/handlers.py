@@ -1,105 +1,252 @@
 """
 Command and callback handlers for the Telegram bot.
 """
+import asyncio
 import logging
+import math
 from random import choice
 
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from config import CHATGPT_TOKEN
-from gpt import ChatGPTService
-from utils import (send_image, send_text, load_message, show_main_menu, load_prompt, send_text_buttons)
+from admission import AdmissionRejected
+from config import CACHED_MODES, COALESCE_MODES, TRANSLATOR_SEGMENT_LENGTH
+from formatting import split_segments
+from intents import Intent, IntentMatcher
+from resilience import CircuitOpenError, RateLimitedError
+from routing import CallbackRouter, callback_data
+from services import services
+from utils import (send_image, send_text, load_message, show_main_menu, load_prompt, send_text_buttons,
+                   send_streaming_text, send_answer, with_typing, build_keyboard)
 
-chatgpt_service = ChatGPTService(CHATGPT_TOKEN)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+PERSONALITIES = {
+    'talk_linus_torvalds': "Linus Torvalds (Linux, Git)🐧",
+    'talk_guido_van_rossum': "Guido van Rossum (Python)🐍",
+    'talk_mark_zuckerberg': "Mark Zuckerberg (Meta, Facebook)👤",
+    'talk_gandalf': "Gandalf (Grey Wanderer)🧙‍♂",
+    'talk_andriy_titov': "Андрій Тітов (Злий Жартівник)💀",
+}
+
+RECOMMENDATION_CATEGORIES = {"movies": "фільмів", "books": "книг", "music": "музики"}
+
+TRANSLATOR_LANGUAGES = {
+    "en": ("English 🇺🇸", "англійську"),
+    "uk": ("Українська 🇺🇦", "українську"),
+    "zh": ("Chinese 🇨🇳", "китайську"),
+    "la": ("Latin 🏛", "латинську"),
+    "tlh": ("Klingon 🖖", "клінгонську"),
+}
+
+MENU = callback_data("menu")
+
+MAIN_MENU = {
+    'start': 'Головне меню',
+    'random': 'Дізнатися випадковий факт',
+    'gpt': 'Запитати ChatGPT',
+    'talk': 'Діалог з відомою особистістю',
+    'translator': 'Перекладач',
+    'recommendation': 'Рекомендація від ChatGPT'
+}
+
+INTENT_MATCHER = IntentMatcher([
+    Intent("random", stems=("факт", "цікав", "випадков", "рандом", "random", "fact"), aliases=("random",)),
+    Intent("gpt", stems=("gpt", "гпт", "чат", "chat", "питанн", "запит", "дізна", "question", "ask"),
+           aliases=("gpt", "chatgpt")),
+    Intent("talk", stems=("розмов", "поговор", "говор", "спілку", "особист", "знаменит", "talk"),
+           aliases=("talk",)),
+    Intent("translator", stems=("переклад", "перекласт", "translat"), aliases=("translate", "translator")),
+    Intent("recommendation",
+           stems=("рекоменд", "порекоменд", "порад", "фільм", "книг", "музик", "recommend", "movie", "book", "music"),
+           aliases=("recommend", "recommendation")),
+])
+
+INTENT_ANNOUNCEMENTS = {
+    "random": "Схоже, ви цікавитесь випадковими фактами! Зараз покажу вам один...",
+    "gpt": "Схоже, у вас є питання! Переходимо до режиму спілкування з ChatGPT...",
+    "talk": "Схоже, ви хочете поговорити з відомою особистістю! Зараз покажу вам доступні варіанти...",
+    "translator": "Схоже, вам потрібен переклад! Відкриваю перекладач...",
+    "recommendation": "Схоже, ви шукаєте, що подивитися, почитати чи послухати! Зараз допоможу з вибором...",
+}
+
+REQUIRED_RESOURCES = {
+    "prompts": ["random", "gpt", "translator", "recommendation", "summary", *PERSONALITIES],
+    "messages": ["start", "recommendation"],
+    "images": ["start", "random", "gpt", "talk", "translator", "recommendation",
+               *PERSONALITIES, *RECOMMENDATION_CATEGORIES],
+}
+
+
+def error_text(error: Exception, default: str) -> str:
+    """
+    Picks the user-facing message for a failed GPT call.
+    """
+    if isinstance(error, CircuitOpenError):
+        return "ChatGPT тимчасово недоступний. Спробуйте, будь ласка, за хвилину."
+    if isinstance(error, AdmissionRejected):
+        if error.reason == "overloaded":
+            return "Бот зараз перевантажений. Спробуйте, будь ласка, за хвилину."
+        return f"Забагато запитів. Спробуйте знову через {math.ceil(error.retry_after)} с."
+    if isinstance(error, RateLimitedError):
+        return "Забагато запитів до ChatGPT. Спробуйте трохи пізніше."
+    return default
+
+
+def interrupted_text(error: Exception) -> str:
+    """
+    Picks the note that finishes a streamed answer which broke off midway.
+    """
+    return "⚠️ " + error_text(error, "Відповідь обірвалася. Спробуйте, будь ласка, ще раз.")
+
+
+async def admit(update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str) -> bool:
+    """
+    Applies admission control to a GPT request of the user in the mode. Tells the user when they are
+    limited, once per limited period, and returns whether the request may go ahead.
+    """
+    try:
+        services.admission.check(mode, update.effective_user.id)
+    except AdmissionRejected as e:
+        logger.warning("Запит користувача %s у режимі %s відхилено: %s", update.effective_user.id, mode, e)
+        if e.notify:
+            await send_text(update, context, error_text(e, ""))
+        return False
+    return True
+
+
+def update_priority(update: object) -> str:
+    """
+    Classifies an update for the update processor: "gpt" for updates that wait for a ChatGPT answer
+    (free-text messages, /random and its buttons), "interactive" for navigation that should never wait behind them.
+    """
+    if not isinstance(update, Update):
+        return "interactive"
+    if update.callback_query is not None:
+        target = callbacks.resolve(update.callback_query.data or "")
+        return "gpt" if target is not None and target[0] in GPT_ROUTES else "interactive"
+    message = update.message
+    if message is None or not message.text:
+        return "interactive"
+    if message.text.startswith("/"):
+        command = message.text[1:].partition(" ")[0].partition("@")[0]
+        return "gpt" if command in GPT_COMMANDS else "interactive"
+    return "gpt"
+
+
+def leave_mode(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Forgets the user's current mode and cancels the chat's GPT requests that are still running or queued,
+    since their answers would arrive in a mode the user has left.
+    """
+    context.user_data.clear()
+    cancel_pending = getattr(context.application.update_processor, "cancel_pending", None)
+    if cancel_pending is not None:
+        cancelled = cancel_pending(update.effective_chat.id)
+        if cancelled:
+            logger.info("Скасовано %s запитів до ChatGPT користувача %s", cancelled, update.effective_user.id)
+
+
+def coalesce(update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str, message_text: str) -> str:
+    """
+    Joins the text messages the user sent while the previous one was being answered into one request.
+    """
+    take_queued_texts = getattr(context.application.update_processor, "take_queued_texts", None)
+    if mode not in COALESCE_MODES or take_queued_texts is None:
+        return message_text
+    texts = take_queued_texts(update.effective_chat.id)
+    if texts:
+        logger.info("Об'єднано %s повідомлень користувача %s", len(texts) + 1, update.effective_user.id)
+    return "\n".join([message_text, *texts])
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handles the /start command. Displays the welcome message and main menu.
+    Handles the /start command. Displays the welcome message and main menu; the menu is set up
+    while the greeting is being sent, and only if the chat does not have the current one yet.
     """
-    logger.info(f"Користувач {update.effective_user.id} запустив бот")
-    await send_image(update, context, "start")
-    await send_text(update, context, load_message("start"))
-    await show_main_menu(
-        update,
-        context,
-        {
-            'start': 'Головне меню',
-            'random': 'Дізнатися випадковий факт',
-            'gpt': 'Запитати ChatGPT',
-            'talk': 'Діалог з відомою особистістю',
-            'translator': 'Перекладач',
-            'recommendation': 'Рекомендація від ChatGPT'
-        }
-    )
+    logger.info("Користувач %s запустив бот", update.effective_user.id)
 
+    async def greet():
+        await send_image(update, context, "start")
+        await send_text(update, context, load_message("start"))
 
-async def random(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.gather(greet(), show_main_menu(update, context, MAIN_MENU, services.menus))
+
+
+async def produce_random_fact() -> str:
     """
-    Handles the /random command. Fetches and displays a random fact using GPT.
+    Generates a new random fact using GPT.
     """
-    logger.info(f"Користувач {update.effective_user.id} обрав режим випадкового факту")
-    await send_image(update, context, "random")
-    message_to_delete = await send_text(update, context, "Шукаю випадковий факт ...")
-    try:
-        prompt = load_prompt("random")
-        fact = await chatgpt_service.send_question(
-            prompt_text=prompt,
-            message_text="Розкажи про випадковий факт"
-        )
-        buttons = {
-            'random': '💡 Хочу ще один факт',
-            'start': '⬅️ Повернутись у головне меню'
-        }
-        await send_text_buttons(update, context, fact, buttons)
-    except Exception as e:
-        logger.error(f"Помилка в обробнику /random: {e}")
-        await send_text(update, context, "Помилка при отриманні випадкового факту.")
-    finally:
-        await context.bot.delete_message(
-            chat_id=update.effective_chat.id,
-            message_id=message_to_delete.message_id
+    async with services.admission.slot():
+        return await services.chatgpt.send_question(
+            prompt_text=load_prompt("random"),
+            message_text="Розкажи про випадковий факт",
+            mode="random"
         )
 
 
-async def random_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+def recommendation_question(category: str, genre: str) -> str:
+    """
+    Builds the recommendation request for the category and genre.
+    """
+    return f"Порекомендуй {category} у жанрі {genre}. Дай інший варіант, ніж раніше."
+
+
+def recommendation_producer(category: str, genre: str):
     """
-    Handles callback queries for the random fact feature.
+    Returns a coroutine function that generates a fresh recommendation for the category and genre.
     """
-    query = update.callback_query
-    await query.answer()
-    data = query.data
-    logger.info(f"Користувач {update.effective_user.id} натиснув кнопку випадкового факту: {data}")
-    if data == 'random':
-        await random(update, context)
-    elif data == 'start':
-        await start(update, context)
+    async def produce() -> str:
+        async with services.admission.slot():
+            return await services.chatgpt.send_question(
+                load_prompt("recommendation"), recommendation_question(category, genre), mode="recommendation"
+            )
+    return produce
+
+
+async def random(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handles the /random command. Fetches and displays a random fact using GPT,
+    preferring one prefetched in the background. A fact that has to be generated is requested
+    while the image is being sent, with the typing status shown instead of a placeholder message.
+    """
+    logger.info("Користувач %s обрав режим випадкового факту", update.effective_user.id)
+    if not await admit(update, context, "random"):
+        return
+    fact = services.prefetch_pool.pop("random", update.effective_user.id, produce_random_fact)
+    try:
+        if fact is None:
+            _, fact = await asyncio.gather(
+                send_image(update, context, "random"),
+                with_typing(update, context,
+                            services.prefetch_pool.generate(update.effective_user.id, produce_random_fact))
+            )
+        else:
+            await send_image(update, context, "random")
+        buttons = {
+            callback_data("random", "more"): '💡 Хочу ще один факт',
+            MENU: '⬅️ Повернутись у головне меню'
+        }
+        await send_answer(update, context, fact, buttons)
+    except Exception as e:
+        logger.error("Помилка в обробнику /random: %s", e)
+        await send_text(update, context, error_text(e, "Помилка при отриманні випадкового факту."))
 
 
 async def gpt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles the /gpt command. Initiates ChatGPT conversation mode.
     """
-    logger.info(f"Користувач {update.effective_user.id} вибрав режим GPT")
-    context.user_data.clear()
+    logger.info("Користувач %s вибрав режим GPT", update.effective_user.id)
+    leave_mode(update, context)
+    context.user_data["conversation_state"] = "gpt"
+    services.sessions.reset(update.effective_chat.id, load_prompt("gpt"))
     await send_image(update, context, "gpt")
-    chatgpt_service.set_prompt(load_prompt("gpt"))
-    buttons = {'start': '⬅️ Повернутись у головне меню'}
+    buttons = {MENU: '⬅️ Повернутись у головне меню'}
     await send_text_buttons(update, context, "Задайте питання ...", buttons)
 
-    context.user_data["conversation_state"] = "gpt"
-
 
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -107,72 +254,59 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     message_text = update.message.text
     conversation_state = context.user_data.get("conversation_state")
-    logger.info(f"Користувач {update.effective_user.id} надіслав повідомлення у стані {conversation_state}: {message_text[:50]}...")
+    logger.info("Користувач %s надіслав повідомлення у стані %s: %.50s...",
+                update.effective_user.id, conversation_state, message_text)
     if conversation_state == "gpt":
-        waiting_message = await send_text(update, context, "...")
+        if not await admit(update, context, "gpt"):
+            return
+        message_text = coalesce(update, context, "gpt", message_text)
         try:
-            response = await chatgpt_service.add_message(message_text)
+            conversation = await services.sessions.fetch(update.effective_chat.id, load_prompt("gpt"))
             buttons = {
-                "start": "⬅️ Повернутись у головне меню"
+                MENU: "⬅️ Повернутись у головне меню"
             }
-            await send_text_buttons(update, context, response, buttons)
+            async with services.admission.slot():
+                await send_streaming_text(
+                    update, context, services.chatgpt.chat_stream(conversation, message_text, mode="gpt"), buttons,
+                    failure=interrupted_text
+                )
         except Exception as e:
-            logger.error(f"Помилка при отриманні відповіді від ChatGPT: {e}")
-            await send_text(update, context, "Виникла помилка при обробці вашого повідомлення.")
-        finally:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id,
-                message_id=waiting_message.message_id
-            )
+            logger.error("Помилка при отриманні відповіді від ChatGPT: %s", e)
+            await send_text(update, context, error_text(e, "Виникла помилка при обробці вашого повідомлення."))
     elif conversation_state == "talk":
         personality = context.user_data.get("selected_personality")
         if personality:
-            prompt = load_prompt(personality)
-            chatgpt_service.set_prompt(prompt)
+            conversation = await services.sessions.fetch(update.effective_chat.id, load_prompt(personality))
         else:
             await send_text(update, context, "Спочатку оберіть особистість для розмови!")
             return
-        waiting_message = await send_text(update, context, "...")
+        if not await admit(update, context, "talk"):
+            return
+        message_text = coalesce(update, context, "talk", message_text)
         try:
-            response = await chatgpt_service.add_message(message_text)
-            buttons = {"start": "⬅️ Повернутись у головне меню"}
+            buttons = {MENU: "⬅️ Повернутись у головне меню"}
             personality_name = personality.replace("talk_", "").replace("_", " ").title()
-            await send_text_buttons(update, context, f"{personality_name}: {response}", buttons)
+            async with services.admission.slot():
+                await send_streaming_text(
+                    update,
+                    context,
+                    services.chatgpt.chat_stream(conversation, message_text, mode="talk"),
+                    buttons,
+                    prefix=f"{personality_name}: ",
+                    failure=interrupted_text
+                )
         except Exception as e:
-            logger.error(f"Помилка при отриманні відповіді від ChatGPT: {e}")
-            await send_text(update, context, "Виникла помилка при отриманні відповіді!")
-            await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=waiting_message.message_id)
-        finally:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id,
-                message_id=waiting_message.message_id
-            )
+            logger.error("Помилка при отриманні відповіді від ChatGPT: %s", e)
+            await send_text(update, context, error_text(e, "Виникла помилка при отриманні відповіді!"))
     elif conversation_state == "translator":
-        target_lang = context.user_data.get("translator_lang")
-        if not target_lang:
+        codes = selected_languages(context.user_data)
+        if not codes:
             await send_text(update, context, "Будь ласка, спочатку оберіть мову для перекладу.")
             return
-
-        waiting_message = await send_text(update, context, "Перекладаю...")
-        try:
-            prompt_template = load_prompt("translator")
-            prompt = prompt_template.format(target_lang=target_lang)
-            translation = await chatgpt_service.send_question(prompt, message_text)
-
-            buttons = {
-                "translator_en": "English 🇺🇸",
-                "translator_uk": "Українська 🇺🇦",
-                "translator_zh": "Chinese 🇨🇳",
-                "translator_la": "Latin 🏛",
-                "translator_tlh": "Klingon 🖖",
-                "start": "⬅️ Повернутись у головне меню"
-            }
-            await send_text_buttons(update, context, translation, buttons)
-        except Exception as e:
-            logger.error(f"Error in translator: {e}")
-            await send_text(update, context, "Виникла помилка при перекладі.")
-        finally:
-            await context.bot.delete_message(update.effective_chat.id, waiting_message.message_id)
+        if not await admit(update, context, "translator"):
+            return
+        message_text = coalesce(update, context, "translator", message_text)
+        await send_translations(update, context, message_text, codes)
 
     elif conversation_state == "recommendation":
         context.user_data["genre"] = message_text
@@ -189,111 +323,70 @@ async def talk(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles the /talk command. Displays the list of available celebrities to chat with.
     """
-    logger.info(f"Користувач {update.effective_user.id} відкрив меню вибору особистостей")
-    context.user_data.clear()
+    logger.info("Користувач %s відкрив меню вибору особистостей", update.effective_user.id)
+    leave_mode(update, context)
     await send_image(update, context, "talk")
     personalities = {
-        'talk_linus_torvalds': "Linus Torvalds (Linux, Git)🐧",
-        'talk_guido_van_rossum': "Guido van Rossum (Python)🐍",
-        'talk_mark_zuckerberg': "Mark Zuckerberg (Meta, Facebook)👤",
-        'talk_gandalf': "Gandalf (Grey Wanderer)🧙‍♂",
-        'talk_andriy_titov': "Андрій Тітов (Злий Жартівник)💀",
-        'start': "⬅️ Повернутись у головне меню",
+        **{callback_data("talk", "pick", key.removeprefix("talk_")): name for key, name in PERSONALITIES.items()},
+        MENU: "⬅️ Повернутись у головне меню",
     }
     await send_text_buttons(update, context, "Оберіть особистість для спілкування ...", personalities)
 
 
-async def gpt_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handles callback queries for the GPT mode.
+    Handles the "back to main menu" button: leaves the current mode and shows the main menu.
     """
-    query = update.callback_query
-    await query.answer()
-    data = query.data
-    logger.info(f"Користувач {update.effective_user.id} натиснув кнопку у режимі GPT: {data}")
-    if data == "start":
-        context.user_data.clear()
-        await start(update, context)
+    leave_mode(update, context)
+    await start(update, context)
 
 
-async def talk_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def choose_personality(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str):
     """
-    Handles callback queries for the celebrity chat mode (talk).
+    Handles the choice of a celebrity in the talk mode and starts a new conversation with them.
     """
-    query = update.callback_query
-    await query.answer()
-    data = query.data
-    logger.info(f"Користувач {update.effective_user.id} натиснув кнопку у режимі Talk: {data}")
-    if data == "start":
-        context.user_data.pop("conversation_state", None)
-        context.user_data.pop("selected_personality", None)
-        await start(update, context)
+    personality = f"talk_{name}"
+    if personality not in PERSONALITIES:
         return
-    if data == "talk":
-        await talk(update, context)
-        return
-    if data.startswith("talk_"):
-        context.user_data.clear()
-        context.user_data["selected_personality"] = data
-        context.user_data["conversation_state"] = "talk"
-        prompt = load_prompt(data)
-        chatgpt_service.set_prompt(prompt)
-        personality_name = data.replace("talk_", "").replace("_", " ").title()
-        await send_image(update, context, data)
-        buttons = {
-            'talk': "⬅️ Обрати іншу особистість",
-            'start': "⬅️ Повернутись у головне меню"
-        }
-        await send_text_buttons(
-            update,
-            context,
-            f"Hello, I`m {personality_name}."
-            f"\nI heard you wanted to ask me something. "
-            f"\nYou can ask questions in your native language.",
-            buttons
-        )
+    leave_mode(update, context)
+    context.user_data["selected_personality"] = personality
+    context.user_data["conversation_state"] = "talk"
+    services.sessions.reset(update.effective_chat.id, load_prompt(personality))
+    personality_name = name.replace("_", " ").title()
+    await send_image(update, context, personality)
+    buttons = {
+        callback_data("talk", "list"): "⬅️ Обрати іншу особистість",
+        MENU: "⬅️ Повернутись у головне меню"
+    }
+    await send_text_buttons(
+        update,
+        context,
+        f"Hello, I`m {personality_name}."
+        f"\nI heard you wanted to ask me something. "
+        f"\nYou can ask questions in your native language.",
+        buttons
+    )
 
 
 async def inter_random_input(update: Update, context: ContextTypes.DEFAULT_TYPE, message_text):
     """
     Analyzes user intent to automatically switch modes based on message content.
     """
-    message_text_lower = message_text.lower()
-    logger.info(f"Аналіз інтенту для повідомлення: {message_text_lower[:30]}...")
-    if any(keyword in message_text_lower for keyword in ['факт', 'цікав', 'random', 'випадков']):
-        await send_text(
-            update,
-            context,
-            text="Схоже, ви цікавитесь випадковими фактами! Зараз покажу вам один..."
-        )
-        await random(update, context)
-        return True
-
-    elif any(keyword in message_text_lower for keyword in ['gpt', 'чат', 'питання', 'запита', 'дізнатися']):
-        await send_text(
-            update,
-            context,
-            text="Схоже, у вас є питання! Переходимо до режиму спілкування з ChatGPT..."
-        )
-        await gpt(update, context)
-        return True
-
-    elif any(keyword in message_text_lower for keyword in ['розмов', 'говори', 'спілкува', 'особист', 'talk']):
-        await send_text(
-            update,
-            context,
-            text="Схоже, ви хочете поговорити з відомою особистістю! Зараз покажу вам доступні варіанти..."
-        )
-        await talk(update, context)
-        return True
-    return False
+    match = INTENT_MATCHER.classify(message_text)
+    logger.info("Аналіз інтенту для повідомлення: %.30s... -> %s", message_text,
+                f"{match.name} ({match.score:.2f})" if match else "немає")
+    if match is None:
+        return False
+    await send_text(update, context, text=INTENT_ANNOUNCEMENTS[match.name])
+    await INTENT_ROUTES[match.name](update, context)
+    return True
 
 
 async def show_funny_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Sends a funny AI-generated response when the user's intent is unclear.
     """
-    logger.info(f"Користувач {update.effective_user.id} надіслав невідому команду, надсилаю жартівливу відповідь")
+    logger.info("Користувач %s надіслав невідому команду, надсилаю жартівливу відповідь", update.effective_user.id)
     funny_responses = [
         "Хмм... Цікаво, але я не зрозумів, що саме ви хочете. Може спробуєте одну з команд з меню?",
         "Дуже цікаве повідомлення! Але мені потрібні чіткіші інструкції. Ось доступні команди:",
@@ -319,118 +412,217 @@ async def translator(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles the /translator command. Displays language selection for translation.
     """
-    logger.info(f"Користувач {update.effective_user.id} відкрив режим перекладача")
-    context.user_data.clear()
+    logger.info("Користувач %s відкрив режим перекладача", update.effective_user.id)
+    leave_mode(update, context)
     context.user_data["conversation_state"] = "translator"
     await send_image(update, context, "translator")
 
+    await send_text_buttons(
+        update, context, "Оберіть одну або кілька мов, на які потрібно перекласти текст, і надсилайте текст:",
+        language_buttons()
+    )
+
+
+def language_buttons(selected: list = ()) -> dict:
+    """
+    Buttons for choosing the target languages of the translator, the selected ones marked, plus the way back
+    to the main menu.
+    """
     buttons = {
-        "translator_en": "English 🇺🇸",
-        "translator_uk": "Українська 🇺🇦",
-        "translator_zh": "Chinese 🇨🇳",
-        "translator_la": "Latin 🏛",
-        "translator_tlh": "Klingon 🖖",
-        "start": "⬅️ Повернутись у головне меню"
+        callback_data("translator", "lang", code): f"✅ {label}" if code in selected else label
+        for code, (label, _) in TRANSLATOR_LANGUAGES.items()
     }
-    await send_text_buttons(update, context, "Оберіть мову, на яку потрібно перекласти текст:", buttons)
-
-
-async def translator_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Handles callback queries for the translator mode.
-    """
-    query = update.callback_query
-    await query.answer()
-    data = query.data
-    logger.info(f"Користувач {update.effective_user.id} вибрав мову або дію у перекладачі: {data}")
-
-    if data == "start":
-        await start(update, context)
-    elif data == "translator":
-        await translator(update, context)
-    elif data.startswith("translator_"):
-        lang_code = data.replace("translator_", "")
-        langs = {
-            "en": "англійську",
-            "uk": "українську",
-            "zh": "китайську",
-            "la": "латинську",
-            "tlh": "клінгонську"
-        }
-        context.user_data["translator_lang"] = langs.get(lang_code, lang_code)
-        await send_text(update, context, f"Вибрано мову: {context.user_data['translator_lang']}. Надсилайте текст.")
+    buttons[MENU] = "⬅️ Повернутись у головне меню"
+    return buttons
+
+
+def selected_languages(user_data: dict) -> list:
+    """
+    Returns the codes of the translator's target languages in the order the user selected them.
+    """
+    codes = user_data.get("translator_langs")
+    if codes is None and "translator_lang" in user_data:  # state saved when only one language could be chosen
+        codes = [code for code, (_, name) in TRANSLATOR_LANGUAGES.items() if name == user_data["translator_lang"]]
+    return [code for code in codes or [] if code in TRANSLATOR_LANGUAGES]
+
+
+async def choose_language(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    """
+    Handles a language button in the translator mode: adds the language to the target languages or removes
+    it, and marks the selection on the keyboard the button belongs to.
+    """
+    if code not in TRANSLATOR_LANGUAGES:
+        return
+    codes = selected_languages(context.user_data)
+    codes = [selected for selected in codes if selected != code] if code in codes else [*codes, code]
+    context.user_data.pop("translator_lang", None)
+    context.user_data["translator_langs"] = codes
+    try:
+        await update.callback_query.edit_message_reply_markup(reply_markup=build_keyboard(language_buttons(codes)))
+    except BadRequest as e:
+        logger.warning("Не вдалося оновити вибір мов для %s: %s", update.effective_user.id, e)
+
+
+async def translate(text: str, target_lang: str) -> str:
+    """
+    Translates the text into the language. Long text is split into segments that are translated concurrently
+    and joined back in the original order and layout.
+    """
+    prompt = load_prompt("translator").format(target_lang=target_lang)
+    parts = split_segments(text, TRANSLATOR_SEGMENT_LENGTH)
+
+    async def translate_segment(segment: str) -> str:
+        async with services.admission.slot():
+            return await services.chatgpt.send_question(
+                prompt, segment, cache="translator" in CACHED_MODES, mode="translator"
+            )
+
+    parts[::2] = await asyncio.gather(*(translate_segment(segment) for segment in parts[::2]))
+    return "".join(parts)
+
+
+async def send_translations(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, codes: list):
+    """
+    Translates the text into all target languages concurrently and sends every translation as soon as it is
+    ready, headed by its language when there are several; the language buttons go on the last one.
+    Translations still running when the handler is cancelled are cancelled with it.
+    """
+    async def translate_into(code: str) -> tuple:
+        label, name = TRANSLATOR_LANGUAGES[code]
+        try:
+            return label, await translate(text, name)
+        except Exception as e:
+            logger.error("Error in translator: %s", e)
+            return label, error_text(e, "Виникла помилка при перекладі.")
+
+    tasks = [asyncio.ensure_future(translate_into(code)) for code in codes]
+    try:
+        for index, result in enumerate(asyncio.as_completed(tasks)):
+            label, translation = await with_typing(update, context, result)
+            if len(codes) > 1:
+                translation = f"**{label}**\n\n{translation}"
+            buttons = language_buttons(codes) if index == len(codes) - 1 else None
+            await send_answer(update, context, translation, buttons)
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 async def recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles the /recommendation command. Displays categories for ChatGPT recommendations.
     """
-    logger.info(f"Користувач {update.effective_user.id} відкрив режим рекомендацій")
-    context.user_data.clear()
+    logger.info("Користувач %s відкрив режим рекомендацій", update.effective_user.id)
+    leave_mode(update, context)
     context.user_data["conversation_state"] = "recommendation"
     await send_image(update, context, "recommendation")
     buttons = {
-        "rec_movies": "Фільми 🎬",
-        "rec_books": "Книги 📚",
-        "rec_music": "Музика 🎵",
-        "start": "⬅️ Повернутись у головне меню"
+        callback_data("rec", "category", "movies"): "Фільми 🎬",
+        callback_data("rec", "category", "books"): "Книги 📚",
+        callback_data("rec", "category", "music"): "Музика 🎵",
+        MENU: "⬅️ Повернутись у головне меню"
     }
     await send_text_buttons(update, context, load_message("recommendation"), buttons)
 
 
-async def recommendation_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def choose_category(update: Update, context: ContextTypes.DEFAULT_TYPE, category: str):
     """
-    Handles callback queries for the recommendation mode.
+    Handles the choice of a recommendation category and asks for the genre.
     """
-    query = update.callback_query
-    await query.answer()
-    data = query.data
-    logger.info(f"Користувач {update.effective_user.id} натиснув кнопку у рекомендаціях: {data}")
+    if category not in RECOMMENDATION_CATEGORIES:
+        return
+    context.user_data["image_name"] = category
+    context.user_data["category"] = RECOMMENDATION_CATEGORIES[category]
+    await send_image(update, context, category)
+    buttons = {callback_data("rec", "back"): '⬅️ Обрати іншу категорію'}
+    await send_text_buttons(
+        update,
+        context,
+        f"Який жанр {context.user_data['category']} вам подобається?",
+        buttons
+    )
 
-    if data == "start":
-        await start(update, context)
-    elif data.startswith("rec_"):
-        category = data.replace("rec_", "")
-        context.user_data["image_name"] = category 
-        
-        categories = {"movies": "фільмів", "books": "книг", "music": "музики"}
-        context.user_data["category"] = categories.get(category)
 
-        await send_image(update, context, category)
-        buttons = {'recommendation_back': '⬅️ Обрати іншу категорію'}
-        await send_text_buttons(
-            update,
-            context,
-            f"Який жанр {context.user_data['category']} вам подобається?",
-            buttons
-        )
-    elif data == "recommendation_back":
-        await recommendation(update, context)
-    elif data == "next_recommendation":
-        await generate_recommendation(update, context)
+async def next_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handles the "don't like it" button: generates another recommendation for the same genre.
+    """
+    await generate_recommendation(update, context, fresh=True)
 
 
-async def generate_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def generate_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE, fresh: bool = False):
     """
     Generates a personalized recommendation using GPT based on selected category and genre.
+    The first recommendation for a genre may come from the completion cache; fresh ones are taken
+    from the prefetch pool, which only starts warming on the first "next" tap, so a user who is happy
+    with the first answer costs a single completion. While waiting, the chat shows the typing status.
     """
     category = context.user_data.get("category")
     genre = context.user_data.get("genre")
-    logger.info(f"Генерація рекомендації для {update.effective_user.id}: {category}, жанр: {genre}")
+    logger.info("Генерація рекомендації для %s: %s, жанр: %s", update.effective_user.id, category, genre)
+    if not await admit(update, context, "recommendation"):
+        return
 
-    waiting_message = await send_text(update, context, "Думаю над рекомендацією...")
+    pool_key = ("recommendation", category, genre)
+    produce = recommendation_producer(category, genre)
+    response = services.prefetch_pool.pop(pool_key, update.effective_user.id, produce) if fresh else None
     try:
-        prompt = load_prompt("recommendation")
-        question = f"Порекомендуй {category} у жанрі {genre}. Дай інший варіант, ніж раніше."
-        response = await chatgpt_service.send_question(prompt, question)
+        if fresh and response is None:
+            response = await with_typing(
+                update, context, services.prefetch_pool.generate(update.effective_user.id, produce)
+            )
+        elif not fresh:
+            async with services.admission.slot():
+                response = await with_typing(update, context, services.chatgpt.send_question(
+                    load_prompt("recommendation"),
+                    recommendation_question(category, genre),
+                    cache="recommendation" in CACHED_MODES,
+                    mode="recommendation"
+                ))
 
         buttons = {
-            "next_recommendation": "Не подобається 👎",
-            "start": "⬅️ Повернутись у головне меню"
+            callback_data("rec", "next"): "Не подобається 👎",
+            MENU: "⬅️ Повернутись у головне меню"
         }
-        await send_text_buttons(update, context, response, buttons)
+        await send_answer(update, context, response, buttons)
     except Exception as e:
-        logger.error(f"Error in recommendation: {e}")
-        await send_text(update, context, "Помилка при створенні рекомендації.")
-    finally:
-        await context.bot.delete_message(update.effective_chat.id, waiting_message.message_id)
+        logger.error("Error in recommendation: %s", e)
+        await send_text(update, context, error_text(e, "Помилка при створенні рекомендації."))
+
+
+INTENT_ROUTES = {
+    "random": random,
+    "gpt": gpt,
+    "talk": talk,
+    "translator": translator,
+    "recommendation": recommendation,
+}
+
+CALLBACK_ROUTES = {
+    ("menu", ""): back_to_menu,
+    ("random", "more"): random,
+    ("talk", "list"): talk,
+    ("talk", "pick"): choose_personality,
+    ("translator", "lang"): choose_language,
+    ("rec", "category"): choose_category,
+    ("rec", "back"): recommendation,
+    ("rec", "next"): next_recommendation,
+}
+
+# Callback data of buttons sent before the namespace:action scheme, still present in old messages.
+LEGACY_CALLBACKS = {
+    "start": MENU,
+    "random": callback_data("random", "more"),
+    "talk": callback_data("talk", "list"),
+    "next_recommendation": callback_data("rec", "next"),
+    "recommendation_back": callback_data("rec", "back"),
+    **{key: callback_data("talk", "pick", key.removeprefix("talk_")) for key in PERSONALITIES},
+    **{f"translator_{code}": callback_data("translator", "lang", code) for code in TRANSLATOR_LANGUAGES},
+    **{f"rec_{category}": callback_data("rec", "category", category) for category in RECOMMENDATION_CATEGORIES},
+}
+
+callbacks = CallbackRouter(CALLBACK_ROUTES, LEGACY_CALLBACKS)
+
+# Commands and button routes whose handlers wait for ChatGPT; the update processor runs them in the GPT lane.
+GPT_COMMANDS = {"random"}
+GPT_ROUTES = {"random:more", "rec:next"}
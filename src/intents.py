@@ -0,0 +1,100 @@
+"""
+Routing of free-text messages to bot modes by keywords, without calling GPT.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+WORD = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    A mode a free-text message can be routed to. Stems match any word starting with them ("переклад" matches
+    "перекладіть"), aliases match whole words only and weigh more.
+    """
+    name: str
+    stems: tuple = ()
+    aliases: tuple = ()
+    weight: float = 1.0
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    name: str
+    score: float
+    fuzzy: bool = False
+
+
+class IntentMatcher:
+    """
+    Compiles the stems of all intents into one regular expression and scores every intent by the words
+    of a message that match it. Words that match nothing exactly are compared with stems of at least
+    fuzzy_min_length letters allowing one typo (a missing, extra, wrong or swapped letter), which weighs
+    fuzzy_weight of an exact match. The best intent wins if its score reaches the threshold; ties go to
+    the intent declared first.
+    """
+
+    def __init__(self, intents: list, threshold: float = 0.75, alias_weight: float = 2.0, fuzzy_weight: float = 0.8,
+                 fuzzy_min_length: int = 5):
+        self.intents = list(intents)
+        self.threshold = threshold
+        self.alias_weight = alias_weight
+        self.fuzzy_weight = fuzzy_weight
+        self.fuzzy_min_length = fuzzy_min_length
+        groups = []
+        for index, intent in enumerate(self.intents):
+            stems = sorted({stem.lower() for stem in intent.stems}, key=len, reverse=True)
+            if stems:
+                groups.append(f"(?P<i{index}>{'|'.join(map(re.escape, stems))})")
+        self._pattern = re.compile(rf"(?<!\w)(?:{'|'.join(groups)})\w*") if groups else None
+        self._aliases = {alias.lower(): index for index, intent in enumerate(self.intents) for alias in intent.aliases}
+        self._variants = {}
+        for index, intent in enumerate(self.intents):
+            for stem in intent.stems:
+                stem = stem.lower()
+                if len(stem) >= fuzzy_min_length:
+                    for variant in {stem, *(stem[:i] + stem[i + 1:] for i in range(len(stem)))}:
+                        self._variants.setdefault((variant, len(stem)), set()).add(index)
+        self._lengths = sorted({length for _, length in self._variants})
+        self._fuzzy = lru_cache(maxsize=65536)(self._fuzzy_word)
+
+    def _fuzzy_word(self, word: str) -> frozenset:
+        """
+        Returns the intents with a stem within one typo of the beginning of the word.
+        """
+        found = set()
+        for length in self._lengths:
+            if len(word) < length - 1:
+                break
+            for prefix in {word[:length - 1], word[:length], word[:length + 1]}:
+                for key in (prefix, *(prefix[:i] + prefix[i + 1:] for i in range(len(prefix)))):
+                    found |= self._variants.get((key, length), set())
+        return frozenset(found)
+
+    def classify(self, text: str) -> IntentMatch | None:
+        """
+        Returns the best matching intent for the message, or None if no intent reaches the threshold.
+        """
+        text = text.lower()
+        scores = [0.0] * len(self.intents)
+        fuzzy = set()
+        matched = set()
+        if self._pattern is not None:
+            for match in self._pattern.finditer(text):
+                index = int(match.lastgroup[1:])
+                scores[index] += self.intents[index].weight
+                matched.add(match.start())
+        for word in WORD.finditer(text):
+            index = self._aliases.get(word[0])
+            if index is not None:
+                scores[index] += self.alias_weight * self.intents[index].weight
+            elif word.start() not in matched and len(word[0]) >= self.fuzzy_min_length - 1:
+                for index in self._fuzzy(word[0]):
+                    scores[index] += self.fuzzy_weight * self.intents[index].weight
+                    fuzzy.add(index)
+        best = max(range(len(scores)), key=lambda index: (scores[index], -index), default=None)
+        if best is None or scores[best] < self.threshold:
+            return None
+        return IntentMatch(self.intents[best].name, scores[best], best in fuzzy)
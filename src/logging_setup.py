@@ -0,0 +1,117 @@
+"""
+Queue-based logging: records are enqueued on the event loop and formatted and written by a listener thread.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+update_context = contextvars.ContextVar("update_context", default=None)
+
+CONTEXT_FIELDS = ("update_id", "user_id", "chat_id", "handler")
+EXTRA_FIELDS = ("latency_ms",)
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+sample_rate = 1.0
+
+
+def bind_update(update, handler: str) -> contextvars.Token:
+    """
+    Attaches the update's ids and handler name to every record logged while it is handled and decides
+    once per update whether its info lines are kept, so a sampled update is logged completely.
+    """
+    user = getattr(update, "effective_user", None)
+    chat = getattr(update, "effective_chat", None)
+    return update_context.set({
+        "update_id": getattr(update, "update_id", None),
+        "user_id": user.id if user else None,
+        "chat_id": chat.id if chat else None,
+        "handler": handler,
+        "sampled": sample_rate >= 1.0 or random.random() < sample_rate,
+    })
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the current update context onto records and drops info lines of updates left out of the sample.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = update_context.get()
+        if context is None:
+            return True
+        if not context["sampled"] and record.levelno < logging.WARNING:
+            return False
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context[field])
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without formatting them; the listener thread does the formatting.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Renders records as one JSON object per line with the update context and latency when present.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+def setup_logging(level: str = "INFO", path: str | None = "bot.log", fmt: str = "text",
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  info_sample_rate: float = 1.0) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a queue to a listener thread that writes to stderr and a rotating file.
+    Returns the started listener; stop it on shutdown to flush the remaining records.
+    """
+    global sample_rate
+    sample_rate = info_sample_rate
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if path:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,321 @@
+"""
+In-process metrics (counters, gauges, latency histograms), per-update tracing and a Prometheus-style endpoint.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from telegram.request import HTTPXRequest
+
+from logging_setup import bind_update, update_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonically increasing value per label set.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name + _labels_text(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """
+    Value per label set that can go up and down.
+    """
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float) -> None:
+        self.values[label_values] = value
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets per label set.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, *label_values, value: float) -> None:
+        state = self.values.get(label_values)
+        if state is None:
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for label_values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket" + _labels_text(self.labels, label_values, f'le="{le}"'), cumulative
+            yield self.name + "_sum" + _labels_text(self.labels, label_values), total
+            yield self.name + "_count" + _labels_text(self.labels, label_values), count
+
+
+class MetricsRegistry:
+    """
+    Holds all metrics and collectors and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = ()) -> Histogram:
+        return self._add(Histogram(name, documentation, labels))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector) -> None:
+        """
+        Registers a callable returning (name, kind, documentation, {label_dict_items: value}) tuples
+        that is evaluated on every scrape, for components that keep their own counters.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        for collector in self._collectors:
+            for name, kind, documentation, values in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values.items():
+                    names = tuple(label for label, _ in labels)
+                    label_values = tuple(label_value for _, label_value in labels)
+                    lines.append(f"{name}{_labels_text(names, label_values)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_latency = registry.histogram("bot_handler_latency_seconds", "Handler execution time.", ("handler",))
+handler_in_flight = registry.gauge("bot_handler_in_flight", "Handlers currently running.", ("handler",))
+handler_errors = registry.counter("bot_handler_errors_total", "Exceptions raised by handlers.", ("handler", "error"))
+gpt_latency = registry.histogram("bot_gpt_latency_seconds", "OpenAI call time per attempt.", ("endpoint",))
+gpt_in_flight = registry.gauge("bot_gpt_in_flight", "OpenAI calls currently in flight.", ("endpoint",))
+gpt_errors = registry.counter("bot_gpt_errors_total", "Failed OpenAI call attempts.", ("endpoint", "error"))
+gpt_tokens = registry.counter("bot_gpt_tokens_total", "Tokens reported by OpenAI completions.", ("kind",))
+gpt_mode_tokens = registry.counter("bot_gpt_mode_tokens_total",
+                                   "Tokens reported by OpenAI completions per mode and model.", ("kind", "mode", "model"))
+gpt_requests = registry.histogram("bot_gpt_request_seconds",
+                                  "OpenAI request time per mode and model until the answer or its first token, "
+                                  "including retries.", ("mode", "model"))
+telegram_latency = registry.histogram("bot_telegram_api_latency_seconds", "Bot API call time.", ("method",))
+telegram_in_flight = registry.gauge("bot_telegram_api_in_flight", "Bot API calls currently in flight.", ("method",))
+telegram_errors = registry.counter("bot_telegram_api_errors_total", "Failed Bot API calls.", ("method", "error"))
+startup_seconds = registry.gauge("bot_startup_seconds", "Duration of startup phases.", ("phase",))
+
+trace_enabled = False
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def set_tracing(enabled: bool) -> None:
+    """
+    Switches per-update tracing on or off at runtime.
+    """
+    global trace_enabled
+    trace_enabled = enabled
+    logger.info("Трасування оновлень %s", "увімкнено" if enabled else "вимкнено")
+
+
+def add_span(kind: str, name: str, started: float, error: str | None = None) -> None:
+    """
+    Appends a timed span to the trace of the update being handled, if tracing is on.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        span = {"kind": kind, "name": name, "start_ms": round((started - trace["started"]) * 1000, 2),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)}
+        if error:
+            span["error"] = error
+        trace["spans"].append(span)
+
+
+class StartupTimer:
+    """
+    Measures consecutive startup phases from the given start time and reports them once the bot is ready.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = {}
+        self._last = started
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases[phase] = round(now - self._last, 4)
+        self._last = now
+
+    def report(self) -> dict:
+        """
+        Closes the last phase, publishes all of them as gauges and logs a one-line summary.
+        """
+        self.phases["ready"] = round(self._last - self.started, 4)
+        for phase, seconds in self.phases.items():
+            startup_seconds.set(phase, value=seconds)
+        logger.info("Запуск: %s", ", ".join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases.items()))
+        return self.phases
+
+
+def record_tokens(usage, mode: str | None = None, model: str | None = None) -> None:
+    """
+    Counts prompt and completion tokens from an OpenAI usage object, also per mode and model if given.
+    """
+    if usage is not None:
+        gpt_tokens.inc("prompt", amount=usage.prompt_tokens or 0)
+        gpt_tokens.inc("completion", amount=usage.completion_tokens or 0)
+        if mode is not None:
+            gpt_mode_tokens.inc("prompt", mode, model, amount=usage.prompt_tokens or 0)
+            gpt_mode_tokens.inc("completion", mode, model, amount=usage.completion_tokens or 0)
+
+
+def instrument_handler(callback):
+    """
+    Wraps a handler callback to record its latency, in-flight count, errors and, when enabled, a trace.
+    Records logged while the handler runs carry the update's ids and the handler name.
+    """
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args):
+        started = time.perf_counter()
+        log_token = bind_update(update, name)
+        token = None
+        if trace_enabled:
+            token = current_trace.set({"started": started, "spans": []})
+        handler_in_flight.inc(name)
+        error = None
+        try:
+            return await callback(update, context, *args)
+        except Exception as e:
+            error = type(e).__name__
+            handler_errors.inc(name, error)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            handler_in_flight.dec(name)
+            handler_latency.observe(name, value=elapsed)
+            logger.info("Оновлення оброблено за %.1f мс", elapsed * 1000, extra={"latency_ms": round(elapsed * 1000, 2)})
+            update_context.reset(log_token)
+            if token is not None:
+                trace = current_trace.get()
+                current_trace.reset(token)
+                logger.info("trace %s", json.dumps({
+                    "update_id": getattr(update, "update_id", None),
+                    "handler": name,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "error": error,
+                    "spans": trace["spans"],
+                }, ensure_ascii=False))
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """
+    Bot API request backend that records latency, in-flight count and errors per API method.
+    """
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        telegram_in_flight.inc(api_method)
+        error = None
+        try:
+            status, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            if status >= 400:
+                error = f"HTTP {status}"
+                telegram_errors.inc(api_method, error)
+            return status, payload
+        except Exception as e:
+            error = type(e).__name__
+            telegram_errors.inc(api_method, error)
+            raise
+        finally:
+            telegram_in_flight.dec(api_method)
+            telegram_latency.observe(api_method, value=time.perf_counter() - started)
+            add_span("telegram", api_method, started, error)
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readline()).strip():
+            pass
+        target = urlsplit(request_line[1] if len(request_line) > 1 else "/")
+        if target.path == "/metrics":
+            status, body = "200 OK", registry.render()
+        elif target.path == "/trace":
+            enabled = parse_qs(target.query).get("enabled", [None])[0]
+            if enabled is not None:
+                set_tracing(enabled.lower() in ("1", "true", "on"))
+            status, body = "200 OK", json.dumps({"trace_enabled": trace_enabled}) + "\n"
+        else:
+            status, body = "404 Not Found", "Not found\n"
+        data = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.Server:
+    """
+    Serves /metrics in the Prometheus text format and /trace?enabled=1|0 to toggle tracing.
+    """
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info("Метрики доступні на http://%s:%s/metrics", host, port)
+    return server
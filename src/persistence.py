@@ -0,0 +1,186 @@
+"""
+Crash-safe storage of per-user state and per-chat conversation history in an embedded SQLite database.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from copy import deepcopy
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+
+class SQLiteStorage:
+    """
+    SQLite database in WAL mode holding user_data dicts, conversation histories and registered menu versions.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, "
+            "updated REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(user_data)")]
+        if "updated" not in columns:
+            # Databases created before user_data was pruned: their rows count as written now.
+            self._connection.execute("ALTER TABLE user_data ADD COLUMN updated REAL NOT NULL DEFAULT 0")
+            self._connection.execute("UPDATE user_data SET updated = ?", (time.time(),))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (chat_id INTEGER PRIMARY KEY, prompt TEXT, summary TEXT, "
+            "turns TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS menus (scope TEXT PRIMARY KEY, version TEXT NOT NULL)")
+        self._connection.commit()
+
+    def load_user_data(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute("SELECT user_id, data FROM user_data").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def save_user_data(self, rows: dict) -> None:
+        """
+        Writes the given user_data dicts in one transaction; an empty dict deletes the user's row.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data, updated) VALUES (?, ?, ?)",
+                [(user_id, json.dumps(data, ensure_ascii=False), now) for user_id, data in rows.items() if data]
+            )
+            self._connection.executemany(
+                "DELETE FROM user_data WHERE user_id = ?", [(user_id,) for user_id, data in rows.items() if not data]
+            )
+
+    def load_conversation(self, chat_id) -> tuple | None:
+        """
+        Returns (prompt, summary, turns) stored for the chat, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT prompt, summary, turns FROM conversations WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        prompt, summary, turns = row
+        return prompt, summary, [tuple(turn) for turn in json.loads(turns)]
+
+    def save_conversations(self, rows: list) -> None:
+        """
+        Writes (chat_id, prompt, summary, turns) snapshots in one transaction.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO conversations (chat_id, prompt, summary, turns, updated) VALUES (?, ?, ?, ?, ?)",
+                [(chat_id, prompt, summary, json.dumps(turns, ensure_ascii=False), now)
+                 for chat_id, prompt, summary, turns in rows]
+            )
+
+    def prune(self, max_age: float) -> None:
+        """
+        Deletes the user_data and conversations of users and chats not active for max_age seconds.
+        """
+        cutoff = time.time() - max_age
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM user_data WHERE updated < ?", (cutoff,))
+            self._connection.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,))
+
+    def load_menu_version(self, scope: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute("SELECT version FROM menus WHERE scope = ?", (scope,)).fetchone()
+        return row[0] if row else None
+
+    def save_menu_version(self, scope: str, version: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO menus (scope, version) VALUES (?, ?)", (scope, version))
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persists context.user_data in SQLiteStorage. Changes reported by the application in one persistence
+    cycle are written together in a single transaction off the event loop. With retention set, state of users
+    and chats inactive for that many seconds is pruned before user_data is loaded at startup.
+    """
+
+    def __init__(self, storage: SQLiteStorage, update_interval: float = 60, retention: float = 0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.storage = storage
+        self.retention = retention
+        self._pending = {}
+        self._writer = None
+
+    async def get_user_data(self) -> dict:
+        if self.retention:
+            await asyncio.to_thread(self.storage.prune, self.retention)
+        return await asyncio.to_thread(self.storage.load_user_data)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._pending[user_id] = deepcopy(data)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self.update_user_data(user_id, {})
+
+    async def _write(self) -> None:
+        await asyncio.sleep(0)
+        try:
+            while self._pending:
+                rows, self._pending = self._pending, {}
+                await asyncio.to_thread(self.storage.save_user_data, rows)
+        finally:
+            self._writer = None
+
+    async def flush(self) -> None:
+        if self._writer is not None:
+            await self._writer
+        if self._pending:
+            rows, self._pending = self._pending, {}
+            await asyncio.to_thread(self.storage.save_user_data, rows)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        pass
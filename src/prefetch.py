@@ -0,0 +1,125 @@
+"""
+Pools of pre-generated answers for "give me another" interactions, refilled in the background.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.strip().lower().encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PrefetchPool:
+    """
+    Keeps a few ready answers per key and refills them asynchronously once the pool drops below
+    the low-water mark. Answers a user has already seen are never handed to them again.
+    """
+
+    def __init__(self, capacity: int = 3, low_water: int = 1, max_pools: int = 256, max_users: int = 10000,
+                 seen_per_user: int = 50):
+        self.capacity = capacity
+        self.low_water = low_water
+        self.max_pools = max_pools
+        self.max_users = max_users
+        self.seen_per_user = seen_per_user
+        self.hits = 0
+        self.misses = 0
+        self._pools = OrderedDict()
+        self._seen = OrderedDict()
+        self._refills = {}
+
+    def _pool(self, key) -> deque:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = deque()
+            while len(self._pools) > self.max_pools:
+                stale_key, _ = self._pools.popitem(last=False)
+                refill = self._refills.pop(stale_key, None)
+                if refill is not None:
+                    refill.cancel()
+        else:
+            self._pools.move_to_end(key)
+        return pool
+
+    def _seen_by(self, user_id) -> OrderedDict:
+        seen = self._seen.get(user_id)
+        if seen is None:
+            seen = self._seen[user_id] = OrderedDict()
+            while len(self._seen) > self.max_users:
+                self._seen.popitem(last=False)
+        else:
+            self._seen.move_to_end(user_id)
+        return seen
+
+    def _mark_seen(self, user_id, fingerprint: str) -> None:
+        seen = self._seen_by(user_id)
+        seen[fingerprint] = None
+        while len(seen) > self.seen_per_user:
+            seen.popitem(last=False)
+
+    def pop(self, key, user_id, produce) -> str | None:
+        """
+        Returns a ready answer the user has not seen yet, or None, and schedules a refill when needed.
+        """
+        pool = self._pool(key)
+        seen = self._seen_by(user_id)
+        answer = None
+        for index, (fingerprint, text) in enumerate(pool):
+            if fingerprint not in seen:
+                del pool[index]
+                self._mark_seen(user_id, fingerprint)
+                answer = text
+                break
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.warm(key, produce)
+        return answer
+
+    async def take(self, key, user_id, produce) -> str:
+        """
+        Returns a ready answer when there is one, otherwise generates a new answer right away.
+        """
+        answer = self.pop(key, user_id, produce)
+        if answer is None:
+            answer = await self.generate(user_id, produce)
+        return answer
+
+    async def generate(self, user_id, produce) -> str:
+        """
+        Generates a new answer right away, for a user pop had nothing for.
+        """
+        answer = await produce()
+        self._mark_seen(user_id, _fingerprint(answer))
+        return answer
+
+    def warm(self, key, produce) -> None:
+        """
+        Starts filling the pool for the key in the background if it is below the low-water mark.
+        """
+        if len(self._pool(key)) > self.low_water or key in self._refills:
+            return
+        task = asyncio.create_task(self._refill(key, produce))
+        self._refills[key] = task
+        task.add_done_callback(lambda _: self._refills.pop(key, None) if self._refills.get(key) is task else None)
+
+    async def _refill(self, key, produce) -> None:
+        attempts = 0
+        while len(self._pools.get(key, ())) < self.capacity and attempts < self.capacity * 2:
+            attempts += 1
+            try:
+                text = await produce()
+            except Exception as e:
+                logger.warning("Не вдалося поповнити пул %s: %s", key, e)
+                return
+            pool = self._pools.get(key)
+            if pool is None:
+                return
+            fingerprint = _fingerprint(text)
+            if all(existing != fingerprint for existing, _ in pool):
+                pool.append((fingerprint, text))
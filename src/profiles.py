@@ -0,0 +1,86 @@
+"""
+Generation settings per bot mode: model, output limits, sampling and the model to fall back to when slow.
+"""
+from dataclasses import dataclass, replace
+
+from context_window import count_tokens
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """
+    How the completions of a mode are generated. With output_ratio set, max_tokens adapts to the input:
+    output_ratio tokens per input token plus min_tokens, capped at max_tokens. With fallback and slo set,
+    requests go to the fallback model while the primary misses its latency objective of slo seconds until
+    the answer, or its first token when streamed, arrives.
+    """
+    model: str = "gpt-3.5-turbo"
+    max_tokens: int = 3000
+    temperature: float = 0.9
+    stop: tuple = ()
+    output_ratio: float = 0.0
+    min_tokens: int = 64
+    fallback: str | None = None
+    slo: float = 0.0
+
+    def output_limit(self, input_text: str = "") -> int:
+        if not self.output_ratio:
+            return self.max_tokens
+        return min(self.max_tokens, self.min_tokens + int(self.output_ratio * count_tokens(input_text)))
+
+    def params(self, model: str, input_text: str = "") -> dict:
+        """
+        Returns the completion request parameters for the model.
+        """
+        params = {"model": model, "max_tokens": self.output_limit(input_text), "temperature": self.temperature}
+        if self.stop:
+            params["stop"] = list(self.stop)
+        return params
+
+
+DEFAULT_PROFILES = {
+    "default": GenerationProfile(),
+    "random": GenerationProfile(max_tokens=400, temperature=1.0),
+    "recommendation": GenerationProfile(max_tokens=800),
+    "translator": GenerationProfile(temperature=0.3, output_ratio=2.0),
+    "summary": GenerationProfile(max_tokens=600, temperature=0.3),
+}
+
+_FIELDS = {
+    "model": str,
+    "max_tokens": int,
+    "temperature": float,
+    "stop": lambda value: tuple(part for part in value.split("|") if part),
+    "output_ratio": float,
+    "min_tokens": int,
+    "fallback": lambda value: value or None,
+    "slo": float,
+}
+
+
+def parse_profiles(value: str, defaults: dict = None) -> dict:
+    """
+    Applies "mode: key=value key=value; mode: ..." overrides to the default profiles, e.g.
+    "translator: model=gpt-4o-mini max_tokens=1000; *: fallback=gpt-4o-mini slo=8". Stop sequences are
+    separated by "|", "*" changes every profile and an unknown mode starts from the "default" profile.
+    """
+    profiles = dict(DEFAULT_PROFILES if defaults is None else defaults)
+    overrides = []
+    for item in value.split(";"):
+        if not item.strip():
+            continue
+        mode, _, settings = item.partition(":")
+        changes = {}
+        for setting in settings.split():
+            key, _, raw = setting.partition("=")
+            if key not in _FIELDS:
+                raise ValueError(f"Unknown generation profile setting {key!r} for {mode.strip()}")
+            changes[key] = _FIELDS[key](raw)
+        overrides.append((mode.strip(), changes))
+    for mode, changes in overrides:
+        if mode == "*":
+            profiles = {name: replace(profile, **changes) for name, profile in profiles.items()}
+    for mode, changes in overrides:
+        if mode != "*":
+            profiles[mode] = replace(profiles.get(mode, profiles["default"]), **changes)
+    return profiles
@@ -0,0 +1,170 @@
+"""
+Resilience primitives for upstream calls: retry policy with jittered backoff, circuit breaker, latency
+objective tracking and hedging.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the upstream while every endpoint's circuit breaker is open.
+    """
+
+
+class RateLimitedError(Exception):
+    """
+    Raised when the upstream still answers with its rate limit after all retries.
+    """
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How many attempts to make, how long each may take and how long to wait between them.
+    """
+    max_attempts: int = 3
+    attempt_timeout: float = 30.0
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Returns the pause before the next attempt: the server's Retry-After if given,
+        otherwise exponential backoff with full jitter.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to an endpoint after consecutive failures and lets a single probe through
+    once the reset timeout has passed.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._clock = clock
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether a request could be sent now, without reserving the probe slot.
+        """
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._probing)
+
+    def allow(self) -> bool:
+        """
+        Checks whether a request may be sent now, reserving the probe slot in the half-open state.
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """
+        Frees the probe slot of an attempt that ended without a verdict, e.g. cancelled or a client error.
+        """
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = self._clock()
+
+
+class LatencySLO:
+    """
+    Tracks how many of the last window calls took longer than the target latency. Once more than miss_ratio
+    of a full window missed it, the objective counts as missed for the cooldown, after which the window starts
+    afresh.
+    """
+
+    def __init__(self, target: float, window: int = 20, miss_ratio: float = 0.25, cooldown: float = 60.0,
+                 clock=time.monotonic):
+        self.target = target
+        self.window = window
+        self.miss_ratio = miss_ratio
+        self.cooldown = cooldown
+        self.missed_at = None
+        self._latencies = deque(maxlen=window)
+        self._clock = clock
+
+    @property
+    def missed(self) -> bool:
+        if self.missed_at is None:
+            return False
+        if self._clock() - self.missed_at < self.cooldown:
+            return True
+        self.missed_at = None
+        self._latencies.clear()
+        return False
+
+    def record_miss(self) -> None:
+        """
+        Counts a call that failed or timed out, which never meets the objective.
+        """
+        self.record(float("inf"))
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+        if len(self._latencies) == self.window:
+            misses = sum(1 for value in self._latencies if value > self.target)
+            if misses > self.miss_ratio * self.window:
+                self.missed_at = self._clock()
+
+
+async def hedged(attempts: list, delay: float):
+    """
+    Starts the first attempt and launches the next one whenever the running ones take longer than
+    the delay or fail. Returns the first successful result and cancels the rest.
+    """
+    remaining = iter(attempts)
+    pending = {asyncio.ensure_future(next(remaining)())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    error = asyncio.CancelledError()
+                elif task.exception() is None:
+                    return task.result()
+                else:
+                    error = task.exception()
+            if not done or error is not None:
+                attempt = next(remaining, None)
+                if attempt is not None:
+                    pending.add(asyncio.ensure_future(attempt()))
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
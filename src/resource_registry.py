@@ -0,0 +1,132 @@
+"""
+In-memory registry of bot resources (prompts, messages and images) with startup validation and hot reload.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    "prompts": ".txt",
+    "messages": ".txt",
+    "images": ".jpg",
+}
+
+
+@dataclass(frozen=True)
+class Image:
+    """
+    Image bytes kept in memory together with their content hash.
+    """
+    name: str
+    data: bytes
+    digest: str
+
+
+class ResourceRegistry:
+    """
+    Loads every resource file once and serves lookups from memory.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._resources = None
+        self._snapshot = None
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        for kind, extension in KINDS.items():
+            directory = os.path.join(self.root, kind)
+            for entry in os.scandir(directory):
+                if entry.is_file() and entry.name.endswith(extension):
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def load(self) -> None:
+        """
+        Reads all resources from disk and atomically replaces the in-memory copy.
+        """
+        snapshot = self._scan()
+        resources = {kind: {} for kind in KINDS}
+        for kind, extension in KINDS.items():
+            directory = os.path.join(self.root, kind)
+            for file_name in os.listdir(directory):
+                if not file_name.endswith(extension):
+                    continue
+                name = file_name[:-len(extension)]
+                path = os.path.join(directory, file_name)
+                if kind == "images":
+                    with open(path, "rb") as file:
+                        data = file.read()
+                    resources[kind][name] = Image(name, data, hashlib.sha256(data).hexdigest())
+                else:
+                    with open(path, "r", encoding="utf-8") as file:
+                        resources[kind][name] = file.read()
+        self._resources = resources
+        self._snapshot = snapshot
+
+    def _get(self, kind: str, name: str):
+        if self._resources is None:
+            self.load()
+        try:
+            return self._resources[kind][name]
+        except KeyError:
+            raise FileNotFoundError(f"Resource not found: {kind}/{name}{KINDS[kind]}") from None
+
+    def prompt(self, name: str) -> str:
+        """
+        Returns a prompt template by name.
+        """
+        return self._get("prompts", name)
+
+    def message(self, name: str) -> str:
+        """
+        Returns a message template by name.
+        """
+        return self._get("messages", name)
+
+    def image(self, name: str) -> Image:
+        """
+        Returns an image by name.
+        """
+        return self._get("images", name)
+
+    def validate(self, required: dict) -> None:
+        """
+        Ensures every required resource exists, listing all missing ones at once.
+        """
+        if self._resources is None:
+            self.load()
+        missing = [
+            f"{kind}/{name}{KINDS[kind]}"
+            for kind, names in required.items()
+            for name in names
+            if name not in self._resources[kind]
+        ]
+        if missing:
+            raise FileNotFoundError(f"Missing resources: {', '.join(sorted(missing))}")
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads the resources when any file was added, removed or modified since the last load.
+        """
+        if self._scan() == self._snapshot:
+            return False
+        self.load()
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """
+        Periodically checks the resource directory for changes off the event loop.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await asyncio.to_thread(self.reload_if_changed):
+                    logger.info("Ресурси перезавантажено")
+            except OSError as e:
+                logger.error("Помилка перезавантаження ресурсів: %s", e)
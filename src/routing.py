@@ -0,0 +1,116 @@
+"""
+Routing of inline keyboard callbacks by structured callback data.
+"""
+import inspect
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+MAX_CALLBACK_DATA = 64
+
+
+def callback_data(namespace: str, action: str = "", *args) -> str:
+    """
+    Encodes a button's callback data as "namespace:action:arg...". Parts may not contain the separator, and
+    the result has to fit into the 64 bytes Telegram allows.
+    """
+    parts = [namespace, action, *map(str, args)]
+    if any(SEPARATOR in part for part in parts):
+        raise ValueError(f"Callback data parts may not contain {SEPARATOR!r}: {parts}")
+    data = SEPARATOR.join(parts) if args else SEPARATOR.join(parts).rstrip(SEPARATOR)
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data is longer than {MAX_CALLBACK_DATA} bytes: {data}")
+    return data
+
+
+def parse_callback_data(data: str) -> tuple:
+    """
+    Returns (namespace, action, args) encoded by callback_data.
+    """
+    namespace, _, rest = data.partition(SEPARATOR)
+    action, _, args = rest.partition(SEPARATOR)
+    return namespace, action, tuple(args.split(SEPARATOR)) if args else ()
+
+
+def _arity(handler) -> int:
+    parameters = list(inspect.signature(handler).parameters.values())[2:]
+    return sum(1 for parameter in parameters if parameter.default is parameter.empty
+               and parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD))
+
+
+class CallbackRouter:
+    """
+    Dispatches callback queries to handlers by (namespace, action) with one dict lookup, however many routes
+    there are. Handlers are called as handler(update, context, *args) and a route only matches data carrying
+    as many args as its handler takes. Registering a route twice is an error, so every callback data has at
+    most one target. Aliases map the exact callback data of buttons sent before the scheme changed.
+    """
+
+    def __init__(self, routes: dict = None, aliases: dict = None):
+        self._routes = {}
+        self._handlers = {}
+        self.aliases = {}
+        self.dispatched = defaultdict(int)
+        self.unknown = 0
+        for (namespace, action), handler in (routes or {}).items():
+            self.add(namespace, action, handler)
+        for old, new in (aliases or {}).items():
+            self.alias(old, new)
+
+    def add(self, namespace: str, action: str, handler) -> None:
+        if SEPARATOR in namespace or SEPARATOR in action:
+            raise ValueError(f"Route parts may not contain {SEPARATOR!r}: {namespace}, {action}")
+        if (namespace, action) in self._routes:
+            raise ValueError(f"Callback route {namespace}:{action} is already registered")
+        self._handlers[namespace, action] = handler
+        self._routes[namespace, action] = (handler, _arity(handler))
+
+    def alias(self, old: str, new: str) -> None:
+        if self.resolve(old) is not None:
+            raise ValueError(f"Alias {old} shadows a registered route")
+        if self.resolve(new) is None:
+            raise ValueError(f"Alias {old} points to {new}, which has no route")
+        self.aliases[old] = new
+
+    def instrument(self, wrap) -> None:
+        """
+        Routes to wrap(handler) instead of every registered handler, e.g. to record per-route metrics.
+        Calling it again replaces the previous wrapping.
+        """
+        self._routes = {key: (wrap(handler), self._routes[key][1]) for key, handler in self._handlers.items()}
+
+    def resolve(self, data: str) -> tuple | None:
+        """
+        Returns (route, handler, args) for the callback data, or None if no route matches it.
+        """
+        namespace, action, args = parse_callback_data(self.aliases.get(data, data))
+        route = self._routes.get((namespace, action))
+        if route is None or route[1] != len(args):
+            return None
+        return f"{namespace}:{action}", route[0], args
+
+    async def dispatch(self, update, context) -> None:
+        """
+        Answers the callback query and runs the handler its data routes to.
+        """
+        query = update.callback_query
+        await query.answer()
+        target = self.resolve(query.data or "")
+        if target is None:
+            self.unknown += 1
+            logger.warning("Невідома кнопка від користувача %s: %s", update.effective_user.id, query.data)
+            return
+        route, handler, args = target
+        self.dispatched[route] += 1
+        logger.info("Користувач %s натиснув кнопку %s", update.effective_user.id, query.data)
+        await handler(update, context, *args)
+
+    def collect_metrics(self) -> list:
+        return [
+            ("bot_callbacks_total", "counter", "Callback queries dispatched by route.",
+             {(("route", route),): count for route, count in self.dispatched.items()}),
+            ("bot_callbacks_unknown_total", "counter", "Callback queries whose data matched no route.",
+             {(): self.unknown}),
+        ]
@@ -0,0 +1,136 @@
+"""
+Long-lived services shared by the handlers, constructed on first use instead of at import time.
+"""
+import importlib
+import threading
+from functools import cached_property
+
+from config import (CHATGPT_TOKEN, OPENAI_ENDPOINTS, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE, OPENAI_TIMEOUT,
+                    OPENAI_CONNECT_TIMEOUT, OPENAI_MAX_ATTEMPTS, OPENAI_ATTEMPT_TIMEOUT, OPENAI_BACKOFF_BASE,
+                    OPENAI_BACKOFF_MAX, OPENAI_HEDGE_DELAY, OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_RESET,
+                    SESSION_MAX_COUNT, SESSION_TTL, SESSION_MAX_BYTES, CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARIZE,
+                    COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL, COMPLETION_CACHE_PATH, PREFETCH_CAPACITY,
+                    PREFETCH_LOW_WATER, PERSISTENCE_PATH, ADMISSION_LIMITS, ADMISSION_GLOBAL_RATE,
+                    ADMISSION_GLOBAL_BURST, ADMISSION_MAX_IN_FLIGHT, ADMISSION_QUEUE_TIMEOUT, GENERATION_PROFILES,
+                    GENERATION_SLO_WINDOW, GENERATION_SLO_MISS_RATIO, GENERATION_SLO_COOLDOWN)
+from admission import AdmissionController, parse_limits
+from completion_cache import CompletionCache, SQLiteCacheBackend
+from context_window import ContextWindow
+from persistence import SQLiteStorage
+from prefetch import PrefetchPool
+from profiles import parse_profiles
+from resilience import RetryPolicy
+from sessions import SessionStore
+from utils import MenuRegistry, load_prompt
+
+# Modules that are slow to import (the OpenAI SDK) and only needed once the first client is built.
+HEAVY_MODULES = ("gpt",)
+
+
+class Services:
+    """
+    Builds the GPT client, storage, sessions, prefetch pool, admission control and menu registry the first time
+    each is needed.
+    """
+
+    @cached_property
+    def chatgpt(self):
+        from gpt import ChatGPTService
+
+        return ChatGPTService(
+            CHATGPT_TOKEN,
+            endpoints=OPENAI_ENDPOINTS,
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            timeout=OPENAI_TIMEOUT,
+            connect_timeout=OPENAI_CONNECT_TIMEOUT,
+            context_window=ContextWindow(
+                budget=CONTEXT_TOKEN_BUDGET,
+                summary_prompt=load_prompt("summary") if CONTEXT_SUMMARIZE else None
+            ),
+            completion_cache=CompletionCache(
+                max_entries=COMPLETION_CACHE_SIZE,
+                ttl=COMPLETION_CACHE_TTL,
+                backend=SQLiteCacheBackend(COMPLETION_CACHE_PATH) if COMPLETION_CACHE_PATH else None
+            ),
+            retry_policy=RetryPolicy(
+                max_attempts=OPENAI_MAX_ATTEMPTS,
+                attempt_timeout=OPENAI_ATTEMPT_TIMEOUT,
+                base_delay=OPENAI_BACKOFF_BASE,
+                max_delay=OPENAI_BACKOFF_MAX
+            ),
+            hedge_delay=OPENAI_HEDGE_DELAY,
+            breaker_threshold=OPENAI_BREAKER_THRESHOLD,
+            breaker_reset_timeout=OPENAI_BREAKER_RESET,
+            profiles=parse_profiles(GENERATION_PROFILES),
+            slo_window=GENERATION_SLO_WINDOW,
+            slo_miss_ratio=GENERATION_SLO_MISS_RATIO,
+            slo_cooldown=GENERATION_SLO_COOLDOWN
+        )
+
+    @cached_property
+    def storage(self) -> SQLiteStorage | None:
+        return SQLiteStorage(PERSISTENCE_PATH) if PERSISTENCE_PATH else None
+
+    @cached_property
+    def sessions(self) -> SessionStore:
+        return SessionStore(max_sessions=SESSION_MAX_COUNT, ttl=SESSION_TTL, max_bytes=SESSION_MAX_BYTES,
+                            backend=self.storage)
+
+    @cached_property
+    def prefetch_pool(self) -> PrefetchPool:
+        return PrefetchPool(capacity=PREFETCH_CAPACITY, low_water=PREFETCH_LOW_WATER)
+
+    @cached_property
+    def admission(self) -> AdmissionController:
+        return AdmissionController(parse_limits(ADMISSION_LIMITS), global_rate=ADMISSION_GLOBAL_RATE,
+                                   global_burst=ADMISSION_GLOBAL_BURST, max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+                                   queue_timeout=ADMISSION_QUEUE_TIMEOUT)
+
+    @cached_property
+    def menus(self) -> MenuRegistry:
+        return MenuRegistry(self.storage)
+
+    def built(self, name: str) -> bool:
+        return name in self.__dict__
+
+    def prewarm(self) -> threading.Thread:
+        """
+        Imports the heavy modules in a background thread so that it overlaps with network-bound startup.
+        """
+        thread = threading.Thread(
+            target=lambda: [importlib.import_module(module) for module in HEAVY_MODULES], daemon=True
+        )
+        thread.start()
+        return thread
+
+    def collect_metrics(self) -> list:
+        """
+        Reports cache, prefetch, session, admission and menu counters kept by the services themselves to the metrics endpoint.
+        """
+        samples = []
+        if self.built("chatgpt"):
+            cache = self.chatgpt.completion_cache
+            samples.append(("bot_completion_cache_total", "counter", "Completion cache lookups by outcome.",
+                            {(("outcome", "hit"),): cache.hits, (("outcome", "miss"),): cache.misses,
+                             (("outcome", "coalesced"),): cache.coalesced}))
+            samples.append(("bot_openai_circuit_open", "gauge", "Whether an endpoint's circuit breaker is not closed.",
+                            {(("endpoint", endpoint.label),): int(endpoint.breaker.state != "closed")
+                             for endpoint in self.chatgpt.endpoints}))
+            samples.append(("bot_gpt_slo_missed", "gauge",
+                            "Whether a mode's primary model misses its latency objective and the fallback is used.",
+                            {(("mode", mode),): int(slo.missed) for mode, slo in self.chatgpt.slos.items()}))
+        if self.built("prefetch_pool"):
+            samples.append(("bot_prefetch_total", "counter", "Prefetch pool lookups by outcome.",
+                            {(("outcome", "hit"),): self.prefetch_pool.hits,
+                             (("outcome", "miss"),): self.prefetch_pool.misses}))
+        if self.built("sessions"):
+            samples.append(("bot_sessions", "gauge", "Conversations held in memory.", {(): len(self.sessions)}))
+        if self.built("admission"):
+            samples.extend(self.admission.collect_metrics())
+        if self.built("menus"):
+            samples.extend(self.menus.collect_metrics())
+        return samples
+
+
+services = Services()
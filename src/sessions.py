@@ -0,0 +1,225 @@
+"""
+Per-chat conversation storage with LRU/TTL eviction, a memory cap and optional write-behind persistence.
+"""
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+
+USER = "user"
+ASSISTANT = "assistant"
+SYSTEM = "system"
+
+
+class Conversation:
+    """
+    Compact history of a single chat: a shared reference to the system prompt plus (role, content) turns.
+    """
+    __slots__ = ("prompt", "turns", "summary", "usage", "size", "last_access", "key", "_store")
+
+    def __init__(self, prompt: str | None = None, store=None, key=None):
+        self.prompt = prompt
+        self.turns = []
+        self.summary = None
+        self.usage = None
+        self.size = 0
+        self.last_access = 0.0
+        self.key = key
+        self._store = store
+
+    def reset(self, prompt: str | None) -> None:
+        """
+        Starts a new dialog with the given system prompt, dropping previous turns.
+        """
+        self._resize(-self.size)
+        self.prompt = prompt
+        self.turns = []
+        self.summary = None
+
+    def add(self, role: str, content: str) -> None:
+        """
+        Appends a turn to the history.
+        """
+        self.turns.append((role, content))
+        self._resize(sys.getsizeof(content))
+
+    def fold(self, count: int, summary: str | None) -> None:
+        """
+        Removes the oldest turns from the history, replacing them with a summary when one is given.
+        """
+        freed = sum(sys.getsizeof(content) for _, content in self.turns[:count])
+        del self.turns[:count]
+        if summary is not None:
+            freed -= sys.getsizeof(summary) - (sys.getsizeof(self.summary) if self.summary else 0)
+            self.summary = summary
+        self._resize(-freed)
+
+    def messages(self) -> list:
+        """
+        Expands the history into the message list format expected by the OpenAI API.
+        """
+        messages = [{"role": SYSTEM, "content": self.prompt}] if self.prompt else []
+        if self.summary:
+            messages.append({"role": SYSTEM, "content": self.summary})
+        messages.extend({"role": role, "content": content} for role, content in self.turns)
+        return messages
+
+    def restore(self, prompt: str | None, summary: str | None, turns: list) -> None:
+        """
+        Fills the conversation from a persisted snapshot.
+        """
+        self.prompt = prompt
+        self.summary = summary
+        self.turns = turns
+        self._resize(sum(sys.getsizeof(content) for _, content in turns) - self.size)
+
+    def snapshot(self) -> tuple:
+        return self.key, self.prompt, self.summary, list(self.turns)
+
+    def _resize(self, delta: int) -> None:
+        """
+        Accounts for a change of the history, which also marks it as needing to be persisted.
+        """
+        self.size += delta
+        if self._store is not None:
+            self._store.total_bytes += delta
+            self._store.dirty.add(self.key)
+
+
+class SessionStore:
+    """
+    Keeps conversations keyed by chat id, evicting the least recently used ones when limits are exceeded.
+    With a backend, histories are loaded lazily on first access, changes are written in batches by flush()
+    and eviction only unloads a conversation from memory instead of forgetting it.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600.0, max_bytes: int = 64 * 1024 * 1024,
+                 clock=time.monotonic, backend=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.backend = backend
+        self.dirty = set()
+        self._unflushed = {}
+        self._clock = clock
+        self._sessions = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, key) -> bool:
+        return key in self._sessions
+
+    def get(self, key, prompt: str | None = None) -> Conversation:
+        """
+        Returns the conversation for the key, creating it or resetting it when the system prompt differs.
+        A history that is not in memory is read from the backend synchronously; handlers use fetch instead.
+        """
+        conversation = self._resident(key)
+        if conversation is None:
+            conversation = self._add(key, self._stored(key))
+        return self._touch(conversation, prompt)
+
+    async def fetch(self, key, prompt: str | None = None) -> Conversation:
+        """
+        Like get, but reads a history that is not in memory from the backend in a worker thread.
+        """
+        conversation = self._resident(key)
+        if conversation is None and self.backend is not None and key not in self._unflushed:
+            state = await asyncio.to_thread(self.backend.load_conversation, key)
+            conversation = self._resident(key)
+            if conversation is None and key not in self._unflushed:
+                conversation = self._add(key, state)
+        if conversation is None:
+            conversation = self._add(key, self._stored(key))
+        return self._touch(conversation, prompt)
+
+    def reset(self, key, prompt: str | None) -> Conversation:
+        """
+        Starts a fresh conversation for the key with the given system prompt, without reading the old one.
+        """
+        conversation = self._resident(key) or self._add(key, None)
+        conversation.reset(prompt)
+        return self._touch(conversation, None)
+
+    def drop(self, key) -> None:
+        """
+        Forgets the conversation for the key, if any.
+        """
+        conversation = self._sessions.pop(key, None)
+        if conversation is not None:
+            self.total_bytes -= conversation.size
+            conversation._store = None
+            if key in self.dirty:
+                self.dirty.discard(key)
+                if self.backend is not None:
+                    self._unflushed[key] = conversation.snapshot()
+
+    def _resident(self, key) -> Conversation | None:
+        """
+        Returns the conversation for the key if it is in memory and has not expired.
+        """
+        conversation = self._sessions.get(key)
+        if conversation is not None and self._clock() - conversation.last_access > self.ttl:
+            self.drop(key)
+            return None
+        return conversation
+
+    def _stored(self, key) -> tuple | None:
+        if key in self._unflushed:
+            return self._unflushed[key][1:]
+        if self.backend is None:
+            return None
+        return self.backend.load_conversation(key)
+
+    def _add(self, key, state: tuple | None) -> Conversation:
+        conversation = self._sessions[key] = Conversation(store=self, key=key)
+        if state is not None:
+            conversation.restore(*state)
+            self.dirty.discard(key)
+        return conversation
+
+    def _touch(self, conversation: Conversation, prompt: str | None) -> Conversation:
+        now = self._clock()
+        self._sessions.move_to_end(conversation.key)
+        if prompt is not None and conversation.prompt != prompt:
+            conversation.reset(prompt)
+        conversation.last_access = now
+        self._evict(now)
+        return conversation
+
+    async def flush(self) -> None:
+        """
+        Writes every conversation changed since the last flush to the backend in one batch.
+        """
+        if self.backend is None:
+            self.dirty.clear()
+            self._unflushed.clear()
+            return
+        rows = dict(self._unflushed)
+        rows.update((key, self._sessions[key].snapshot()) for key in self.dirty if key in self._sessions)
+        self.dirty.clear()
+        self._unflushed.clear()
+        if rows:
+            try:
+                await asyncio.to_thread(self.backend.save_conversations, list(rows.values()))
+            except BaseException:
+                self._unflushed = {**rows, **self._unflushed}
+                raise
+
+    async def run_flusher(self, interval: float) -> None:
+        """
+        Flushes changed conversations every interval seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def _evict(self, now: float) -> None:
+        while len(self._sessions) > 1:
+            key, oldest = next(iter(self._sessions.items()))
+            expired = now - oldest.last_access > self.ttl
+            if not expired and len(self._sessions) <= self.max_sessions and self.total_bytes <= self.max_bytes:
+                break
+            self.drop(key)
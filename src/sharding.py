@@ -0,0 +1,325 @@
+"""
+Multi-process deployment: a front process receives updates and routes them by chat to worker processes.
+
+Every worker runs the regular Application with all handlers, without an updater. The front hands it raw update
+JSON, one per line, over a local TCP connection. The line "ping" is answered with "pong" and serves as the
+health check.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+PING = b"ping\n"
+PONG = b"pong\n"
+MAX_LINE = 4 * 1024 * 1024
+
+
+def raw_chat_key(data: dict):
+    """
+    Returns the chat id of a raw update, or the user id for chat-less updates, like update_processor.chat_key.
+    """
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        user = value.get("from") or value.get("user")
+        if user:
+            return user.get("id")
+    return None
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes, so that chats keep their worker and adding or removing
+    a worker only moves a proportional share of chats.
+    """
+
+    def __init__(self, nodes: list, replicas: int = 64):
+        self._ring = sorted((self._hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas))
+        self._hashes = [value for value, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def node(self, key):
+        index = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+class WorkerDown(Exception):
+    """
+    Raised when a worker process exits or stops answering health checks.
+    """
+
+
+class Worker:
+    """
+    Supervises one worker process: starts it, streams its shard's updates to it, checks its health
+    and restarts it after a crash. Updates that arrive while it is down wait in a bounded buffer.
+    """
+
+    def __init__(self, index: int, port: int, env: dict, health_interval: float = 5.0, health_timeout: float = 15.0,
+                 max_pending: int = 10000):
+        self.index = index
+        self.port = port
+        self.env = env
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.pending = deque()
+        self.max_pending = max_pending
+        self.restarts = 0
+        self.dropped = 0
+        self.process = None
+        self._writer = None
+        self._last_pong = 0.0
+        self._wakeup = asyncio.Event()
+
+    def send(self, line: bytes) -> None:
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(line)
+        self._wakeup.set()
+
+    async def supervise(self) -> None:
+        """
+        Keeps the worker running until cancelled.
+        """
+        while True:
+            started = time.monotonic()
+            try:
+                await self._run()
+            except (WorkerDown, OSError) as e:
+                logger.warning("Воркер %s зупинився: %s; перезапуск", self.index, e)
+            finally:
+                await self._terminate()
+            self.restarts += 1
+            await asyncio.sleep(1.0 if time.monotonic() - started > 60 else 5.0)
+
+    async def _run(self) -> None:
+        self.process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=self.env)
+        reader, self._writer = await self._connect()
+        self._last_pong = time.monotonic()
+        self._wakeup.set()
+        tasks = [asyncio.create_task(coroutine) for coroutine in
+                 (self._drain(), self._read(reader), self._check_health(), self._wait_exit())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _connect(self):
+        deadline = time.monotonic() + 60
+        while True:
+            if self.process.returncode is not None:
+                raise WorkerDown(f"код виходу {self.process.returncode}")
+            try:
+                return await asyncio.open_connection("127.0.0.1", self.port, limit=MAX_LINE)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise WorkerDown("не відкрив порт для оновлень")
+                await asyncio.sleep(0.1)
+
+    async def _drain(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending:
+                batch = [self.pending.popleft() for _ in range(min(len(self.pending), 256))]
+                self._writer.write(b"".join(batch))
+                try:
+                    await self._writer.drain()
+                except OSError:
+                    self.pending.extendleft(reversed(batch))
+                    raise
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while line := await reader.readline():
+            if line == PONG:
+                self._last_pong = time.monotonic()
+        raise WorkerDown("закрив з'єднання")
+
+    async def _check_health(self) -> None:
+        while True:
+            self._writer.write(PING)
+            await asyncio.sleep(self.health_interval)
+            if time.monotonic() - self._last_pong > self.health_timeout:
+                raise WorkerDown("не відповідає на перевірку стану")
+
+    async def _wait_exit(self) -> None:
+        raise WorkerDown(f"код виходу {await self.process.wait()}")
+
+    async def _terminate(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 30)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+
+class Front:
+    """
+    Receives updates by long polling or webhook and routes each one to the worker that owns its chat.
+    Budgets maps environment variables of limits shared by the whole bot to their values, which the workers split.
+    """
+
+    def __init__(self, token: str, api_base_url: str | None, workers: int, base_port: int,
+                 health_interval: float = 5.0, health_timeout: float = 15.0, budgets: dict | None = None):
+        self.api_url = f"{api_base_url or 'https://api.telegram.org/bot'}{token}"
+        self.workers = [
+            Worker(index, base_port + index, worker_env(index, base_port + index, workers, budgets),
+                   health_interval, health_timeout)
+            for index in range(workers)
+        ]
+        self.ring = HashRing(list(range(workers)))
+        self.routed = 0
+
+    def dispatch(self, body: bytes, data: dict) -> None:
+        key = raw_chat_key(data)
+        worker = self.workers[self.ring.node(key if key is not None else data.get("update_id"))]
+        if b"\n" in body:
+            body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        worker.send(body + b"\n")
+        self.routed += 1
+
+    def collect_metrics(self) -> list:
+        return [
+            ("bot_front_routed_total", "counter", "Updates routed to workers.", {(): self.routed}),
+            ("bot_worker_pending", "gauge", "Updates waiting to be sent to a worker.",
+             {(("worker", worker.index),): len(worker.pending) for worker in self.workers}),
+            ("bot_worker_restarts_total", "counter", "Worker restarts after a crash or failed health check.",
+             {(("worker", worker.index),): worker.restarts for worker in self.workers}),
+            ("bot_worker_dropped_total", "counter", "Updates dropped because a worker's buffer was full.",
+             {(("worker", worker.index),): worker.dropped for worker in self.workers}),
+        ]
+
+    async def poll(self, client: httpx.AsyncClient, allowed_updates: list, drop_pending_updates: bool) -> None:
+        """
+        Fetches updates with getUpdates and acknowledges them once they are queued for their worker.
+        """
+        await client.post(f"{self.api_url}/deleteWebhook", json={"drop_pending_updates": drop_pending_updates})
+        offset = None
+        while True:
+            try:
+                response = await client.post(
+                    f"{self.api_url}/getUpdates",
+                    json={"offset": offset, "timeout": 30, "allowed_updates": allowed_updates},
+                    timeout=40
+                )
+                updates = response.json()["result"]
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                logger.warning("Помилка отримання оновлень: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for data in updates:
+                self.dispatch(json.dumps(data, separators=(",", ":")).encode("utf-8"), data)
+                offset = data["update_id"] + 1
+
+    async def serve_webhook(self, client: httpx.AsyncClient, listen: str, port: int, url_path: str,
+                            webhook_url: str | None, secret_token: str | None, allowed_updates: list,
+                            drop_pending_updates: bool):
+        """
+        Accepts webhook requests and registers the webhook with the Bot API.
+        """
+        import tornado.httpserver
+        import tornado.web
+
+        front = self
+
+        class WebhookHandler(tornado.web.RequestHandler):
+            def post(self):
+                if secret_token and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+                    self.set_status(403)
+                    return
+                try:
+                    data = json.loads(self.request.body)
+                except ValueError:
+                    self.set_status(400)
+                    return
+                front.dispatch(self.request.body, data)
+
+        server = tornado.httpserver.HTTPServer(tornado.web.Application([(f"/{url_path.strip('/')}", WebhookHandler)]))
+        server.listen(port, listen)
+        await client.post(f"{self.api_url}/setWebhook", json={
+            "url": webhook_url or f"https://{listen}:{port}/{url_path.strip('/')}",
+            "secret_token": secret_token,
+            "allowed_updates": allowed_updates,
+            "drop_pending_updates": drop_pending_updates,
+        })
+        return server
+
+
+def worker_env(index: int, port: int, workers: int = 1, budgets: dict | None = None) -> dict:
+    """
+    Environment of a worker process: worker mode on its own port, with its own log file and metrics port.
+    Budgets shared by the whole bot, such as the global Bot API rate, are split evenly between the workers.
+    """
+    env = {**os.environ, "BOT_MODE": "worker", "BOT_WORKERS": "1", "WORKER_PORT": str(port), "WORKER_INDEX": str(index)}
+    log_file = os.environ.get("LOG_FILE", "bot.log")
+    if log_file:
+        stem, extension = os.path.splitext(log_file)
+        env["LOG_FILE"] = f"{stem}.worker{index}{extension}"
+    metrics_port = int(os.environ.get("METRICS_PORT", "0") or 0)
+    env["METRICS_PORT"] = str(metrics_port + 1 + index if metrics_port else 0)
+    for name, value in (budgets or {}).items():
+        env[name] = str(max(1, value // workers) if isinstance(value, int) else value / workers)
+    return env
+
+
+async def serve_updates(application, host: str, port: int) -> asyncio.Server:
+    """
+    Worker side: feeds update lines from the front into the application's update queue and answers pings.
+    """
+    from telegram import Update
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                if line == PING:
+                    writer.write(PONG)
+                    continue
+                await application.update_queue.put(Update.de_json(json.loads(line), application.bot))
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port, limit=MAX_LINE)
+
+
+async def wait_for_signal(parent_pid: int | None = None) -> None:
+    """
+    Returns once the process receives SIGINT or SIGTERM or, when parent_pid is given, once that parent
+    is gone, so that workers do not outlive a killed front process.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            if parent_pid is not None and os.getppid() != parent_pid:
+                return
@@ -0,0 +1,227 @@
+"""
+Concurrent update processing that keeps updates of the same chat in order and GPT work apart from navigation.
+"""
+import asyncio
+import itertools
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+GPT = "gpt"
+
+
+def chat_key(update: object):
+    """
+    Returns the id that defines ordering for an update: the chat, or the user for chat-less updates.
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates of different chats in parallel while handling each chat's updates one by one.
+
+    Updates for a chat that is already busy are queued behind it instead of holding a concurrency slot,
+    so a single noisy chat occupies at most one slot. With max_queued_per_chat set, the oldest queued update
+    is dropped once a chat has that many waiting.
+
+    With max_gpt_updates and a classify function set, updates classified as GPT get a lane of their own in
+    every chat. They are processed in the background, at most max_gpt_updates at a time, and never hold a
+    concurrency slot, so interactive updates (commands, menu buttons) are not delayed by them and overtake
+    them within the chat, while a GPT update still waits for the interactive ones received before it.
+    cancel_pending stops a chat's GPT updates that are running or still queued.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_queued_per_chat: int = 0, max_gpt_updates: int = 0,
+                 classify=None):
+        super().__init__(max_concurrent_updates)
+        self.max_queued_per_chat = max_queued_per_chat
+        self.classify = classify if max_gpt_updates > 0 else None
+        self.dropped = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self._queues = {}
+        self._running = {}
+        self._last_interactive = {}
+        self._received = itertools.count()
+        self._gpt_slots = asyncio.Semaphore(max_gpt_updates) if max_gpt_updates > 0 else None
+        self._drains = set()
+
+    @property
+    def busy_chats(self) -> int:
+        """
+        Number of chats with an update currently being processed.
+        """
+        return len({key for _, key in self._queues})
+
+    def take_queued_texts(self, key) -> list:
+        """
+        Removes the plain text messages queued right behind the update being processed for the chat
+        and returns their texts, so that the running handler can answer them together. Messages sent after
+        a command or button that came in behind the running update are left alone.
+        """
+        lane = GPT if (GPT, key) in self._queues else INTERACTIVE
+        queue = self._queues.get((lane, key))
+        texts = []
+        while queue and len(queue) > 1:
+            update = queue[1][0]
+            message = update.message if isinstance(update, Update) else None
+            if message is None or not message.text or message.text.startswith("/"):
+                break
+            if lane == GPT and queue[1][2] is not queue[0][2]:
+                break
+            self._discard(lane, key, queue[1])
+            del queue[1]
+            texts.append(message.text)
+        self.coalesced += len(texts)
+        return texts
+
+    def cancel_pending(self, key) -> int:
+        """
+        Cancels the chat's GPT update being processed and drops its queued ones received before the chat's
+        interactive update being processed, i.e. the command leaving the mode; messages sent after it are kept.
+        Called from the running GPT update itself, it does nothing. Returns how many updates were stopped.
+        """
+        running = self._running.get(key)
+        queue = self._queues.get((GPT, key))
+        if running is asyncio.current_task() or not queue:
+            return 0
+        current = self._queues.get((INTERACTIVE, key))
+        since = current[0][3] if current else None
+        stopped = 0
+        for entry in list(queue)[1 if running is not None else 0:]:
+            if since is None or entry[3] < since:
+                queue.remove(entry)
+                self._discard(GPT, key, entry)
+                stopped += 1
+        if running is not None and not running.cancelling():
+            running.cancel()
+            stopped += 1
+        self.cancelled += stopped
+        return stopped
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        # The third item of an entry is a future: for an interactive update, resolved once it is finished;
+        # for a GPT update, the one of the last interactive update received before it, which it waits for.
+        # The fourth is the order in which the updates were received.
+        received = next(self._received)
+        if self.classify is None:
+            lane, entry = INTERACTIVE, (update, coroutine, None, received)
+        elif self.classify(update) == GPT:
+            lane, entry = GPT, (update, coroutine, self._last_interactive.get(key), received)
+        else:
+            lane, entry = INTERACTIVE, (update, coroutine, asyncio.get_running_loop().create_future(), received)
+            self._last_interactive[key] = entry[2]
+        queue = self._queues.get((lane, key))
+        if queue is not None:
+            if self.max_queued_per_chat and len(queue) > self.max_queued_per_chat:
+                self._discard(lane, key, queue[1])
+                del queue[1]
+                self.dropped += 1
+                logger.warning("Черга чату %s переповнена, найстаріше оновлення відкинуто", key)
+            queue.append(entry)
+            return
+        queue = self._queues[lane, key] = deque([entry])
+        if lane == INTERACTIVE:
+            await self._drain(lane, key, queue)
+            return
+        task = asyncio.create_task(self._drain(lane, key, queue))
+        self._drains.add(task)
+        task.add_done_callback(self._drains.discard)
+
+    async def _drain(self, lane: str, key, queue: deque) -> None:
+        """
+        Processes the updates of one chat's lane one by one until the lane is empty. A GPT update starts only
+        after the chat's interactive updates received before it, e.g. the command that switched the mode.
+        """
+        try:
+            while queue:
+                if lane == INTERACTIVE:
+                    await self._run(key, queue[0][1])
+                    self._finish(queue.popleft()[2])
+                    continue
+                after = queue[0][2]
+                if after is not None and not after.done():
+                    await after
+                    continue
+                async with self._gpt_slots:
+                    if queue and (queue[0][2] is None or queue[0][2].done()):
+                        await self._run(key, queue[0][1], track=True)
+                        queue.popleft()
+        finally:
+            del self._queues[lane, key]
+            for entry in queue:
+                self._discard(lane, key, entry)
+            if (GPT, key) not in self._queues and (INTERACTIVE, key) not in self._queues:
+                self._last_interactive.pop(key, None)
+
+    def _discard(self, lane: str, key, entry: tuple) -> None:
+        """
+        Drops an update that will not be processed.
+        """
+        entry[1].close()
+        if lane == INTERACTIVE:
+            self._finish(entry[2])
+
+    @staticmethod
+    def _finish(done) -> None:
+        if done is not None:
+            done.set_result(None)
+
+    async def _run(self, key, coroutine, track: bool = False) -> None:
+        if not track:
+            try:
+                await coroutine
+            except Exception as e:
+                logger.error("Помилка обробки оновлення для чату %s: %s", key, e)
+            return
+        task = self._running[key] = asyncio.ensure_future(coroutine)
+        try:
+            await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            logger.info("Обробку запиту до GPT для чату %s скасовано", key)
+        except Exception as e:
+            logger.error("Помилка обробки оновлення для чату %s: %s", key, e)
+        finally:
+            del self._running[key]
+
+    def collect_metrics(self) -> list:
+        return [
+            ("bot_chats_busy", "gauge", "Chats with an update being processed.", {(): self.busy_chats}),
+            ("bot_chat_queue_dropped_total", "counter", "Queued updates dropped because a chat's queue was full.",
+             {(): self.dropped}),
+            ("bot_chat_messages_coalesced_total", "counter", "Queued messages merged into the request before them.",
+             {(): self.coalesced}),
+            ("bot_gpt_updates_cancelled_total", "counter", "GPT updates stopped because the user left the mode.",
+             {(): self.cancelled}),
+            ("bot_updates_pending", "gauge", "Updates being processed or queued per priority class.",
+             {(("class", lane),): sum(len(queue) for (queue_lane, _), queue in self._queues.items()
+                                      if queue_lane == lane) for lane in (INTERACTIVE, GPT)}),
+        ]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        """
+        Waits for the GPT updates still being processed in the background.
+        """
+        if self._drains:
+            await asyncio.gather(*self._drains, return_exceptions=True)
@@ -1,21 +1,185 @@
 """
-Utility functions for the Telegram bot, including message loading, sending text/images, and menu management.
+Utility functions for the Telegram bot, including message loading, sending text/images, menu management
+and pacing of outgoing Bot API calls.
 """
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
 import os
-from telegram.ext import ContextTypes
-from telegram.constants import ParseMode
-from telegram import (Update, BotCommand, BotCommandScopeChat, MenuButtonCommands, InlineKeyboardButton,
-                      InlineKeyboardMarkup)
+import tempfile
+import time
+from telegram.ext import BaseRateLimiter, ContextTypes
+from telegram.constants import ChatAction, ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram import (Bot, Update, BotCommand, BotCommandScopeChat, MenuButtonCommands, InlineKeyboardButton,
+                      InlineKeyboardMarkup, InputFile)
+
+from admission import TokenBucket
+from config import IMAGE_CACHE_PATH
+from formatting import markdown_to_html, split_markdown
+from resource_registry import ResourceRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache:
+    """
+    Persistent map of image name to the Telegram file_id of its last upload, invalidated by content hash.
+    The file is read once at startup and rewritten in a worker thread through a temporary file of this
+    process, so several worker processes never publish each other's partial writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = {}
+        self._lock = asyncio.Lock()
+
+    def load(self) -> None:
+        """
+        Reads the cache file, if there is a valid one.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self._entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+
+    def _write(self, entries: dict) -> None:
+        directory, name = os.path.split(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, prefix=f"{name}.", suffix=".tmp",
+                                         delete=False) as file:
+            tmp_path = file.name
+            try:
+                json.dump(entries, file, ensure_ascii=False, indent=2)
+            except BaseException:
+                file.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, self.path)
+
+    async def _save(self) -> None:
+        async with self._lock:
+            try:
+                await asyncio.to_thread(self._write, dict(self._entries))
+            except OSError as e:
+                logger.warning("Не вдалося зберегти кеш зображень: %s", e)
+
+    def get(self, name: str, digest: str) -> str | None:
+        """
+        Returns the cached file_id for the image if it was uploaded with the same content.
+        """
+        entry = self._entries.get(name)
+        if entry and entry.get("hash") == digest:
+            return entry.get("file_id")
+        return None
+
+    async def put(self, name: str, digest: str, file_id: str) -> None:
+        """
+        Remembers the file_id of an uploaded image and persists the cache.
+        """
+        self._entries[name] = {"hash": digest, "file_id": file_id}
+        await self._save()
+
+    async def forget(self, name: str) -> None:
+        """
+        Drops a file_id that Telegram no longer accepts.
+        """
+        if self._entries.pop(name, None) is not None:
+            await self._save()
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    Paces Bot API calls to stay under Telegram's flood limits: a global rate for all calls and a per-chat rate
+    for messages and edits, stricter for groups. A 429 with retry_after pauses all sending for that long
+    and retries the call, up to max_retries times. A rate of 0 disables that limit.
+    """
+
+    MESSAGE_METHODS = ("send", "edit", "copy", "forward")
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, group_burst: float = 5.0, max_retries: int = 3,
+                 max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate) if global_rate > 0 else None
+        self.chat_limit = (chat_rate, chat_burst)
+        self.group_limit = (group_rate, group_burst)
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.waited = 0.0
+        self.flood_waits = 0
+        self._chats = {}
+        self._paused_until = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id) -> TokenBucket | None:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            rate, burst = self.group_limit if isinstance(chat_id, str) or chat_id < 0 else self.chat_limit
+            if rate <= 0:
+                return None
+            now = time.monotonic()
+            if len(self._chats) >= self.max_chats:
+                self._chats = {key: value for key, value in self._chats.items() if not value.full(now)}
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst, now=now)
+        return bucket
+
+    async def _wait(self, bucket: TokenBucket | None) -> None:
+        while True:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, bucket.wait_time(now) if bucket is not None else 0.0)
+            if wait <= 0:
+                break
+            self.waited += wait
+            await asyncio.sleep(wait)
+        if bucket is not None:
+            bucket.take()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        chat_id = data.get("chat_id")
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        paced = chat_id is not None and endpoint.startswith(self.MESSAGE_METHODS) and endpoint != "sendChatAction"
+        for attempt in range(max_retries + 1):
+            if paced:
+                await self._wait(self._chat_bucket(chat_id))
+            await self._wait(self.global_bucket)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if isinstance(retry_after, datetime.timedelta) else retry_after
+                self.flood_waits += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay + 0.1)
+                logger.warning("Telegram обмежив %s, пауза %.1f с", endpoint, delay)
+
+    def collect_metrics(self) -> list:
+        return [
+            ("bot_telegram_paced_seconds_total", "counter", "Time Bot API calls waited for rate limits.",
+             {(): round(self.waited, 3)}),
+            ("bot_telegram_flood_waits_total", "counter", "Bot API calls answered with 429 and retried.",
+             {(): self.flood_waits}),
+        ]
+
+
+image_cache = ImageCache(IMAGE_CACHE_PATH)
+registry = ResourceRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources'))
 
 
 def load_message(name: str) -> str:
     """
-    Loads a message template from the resources/messages directory.
+    Returns a message template from the resources/messages directory.
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    message_path = os.path.join(current_dir, 'resources', 'messages', f'{name}.txt')
-    with open(message_path, "r", encoding="utf-8") as file:
-        return file.read()
+    return registry.message(name)
 
 
 async def send_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
@@ -32,55 +196,164 @@ async def send_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: st
 
 async def send_image(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str):
     """
-    Sends a photo from the resources/images directory to the user.
+    Sends a photo from the resources/images directory to the user, reusing the Telegram file_id
+    of a previous upload when the image has not changed.
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    image_path = os.path.join(current_dir, 'resources', 'images', f'{name}.jpg')
-    with open(image_path, 'rb') as image:
-        return await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=image
+    image = registry.image(name)
+    file_id = image_cache.get(name, image.digest)
+    if file_id:
+        try:
+            return await context.bot.send_photo(
+                chat_id=update.effective_chat.id,
+                photo=file_id
+            )
+        except BadRequest as e:
+            logger.warning("Застарілий file_id для зображення %s, завантажую повторно: %s", name, e)
+            await image_cache.forget(name)
+    message = await context.bot.send_photo(
+        chat_id=update.effective_chat.id,
+        photo=InputFile(image.data, filename=f'{name}.jpg')
+    )
+    if message.photo:
+        await image_cache.put(name, image.digest, message.photo[-1].file_id)
+    return message
+
+
+class MenuRegistry:
+    """
+    Remembers which version of the command menu the bot-wide default and each chat already have, so that
+    the Bot API calls are only repeated when the menu definition changes. With a backend the versions
+    survive restarts; the in-memory part is a cache that is dropped when it grows past max_scopes.
+    """
+
+    DEFAULT_SCOPE = "default"
+
+    def __init__(self, backend=None, max_scopes: int = 100000):
+        self.backend = backend
+        self.max_scopes = max_scopes
+        self.registered = 0
+        self.skipped = 0
+        self._versions = {}
+
+    @staticmethod
+    def version(commands: dict) -> str:
+        return hashlib.sha256(json.dumps(commands, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+    async def is_current(self, scope, version: str) -> bool:
+        scope = str(scope)
+        if scope not in self._versions:
+            if len(self._versions) >= self.max_scopes:
+                self._versions.clear()
+            stored = await asyncio.to_thread(self.backend.load_menu_version, scope) if self.backend else None
+            self._versions[scope] = stored
+        current = self._versions[scope] == version
+        if current:
+            self.skipped += 1
+        return current
+
+    async def mark(self, scope, version: str) -> None:
+        scope = str(scope)
+        self._versions[scope] = version
+        self.registered += 1
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.save_menu_version, scope, version)
+
+    def collect_metrics(self) -> list:
+        return [
+            ("bot_menu_registrations_total", "counter", "Command menu registrations by outcome.",
+             {(("outcome", "registered"),): self.registered, (("outcome", "skipped"),): self.skipped}),
+        ]
+
+
+def command_list(commands: dict) -> list:
+    return [BotCommand(command=key, description=value) for key, value in commands.items()]
+
+
+async def register_default_menu(bot: Bot, commands: dict, menus: MenuRegistry) -> None:
+    """
+    Sets the bot-wide command list and menu button at startup, unless they already have this version.
+    """
+    version = menus.version(commands)
+    if await menus.is_current(MenuRegistry.DEFAULT_SCOPE, version):
+        return
+    try:
+        await asyncio.gather(
+            bot.set_my_commands(command_list(commands)),
+            bot.set_chat_menu_button(menu_button=MenuButtonCommands())
         )
+    except TelegramError as e:
+        logger.warning("Не вдалося встановити меню команд: %s", e)
+        return
+    await menus.mark(MenuRegistry.DEFAULT_SCOPE, version)
 
 
-async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, commands: dict):
+async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, commands: dict,
+                         menus: MenuRegistry | None = None):
     """
-    Sets up the bot's command menu for the current chat.
+    Sets up the bot's command menu for the current chat; both calls are sent at once. With a registry,
+    nothing is sent when the chat already has this version of the menu.
     """
-    command_list = [
-        BotCommand(command=key, description=value)
-        for key, value in commands.items()
-    ]
-    await context.bot.set_my_commands(
-        command_list,
-        scope=BotCommandScopeChat(chat_id=update.effective_chat.id)
-    )
-    await context.bot.set_chat_menu_button(
-        menu_button=MenuButtonCommands(),
-        chat_id=update.effective_chat.id
+    chat_id = update.effective_chat.id
+    version = menus.version(commands) if menus is not None else None
+    if menus is not None and await menus.is_current(chat_id, version):
+        return
+    await asyncio.gather(
+        context.bot.set_my_commands(
+            command_list(commands),
+            scope=BotCommandScopeChat(chat_id=chat_id)
+        ),
+        context.bot.set_chat_menu_button(
+            menu_button=MenuButtonCommands(),
+            chat_id=chat_id
+        )
     )
+    if menus is not None:
+        await menus.mark(chat_id, version)
+
+
+async def with_typing(update: Update, context: ContextTypes.DEFAULT_TYPE, awaitable, interval: float = 4.5):
+    """
+    Awaits the awaitable while the chat shows the bot as typing, which replaces a separate placeholder
+    message. The status expires after five seconds, so it is renewed every interval.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            try:
+                await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
+            except TelegramError as e:
+                logger.debug("Не вдалося показати статус набору: %s", e)
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                return task.result()
+    finally:
+        task.cancel()
 
 
 def load_prompt(name: str):
     """
-    Loads a prompt template from the resources/prompts directory.
+    Returns a prompt template from the resources/prompts directory.
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    prompt_path = os.path.join(current_dir, 'resources', 'prompts', f'{name}.txt')
-    with open(prompt_path, "r", encoding="utf-8") as file:
-        return file.read()
+    return registry.prompt(name)
 
 
-async def send_text_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, buttons: dict):
+def build_keyboard(buttons: dict) -> InlineKeyboardMarkup:
     """
-    Sends a text message with inline keyboard buttons.
+    Builds an inline keyboard with one button per row.
     """
-    text = text.encode('utf8', errors='surrogatepass').decode('utf8')
     keyboard = []
     for key, value in buttons.items():
         button = InlineKeyboardButton(str(value), callback_data=str(key))
         keyboard.append([button])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def send_text_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, buttons: dict):
+    """
+    Sends a text message with inline keyboard buttons.
+    """
+    text = text.encode('utf8', errors='surrogatepass').decode('utf8')
+    reply_markup = build_keyboard(buttons)
     return await context.bot.send_message(
         chat_id=update.effective_message.chat_id,
         text=text,
@@ -88,3 +361,110 @@ async def send_text_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE,
         parse_mode=ParseMode.HTML,
         message_thread_id=update.effective_message.message_thread_id
     )
+
+
+async def send_chunk(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, formatted: bool = True,
+                     reply_markup=None, message_id: int | None = None):
+    """
+    Sends one chunk of a GPT answer, or edits message_id to it, rendered from Markdown to HTML. If Telegram
+    still rejects the markup the chunk goes out as plain text, so the answer is never lost to formatting.
+    Returns None when an edit left the message unchanged.
+    """
+    chat_id = update.effective_message.chat_id
+    attempts = [(markdown_to_html(text), ParseMode.HTML), (text, None)] if formatted else [(text, None)]
+    for attempt, (body, parse_mode) in enumerate(attempts, 1):
+        try:
+            if message_id is None:
+                return await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=body,
+                    parse_mode=parse_mode,
+                    reply_markup=reply_markup,
+                    message_thread_id=update.effective_message.message_thread_id
+                )
+            return await context.bot.edit_message_text(
+                text=body,
+                chat_id=chat_id,
+                message_id=message_id,
+                parse_mode=parse_mode,
+                reply_markup=reply_markup
+            )
+        except BadRequest as e:
+            if message_id is not None and "not modified" in str(e).lower():
+                return None
+            if attempt == len(attempts):
+                raise
+            logger.warning("Telegram не прийняв розмітку відповіді, надсилаю без неї: %s", e)
+
+
+async def send_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, buttons: dict = None):
+    """
+    Sends a GPT answer of any length as one or more messages, with the inline keyboard on the last one.
+    """
+    chunks = split_markdown(text) or ["..."]
+    message = None
+    for index, chunk in enumerate(chunks, 1):
+        reply_markup = build_keyboard(buttons) if buttons and index == len(chunks) else None
+        message = await send_chunk(update, context, chunk, reply_markup=reply_markup)
+    return message
+
+
+async def send_streaming_text(update: Update, context: ContextTypes.DEFAULT_TYPE, deltas, buttons: dict = None,
+                              prefix: str = "", min_interval: float = 1.0, failure=None):
+    """
+    Renders a stream of text deltas into messages, editing the current one in place at most once per interval.
+    Once the text outgrows a message, the full part gets its final formatting and the stream continues in a new
+    message; the inline keyboard is attached on the final edit of the last one. If the stream of deltas fails after
+    a message was sent, that message is finished with the keyboard and, when failure maps the error to a note, the
+    note is appended and the error is not raised. Errors of the Bot API calls always propagate.
+    """
+    loop = asyncio.get_running_loop()
+    messages = []
+    shown = []
+    finished = 0
+    last_edit = 0.0
+    text = prefix
+
+    async def render(chunks: list, done: bool):
+        nonlocal finished
+        for index in range(finished, len(chunks)):
+            last = index == len(chunks) - 1
+            final = done or not last
+            reply_markup = build_keyboard(buttons) if buttons and done and last else None
+            if index == len(messages):
+                messages.append(await send_chunk(update, context, chunks[index], final, reply_markup))
+                shown.append(chunks[index])
+            elif final or shown[index] != chunks[index]:
+                await send_chunk(update, context, chunks[index], final, reply_markup, messages[index].message_id)
+                shown[index] = chunks[index]
+            if final:
+                finished = index + 1
+
+    error = None
+    try:
+        while True:
+            try:
+                delta = await anext(deltas)
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                error = e
+                break
+            text += delta
+            if not text.strip() or (messages and loop.time() - last_edit < min_interval):
+                continue
+            await render(split_markdown(text), done=False)
+            last_edit = loop.time()
+    finally:
+        await deltas.aclose()
+    if error is not None:
+        if not messages:
+            raise error
+        note = failure(error) if failure is not None else None
+        await render(split_markdown(f"{text}\n\n{note}" if note else text), done=True)
+        if note is None:
+            raise error
+        logger.error("Потокова відповідь обірвалася: %s", error)
+        return messages[-1]
+    await render(split_markdown(text) or ["..."], done=True)
+    return messages[-1]
@@ -0,0 +1,152 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint used by the tests.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeOpenAIServer:
+    """
+    Serves canned chat completions on 127.0.0.1 after an optional artificial delay.
+
+    Faults are consumed one per request: an int is answered as that HTTP status, a (status, headers)
+    pair adds response headers, and ("delay", seconds) overrides the delay for that request.
+    Without scripted faults, jitter adds a uniform random delay and error_rate answers that share
+    of requests with a 500. The answer is cut to max_tokens words, token_delay is added per word of it and
+    model_delays adds a fixed delay per requested model; usage counts words of the request and the answer.
+    """
+
+    def __init__(self, delay: float = 0.0, content: str = "Fake response", faults: list = (),
+                 jitter: float = 0.0, error_rate: float = 0.0, seed: int | None = None, token_delay: float = 0.0,
+                 model_delays: dict | None = None):
+        self.delay = delay
+        self.token_delay = token_delay
+        self.model_delays = model_delays or {}
+        self.content = content
+        self.faults = deque(faults)
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = []
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                server.requests.append(payload)
+                fault = server.next_fault()
+                if isinstance(fault, int):
+                    fault = (fault, {})
+                delay = fault[1] if fault and fault[0] == "delay" else server.delay
+                delay += server.model_delays.get(payload.get("model"), 0.0)
+                delay += server.token_delay * len(server.answer(payload))
+                if server.jitter:
+                    delay += server._random.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+                if fault and fault[0] != "delay":
+                    self.send_error_response(*fault)
+                    return
+                if payload.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    for chunk in server.chunks(payload):
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.close_connection = True
+                    return
+                body = json.dumps(server.completion(payload)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_error_response(self, status: int, headers: dict):
+                body = json.dumps({"error": {"message": "Injected fault", "type": "fault", "code": status}}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def next_fault(self):
+        if self.faults:
+            return self.faults.popleft()
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500
+        return None
+
+    def answer(self, payload: dict) -> list:
+        words = self.content.split(" ")
+        return words[:payload["max_tokens"]] if payload.get("max_tokens") else words
+
+    def usage(self, payload: dict) -> dict:
+        prompt = sum(len(str(message.get("content", "")).split()) for message in payload.get("messages", []))
+        completion = len(self.answer(payload))
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def completion(self, payload: dict) -> dict:
+        return {
+            "id": f"chatcmpl-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(self.answer(payload))},
+                "finish_reason": "stop"
+            }],
+            "usage": self.usage(payload)
+        }
+
+    def chunks(self, payload: dict):
+        base = {
+            "id": f"chatcmpl-{len(self.requests)}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-3.5-turbo")
+        }
+        for word in self.answer(payload):
+            delta = {"content": word + " "}
+            yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**base, "choices": [], "usage": self.usage(payload)}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from src.admission import AdmissionController, AdmissionRejected, parse_limits
+
+
+def test_user_bucket_limits_per_mode_and_notifies_once():
+    controller = AdmissionController(parse_limits("gpt:0.01/2,translator:1/1"))
+    controller.check("gpt", 1)
+    controller.check("gpt", 1)
+    with pytest.raises(AdmissionRejected) as first:
+        controller.check("gpt", 1)
+    with pytest.raises(AdmissionRejected) as second:
+        controller.check("gpt", 1)
+
+    assert first.value.reason == "user" and first.value.notify
+    assert not second.value.notify
+    assert first.value.retry_after > 50
+    controller.check("gpt", 2)
+    controller.check("translator", 1)
+    controller.check("random", 1)
+    assert controller.rejected == {("gpt", "user"): 2}
+
+
+def test_global_bucket_is_shared_by_all_users():
+    controller = AdmissionController(global_rate=0.01, global_burst=3)
+    for user_id in range(3):
+        controller.check("gpt", user_id)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check("gpt", 99)
+    assert rejected.value.reason == "global"
+
+
+async def test_slot_caps_in_flight_calls():
+    controller = AdmissionController(max_in_flight=2, queue_timeout=0.1)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with controller.slot():
+            peak = max(peak, controller.in_flight)
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(call() for _ in range(4)))
+    assert peak == 2
+
+    async with controller.slot(), controller.slot():
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.slot():
+                pass
+    assert rejected.value.reason == "overloaded"
+    assert controller.in_flight == 0
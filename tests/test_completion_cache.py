@@ -0,0 +1,80 @@
+import asyncio
+
+from src.completion_cache import CompletionCache, SQLiteCacheBackend
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def test_identical_requests_are_coalesced_and_cached():
+    cache = CompletionCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "Hello"
+
+    key = cache.key([{"role": "user", "content": "Привіт"}], {"model": "gpt-3.5-turbo"})
+    results = await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(5)))
+    assert await cache.get_or_compute(key, compute) == "Hello"
+
+    assert results == ["Hello"] * 5
+    assert calls == 1
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 4, 1)
+
+
+async def test_shared_computation_is_cancelled_with_its_last_waiter():
+    cache = CompletionCache()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def compute():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "Hello"
+
+    key = cache.key([{"role": "user", "content": "Привіт"}], {"model": "gpt-3.5-turbo"})
+    first = asyncio.create_task(cache.get_or_compute(key, compute))
+    second = asyncio.create_task(cache.get_or_compute(key, compute))
+    await started.wait()
+
+    first.cancel()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+
+    second.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await asyncio.sleep(0)
+    assert key not in cache._inflight
+
+
+async def test_ttl_size_and_disk_backend(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "cache.sqlite3")
+    cache = CompletionCache(max_entries=1, ttl=60, backend=SQLiteCacheBackend(path), clock=clock)
+
+    async def compute():
+        return "value"
+
+    await cache.get_or_compute("a", compute)
+    await cache.get_or_compute("b", compute)
+    assert list(cache._entries) == ["b"]
+
+    restarted = CompletionCache(ttl=60, backend=SQLiteCacheBackend(path), clock=clock)
+    assert await restarted.get_or_compute("a", compute) == "value"
+    assert restarted.hits == 1
+
+    clock.now += 120
+    assert await restarted.get_or_compute("a", compute) == "value"
+    assert restarted.misses == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from src import context_window
+from src.context_window import ContextWindow, message_tokens
+from src.gpt import ChatGPTService
+from src.sessions import SessionStore
+
+
+def make_conversation(turns: int):
+    conversation = SessionStore().reset(1, "System prompt")
+    for i in range(turns):
+        conversation.add("user", f"question {i % 10} " * 20)
+        conversation.add("assistant", f"answer {i % 10} " * 20)
+    return conversation
+
+
+def test_token_estimate_without_tiktoken_does_not_undercount_cyrillic(mocker):
+    mocker.patch.object(context_window, "_encoding", lambda: None)
+    context_window.count_tokens.cache_clear()
+    text = "Розкажи мені, будь ласка, щось цікаве про історію України"
+
+    try:
+        assert context_window.count_tokens(text) > len(text) // 2 + 10
+        assert context_window.count_tokens("Tell me something interesting") >= len("Tell me something interesting") // 4
+    finally:
+        context_window.count_tokens.cache_clear()
+
+
+def test_build_keeps_prompt_and_recent_turns_within_budget():
+    window = ContextWindow(budget=300)
+    conversation = make_conversation(50)
+
+    messages, usage = window.build(conversation, "new question")
+
+    assert messages[0] == {"role": "system", "content": "System prompt"}
+    assert messages[-1] == {"role": "user", "content": "new question"}
+    assert messages[-2]["content"] == conversation.turns[-1][1]
+    assert sum(message_tokens(message["content"]) for message in messages) <= 300
+    assert usage.kept_turns + usage.dropped_turns == 100
+    assert usage.dropped_turns > 0
+
+
+def test_payload_stays_flat_as_history_grows():
+    window = ContextWindow(budget=300)
+    short, _ = window.build(make_conversation(10), "q")
+    long, _ = window.build(make_conversation(1000), "q")
+    assert len(long) == len(short)
+
+
+@pytest.mark.asyncio
+async def test_chat_folds_old_turns_into_summary(mocker):
+    service = ChatGPTService(token="fake_token", context_window=ContextWindow(budget=300, summary_prompt="Summarize"))
+    complete = mocker.patch.object(service, "complete", new=mocker.AsyncMock(return_value="earlier summary"))
+    completion = mocker.MagicMock()
+    completion.choices = [mocker.MagicMock(message=mocker.MagicMock(content="answer " * 20))]
+    mocker.patch.object(service, "create_completion", new=mocker.AsyncMock(return_value=completion))
+    conversation = make_conversation(10)
+
+    await service.chat(conversation, "next question")
+    await asyncio.gather(*service._compacting.values())
+
+    assert complete.call_args.args[0][0] == {"role": "system", "content": "Summarize"}
+    assert conversation.summary.endswith("earlier summary")
+    assert not service.context_window.needs_compaction(conversation)
+    assert conversation.usage.dropped_turns > 0
@@ -0,0 +1,49 @@
+from src.formatting import markdown_to_html, split_markdown, split_segments, text_length
+
+
+def test_split_prefers_paragraphs_and_respects_limit():
+    paragraphs = [f"Paragraph {i} " + "word " * 40 for i in range(20)]
+    chunks = split_markdown("\n\n".join(paragraphs), limit=500)
+
+    assert len(chunks) > 1
+    assert all(text_length(chunk) <= 500 for chunk in chunks)
+    assert all(chunk.startswith("Paragraph") and chunk.endswith("word") for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(" ".join(paragraphs).split())
+
+
+def test_split_reopens_code_blocks_and_counts_utf16():
+    code = "```python\n" + "\n".join(f"    value_{i} = {i}" for i in range(100)) + "\n```"
+    chunks = split_markdown("Intro\n\n" + code, limit=300)
+
+    assert all(chunk.count("```") % 2 == 0 for chunk in chunks)
+    assert all(chunk.startswith("```python\n    value") for chunk in chunks[2:])
+    assert "    value_99 = 99" in chunks[-1]
+
+    emoji = split_markdown("😀" * 300, limit=100)
+    assert all(text_length(chunk) <= 100 for chunk in emoji)
+    assert "".join(emoji) == "😀" * 300
+
+
+def test_markdown_to_html_escapes_and_balances():
+    assert markdown_to_html("**a** <b> & *i* `x<y`") == "<b>a</b> &lt;b&gt; &amp; <i>i</i> <code>x&lt;y</code>"
+    assert markdown_to_html("```py\nif a < b:\n    pass\n```") == (
+        '<pre><code class="language-py">if a &lt; b:\n    pass</code></pre>'
+    )
+    assert markdown_to_html("[a **b](https://x.y) c**") == "[a <b>b](https://x.y) c</b>"
+    assert markdown_to_html("2*3*4 and snake_case") == "2*3*4 and snake_case"
+
+
+def test_split_segments_keeps_layout_for_reassembly():
+    text = "First paragraph. Second sentence.\n\nLine one\nline two\n\n" + "x" * 25
+    parts = split_segments(text, limit=20)
+
+    assert "".join(parts) == text
+    assert all(0 < len(segment) <= 20 for segment in parts[::2])
+    assert parts[:4] == ["First paragraph.", " ", "Second sentence.", "\n\n"]
+    assert split_segments("short\ntext", limit=20) == ["short\ntext"]
+    assert split_segments("  ", limit=20) == []
+
+    text = "Hello there friend. \n! ok"
+    parts = split_segments(text, limit=12)
+    assert "".join(parts) == text
+    assert all(segment.strip() for segment in parts[::2])
@@ -1,6 +1,10 @@
+import asyncio
+import time
+
 import pytest
 from unittest.mock import MagicMock
 from src.gpt import ChatGPTService
+from tests.fake_openai import FakeOpenAIServer
 
 
 @pytest.fixture
@@ -19,10 +23,99 @@ def test_set_prompt(gpt_service):
 async def test_send_question(gpt_service, mocker):
     mock_response = MagicMock()
     mock_response.choices = [MagicMock(message=MagicMock(content="AI Response"))]
+    mock_response.usage = None
 
-    mocker.patch.object(gpt_service.client.chat.completions, 'create', return_value=mock_response)
+    mocker.patch.object(gpt_service.client.chat.completions, 'create', new=mocker.AsyncMock(return_value=mock_response))
 
     result = await gpt_service.send_question("System prompt", "User question")
 
     assert result == "AI Response"
-    assert len(gpt_service.message_list) == 3
\ No newline at end of file
+    assert len(gpt_service.message_list) == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_send_question_does_not_serialize():
+    delay, concurrency = 0.5, 10
+    with FakeOpenAIServer(delay=delay) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            service.send_question("System prompt", f"Question {i}") for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        await service.aclose()
+
+    assert results == ["Fake response"] * concurrency
+    assert len(server.requests) == concurrency
+    assert elapsed < delay * 3
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_yields_deltas_and_records_turns():
+    from src.sessions import SessionStore
+
+    with FakeOpenAIServer(content="Hello from stream") as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url)
+        conversation = SessionStore().reset(1, "System prompt")
+        deltas = [delta async for delta in service.chat_stream(conversation, "Question")]
+        await service.aclose()
+
+    assert deltas == ["Hello ", "from ", "stream "]
+    assert server.requests[0]["stream"] is True
+    assert conversation.turns == [("user", "Question"), ("assistant", "Hello from stream ")]
+
+
+def test_generation_profiles_parse_and_adapt_to_input():
+    from src.context_window import count_tokens
+    from src.profiles import parse_profiles
+
+    profiles = parse_profiles("translator: model=fast max_tokens=100 stop=END|###; *: fallback=faster slo=2; "
+                              "quiz: temperature=0")
+    assert profiles["translator"].params("fast", "Привіт") == {
+        "model": "fast", "max_tokens": 64 + 2 * count_tokens("Привіт"), "temperature": 0.3, "stop": ["END", "###"]
+    }
+    assert profiles["translator"].output_limit("word " * 1000) == 100
+    assert profiles["random"].fallback == "faster" and profiles["default"].slo == 2
+    assert profiles["quiz"].max_tokens == 3000 and profiles["quiz"].temperature == 0
+    with pytest.raises(ValueError):
+        parse_profiles("gpt: colour=blue")
+
+
+@pytest.mark.asyncio
+async def test_mode_falls_back_to_faster_model_while_missing_latency_slo():
+    from src.profiles import GenerationProfile
+
+    profiles = {"default": GenerationProfile(),
+                "random": GenerationProfile(model="slow", max_tokens=1, fallback="fast", slo=0.1)}
+    with FakeOpenAIServer(model_delays={"slow": 0.2}) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, profiles=profiles, slo_window=2,
+                                 slo_miss_ratio=0.5, slo_cooldown=0.5)
+        for _ in range(4):
+            assert await service.send_question("System prompt", "Question", mode="random") == "Fake"
+        await asyncio.sleep(0.5)
+        await service.send_question("System prompt", "Question", mode="random")
+        await service.send_question("System prompt", "Question")
+        await service.aclose()
+
+    assert [request["model"] for request in server.requests] == ["slow", "slow", "fast", "fast", "slow",
+                                                                 "gpt-3.5-turbo"]
+    assert server.requests[0]["max_tokens"] == 1 and server.requests[-1]["max_tokens"] == 3000
+
+
+@pytest.mark.asyncio
+async def test_primary_model_timeouts_count_as_latency_slo_misses():
+    from src.profiles import GenerationProfile
+    from src.resilience import RetryPolicy
+
+    profiles = {"default": GenerationProfile(),
+                "random": GenerationProfile(model="slow", max_tokens=1, fallback="fast", slo=5)}
+    with FakeOpenAIServer(model_delays={"slow": 1.0}) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, profiles=profiles, slo_window=2,
+                                 slo_miss_ratio=0.5, retry_policy=RetryPolicy(max_attempts=1, attempt_timeout=0.1))
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await service.send_question("System prompt", "Question", mode="random")
+        assert await service.send_question("System prompt", "Question", mode="random") == "Fake"
+        await service.aclose()
+
+    assert [request["model"] for request in server.requests] == ["slow", "slow", "fast"]
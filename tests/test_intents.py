@@ -0,0 +1,35 @@
+from src.intents import Intent, IntentMatcher
+
+
+def make_matcher(**kwargs):
+    return IntentMatcher([
+        Intent("translator", stems=("переклад", "перекласт", "translat"), aliases=("translate",)),
+        Intent("random", stems=("факт", "цікав"), aliases=("random",)),
+        Intent("gpt", stems=("питанн", "запит")),
+    ], **kwargs)
+
+
+def test_stems_match_inflections_and_aliases_weigh_more():
+    matcher = make_matcher()
+    assert matcher.classify("Перекладіть, будь ласка").name == "translator"
+    assert matcher.classify("Translation needed").name == "translator"
+    assert matcher.classify("Розкажи цікаві факти").score == 2.0
+    assert matcher.classify("random").score == 2.0
+    assert matcher.classify("непереклад") is None
+
+
+def test_one_typo_is_matched_fuzzily():
+    matcher = make_matcher()
+    for text in ("перкладач", "прекладач", "пеерклад", "питаня"):
+        match = matcher.classify(text)
+        assert match.fuzzy and match.score == 0.8, text
+    assert matcher.classify("пркладач") is None
+    assert make_matcher(threshold=0.9).classify("перкладач") is None
+
+
+def test_best_score_wins_and_ties_go_to_the_first_intent():
+    matcher = make_matcher()
+    assert matcher.classify("запит про факт і ще один факт").name == "random"
+    assert matcher.classify("питання про переклад").name == "translator"
+    assert matcher.classify("привіт") is None
+    assert IntentMatcher([]).classify("будь-що") is None
@@ -0,0 +1,38 @@
+import json
+import logging
+import queue
+from types import SimpleNamespace
+
+from src import logging_setup as log
+
+
+def test_records_carry_update_context_and_respect_sampling():
+    records = queue.SimpleQueue()
+    handler = log.LazyQueueHandler(records)
+    handler.addFilter(log.ContextFilter())
+    logger = logging.getLogger("test_logging_setup")
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    update = SimpleNamespace(update_id=7, effective_user=SimpleNamespace(id=42), effective_chat=SimpleNamespace(id=-1))
+    try:
+        token = log.bind_update(update, "message_handler")
+        logger.info("Користувач %s надіслав: %.5s", 42, "довгий текст", extra={"latency_ms": 1.5})
+        log.update_context.reset(token)
+
+        log.sample_rate = 0.0
+        token = log.bind_update(update, "message_handler")
+        logger.info("dropped")
+        logger.warning("kept")
+        log.update_context.reset(token)
+    finally:
+        log.sample_rate = 1.0
+        logger.removeHandler(handler)
+
+    formatter = log.JsonFormatter()
+    first = json.loads(formatter.format(records.get_nowait()))
+    assert first["message"] == "Користувач 42 надіслав: довги"
+    assert (first["update_id"], first["user_id"], first["chat_id"]) == (7, 42, -1)
+    assert first["handler"] == "message_handler" and first["latency_ms"] == 1.5
+    assert json.loads(formatter.format(records.get_nowait()))["message"] == "kept"
+    assert records.empty()
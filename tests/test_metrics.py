@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from src.gpt import ChatGPTService, metrics
+from tests.fake_openai import FakeOpenAIServer
+
+
+async def test_histogram_render_and_handler_instrumentation():
+    registry = metrics.MetricsRegistry()
+    latency = registry.histogram("test_latency_seconds", "Test latency.", ("handler",))
+    latency.observe("start", value=0.02)
+    latency.observe("start", value=3.0)
+    registry.register_collector(lambda: [("test_hits_total", "counter", "Test hits.", {(("outcome", "hit"),): 7})])
+    text = registry.render()
+    assert 'test_latency_seconds_bucket{handler="start",le="0.025"} 1' in text
+    assert 'test_latency_seconds_bucket{handler="start",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{handler="start"} 2' in text
+    assert 'test_hits_total{outcome="hit"} 7' in text
+
+    async def failing(update, context):
+        raise ValueError("boom")
+
+    wrapped = metrics.instrument_handler(failing)
+    with pytest.raises(ValueError):
+        await wrapped(None, None)
+    assert metrics.handler_errors.values[("failing", "ValueError")] == 1
+    assert metrics.handler_in_flight.values[("failing",)] == 0
+
+
+async def test_upstream_spans_tokens_and_endpoint():
+    with FakeOpenAIServer() as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url)
+        metrics.set_tracing(True)
+        traced = {}
+
+        async def handler(update, context):
+            await service.send_question("System prompt", "Question")
+            traced.update(metrics.current_trace.get())
+
+        tokens_before = metrics.gpt_tokens.values.get(("completion",), 0)
+        http = await metrics.start_metrics_server("127.0.0.1", 0)
+        try:
+            await metrics.instrument_handler(handler)(None, None)
+            port = http.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /trace?enabled=0 HTTP/1.1\r\nHost: x\r\n\r\n")
+            response = await reader.read()
+        finally:
+            http.close()
+            metrics.set_tracing(False)
+            await service.aclose()
+
+    assert [span["kind"] for span in traced["spans"]] == ["openai"]
+    assert metrics.gpt_tokens.values[("completion",)] > tokens_before
+    assert response.startswith(b"HTTP/1.1 200 OK") and b'"trace_enabled": false' in response
+    assert metrics.trace_enabled is False
+
+
+def test_startup_timer_reports_phases_and_total():
+    timer = metrics.StartupTimer(metrics.time.perf_counter())
+    timer.mark("import")
+    timer.mark("resources")
+    phases = timer.report()
+
+    assert list(phases) == ["import", "resources", "ready"]
+    assert phases["ready"] >= phases["import"] + phases["resources"] - 0.001
+    assert metrics.startup_seconds.values[("ready",)] == phases["ready"]
+
+
+def test_handlers_import_does_not_build_services():
+    from src import handlers
+    from services import services
+
+    assert handlers.services is services
+    assert not services.built("chatgpt")
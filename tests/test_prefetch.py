@@ -0,0 +1,53 @@
+import asyncio
+import itertools
+
+from src.prefetch import PrefetchPool
+
+
+def make_producer(delay: float = 0.0):
+    counter = itertools.count(1)
+
+    async def produce():
+        await asyncio.sleep(delay)
+        return f"fact {next(counter)}"
+    return produce
+
+
+async def test_pool_refills_in_background_and_serves_instantly():
+    pool = PrefetchPool(capacity=3, low_water=1)
+    produce = make_producer(delay=0.01)
+
+    assert await pool.take("random", 1, produce) == "fact 1"
+    await asyncio.gather(*pool._refills.values())
+
+    assert len(pool._pools["random"]) == 3
+    assert pool.pop("random", 1, produce) == "fact 2"
+    assert pool.hits == 1
+
+
+async def test_miss_followed_by_generation_is_counted_once():
+    pool = PrefetchPool(capacity=2, low_water=1)
+    produce = make_producer()
+
+    assert pool.pop("random", 1, produce) is None
+    generated = await pool.generate(1, produce)
+    await asyncio.gather(*pool._refills.values())
+
+    assert (pool.hits, pool.misses) == (0, 1)
+    assert generated.startswith("fact")
+
+async def test_user_never_gets_an_answer_twice_and_memory_is_bounded():
+    pool = PrefetchPool(capacity=2, low_water=0, max_pools=2)
+
+    async def repeat():
+        return "same fact"
+
+    assert await pool.take("random", 1, repeat) == "same fact"
+    await asyncio.gather(*pool._refills.values())
+    assert pool.pop("random", 1, repeat) is None
+    assert pool.pop("random", 2, repeat) == "same fact"
+
+    for key in ("a", "b", "c"):
+        pool.warm(key, make_producer())
+    await asyncio.gather(*pool._refills.values())
+    assert list(pool._pools) == ["b", "c"]
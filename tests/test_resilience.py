@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import openai
+import pytest
+from src.gpt import ChatGPTService, CircuitOpenError, RateLimitedError, RetryPolicy
+from src.resilience import hedged
+from tests.fake_openai import FakeOpenAIServer
+
+FAST_RETRIES = RetryPolicy(max_attempts=3, attempt_timeout=1.0, base_delay=0.01, max_delay=1.0)
+
+
+async def test_retries_transient_errors_and_honours_retry_after():
+    with FakeOpenAIServer(faults=[500, (429, {"Retry-After": "0.3"})]) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, retry_policy=FAST_RETRIES)
+        started = time.perf_counter()
+        result = await service.send_question("System prompt", "Question")
+        elapsed = time.perf_counter() - started
+        await service.aclose()
+
+    assert result == "Fake response"
+    assert len(server.requests) == 3
+    assert elapsed >= 0.3
+
+
+async def test_attempt_deadline_and_client_errors():
+    with FakeOpenAIServer(faults=[("delay", 2.0), 400]) as server:
+        policy = RetryPolicy(max_attempts=2, attempt_timeout=0.3, base_delay=0.01)
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, retry_policy=policy)
+        with pytest.raises(openai.BadRequestError):
+            await service.send_question("System prompt", "Question")
+        await service.aclose()
+
+    assert len(server.requests) == 2
+
+
+async def test_exhausted_rate_limit_is_reported_as_own_error():
+    with FakeOpenAIServer(faults=[429] * 3) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, retry_policy=FAST_RETRIES)
+        with pytest.raises(RateLimitedError) as raised:
+            await service.send_question("System prompt", "Question")
+        await service.aclose()
+
+    assert isinstance(raised.value.__cause__, openai.RateLimitError)
+
+async def test_circuit_breaker_fails_fast_while_upstream_is_down():
+    with FakeOpenAIServer(faults=[503] * 10) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, retry_policy=FAST_RETRIES,
+                                 breaker_threshold=3, breaker_reset_timeout=60)
+        with pytest.raises(openai.InternalServerError):
+            await service.send_question("System prompt", "Question")
+        with pytest.raises(CircuitOpenError):
+            await service.send_question("System prompt", "Question")
+        await service.aclose()
+
+    assert len(server.requests) == 3
+
+
+async def test_failover_and_hedging_across_endpoints():
+    with FakeOpenAIServer(delay=2.0, content="slow") as slow, FakeOpenAIServer(content="fast") as fast:
+        service = ChatGPTService(
+            token="fake_token",
+            endpoints=[(slow.base_url, None), (fast.base_url, None)],
+            retry_policy=RetryPolicy(attempt_timeout=5.0),
+            hedge_delay=0.1
+        )
+        started = time.perf_counter()
+        result = await service.send_question("System prompt", "Question")
+        elapsed = time.perf_counter() - started
+
+        service.hedge_delay = None
+        for _ in range(service.endpoints[0].breaker.failure_threshold):
+            service.endpoints[0].breaker.record_failure()
+        failover = await service.send_question("System prompt", "Question")
+        await service.aclose()
+
+    assert result == "fast"
+    assert elapsed < 1.0
+    assert failover == "fast"
+
+
+async def test_half_open_probe_is_released_when_cancelled_or_rejected():
+    with FakeOpenAIServer(faults=[("delay", 2.0), 400]) as server:
+        service = ChatGPTService(token="fake_token", base_url=server.base_url, retry_policy=FAST_RETRIES,
+                                 breaker_reset_timeout=0)
+        breaker = service.endpoints[0].breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        probe = asyncio.create_task(service.send_question("System prompt", "Question"))
+        await asyncio.sleep(0.2)
+        assert not breaker.available
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.available
+        with pytest.raises(openai.BadRequestError):
+            await service.send_question("System prompt", "Question")
+        assert breaker.available
+        result = await service.send_question("System prompt", "Question")
+        await service.aclose()
+
+    assert result == "Fake response"
+    assert breaker.state == "closed"
+
+
+async def test_hedged_treats_a_cancelled_attempt_as_failed():
+    first = asyncio.get_running_loop().create_future()
+
+    async def cancelled_attempt():
+        first.cancel()
+        return await first
+
+    async def healthy_attempt():
+        return "ok"
+
+    assert await hedged([cancelled_attempt, healthy_attempt], delay=1.0) == "ok"
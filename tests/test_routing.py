@@ -0,0 +1,57 @@
+import pytest
+
+from src.routing import CallbackRouter, callback_data, parse_callback_data
+
+
+def test_callback_data_round_trips_and_is_validated():
+    assert callback_data("menu") == "menu"
+    assert callback_data("talk", "pick", "gandalf") == "talk:pick:gandalf"
+    assert parse_callback_data("talk:pick:gandalf") == ("talk", "pick", ("gandalf",))
+    assert parse_callback_data("menu") == ("menu", "", ())
+    with pytest.raises(ValueError):
+        callback_data("talk", "pick", "a:b")
+    with pytest.raises(ValueError):
+        callback_data("talk", "pick", "x" * 64)
+
+
+async def test_router_dispatches_by_route_and_answers_once(mocker):
+    calls = []
+
+    async def menu(update, context):
+        calls.append("menu")
+
+    async def pick(update, context, name):
+        calls.append(name)
+
+    router = CallbackRouter({("menu", ""): menu, ("talk", "pick"): pick},
+                            {"start": "menu", "talk_gandalf": "talk:pick:gandalf"})
+    update = mocker.MagicMock()
+    update.callback_query.answer = mocker.AsyncMock()
+    for data in ("menu", "start", "talk:pick:linus", "talk_gandalf", "talk:pick", "talk:pick:a:b", "nothing"):
+        update.callback_query.data = data
+        await router.dispatch(update, None)
+    assert calls == ["menu", "menu", "linus", "gandalf"]
+    assert update.callback_query.answer.await_count == 7
+    assert router.unknown == 3
+    assert router.dispatched == {"menu:": 2, "talk:pick": 2}
+
+
+def test_router_rejects_ambiguous_routes():
+    async def handler(update, context):
+        pass
+
+    router = CallbackRouter({("menu", ""): handler})
+    with pytest.raises(ValueError):
+        router.add("menu", "", handler)
+    with pytest.raises(ValueError):
+        router.alias("menu", "menu")
+    with pytest.raises(ValueError):
+        router.alias("start", "missing")
+
+
+def test_bot_callback_routes_cover_every_button():
+    from src import handlers
+
+    for data in handlers.LEGACY_CALLBACKS.values():
+        assert handlers.callbacks.resolve(data) is not None
+    assert all(handlers.callbacks.resolve(data) is not None for data in handlers.language_buttons())
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+from src.gpt import ChatGPTService
+from src.sessions import SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sessions_are_isolated_per_chat():
+    store = SessionStore()
+    store.reset(1, "Prompt A").add("user", "hello")
+    store.reset(2, "Prompt B")
+
+    assert store.get(1).messages() == [
+        {"role": "system", "content": "Prompt A"},
+        {"role": "user", "content": "hello"}
+    ]
+    assert store.get(2).messages() == [{"role": "system", "content": "Prompt B"}]
+
+
+def test_get_with_different_prompt_resets_history():
+    store = SessionStore()
+    store.reset(1, "Prompt A").add("user", "hello")
+
+    assert store.get(1, "Prompt A").turns == [("user", "hello")]
+    assert store.get(1, "Prompt B").turns == []
+
+
+def test_lru_ttl_and_memory_eviction():
+    clock = FakeClock()
+    store = SessionStore(max_sessions=2, ttl=10, max_bytes=1000, clock=clock)
+    store.get(1)
+    store.get(2)
+    store.get(1)
+    store.get(3)
+    assert 2 not in store and 1 in store and 3 in store
+
+    clock.now = 20
+    store.get(4)
+    assert len(store) == 1
+
+    store.get(4).add("user", "x" * 2000)
+    store.get(5)
+    assert 4 not in store
+    assert store.total_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_records_turns_in_conversation(mocker):
+    service = ChatGPTService(token="fake_token")
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content="AI Response"))]
+    create = mocker.patch.object(service.client.chat.completions, 'create',
+                                 new=mocker.AsyncMock(return_value=mock_response))
+    conversation = SessionStore().reset(1, "System prompt")
+
+    result = await service.chat(conversation, "Question")
+
+    assert result == "AI Response"
+    assert create.call_args.kwargs["messages"][-1] == {"role": "user", "content": "Question"}
+    assert conversation.turns == [("user", "Question"), ("assistant", "AI Response")]
+
+
+async def test_histories_survive_restart_and_eviction(tmp_path):
+    from src.persistence import SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / "state.sqlite3"))
+    store = SessionStore(max_sessions=1, backend=storage)
+    store.reset(1, "Prompt A").add("user", "hello")
+    store.reset(2, "Prompt B").add("user", "evicts chat 1")
+    assert 1 not in store
+    assert store.get(1).messages()[-1] == {"role": "user", "content": "hello"}
+    await store.flush()
+    storage.close()
+
+    restarted = SessionStore(backend=SQLiteStorage(str(tmp_path / "state.sqlite3")))
+    assert restarted.get(2).messages() == [
+        {"role": "system", "content": "Prompt B"},
+        {"role": "user", "content": "evicts chat 1"}
+    ]
+    assert restarted.get(1).turns == [("user", "hello")]
+    assert not restarted.dirty
+
+
+async def test_fetch_reads_history_off_the_event_loop(tmp_path, mocker):
+    from src.persistence import SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / "state.sqlite3"))
+    store = SessionStore(backend=storage)
+    store.reset(1, "Prompt A").add("user", "hello")
+    store.reset(2, "Prompt B").add("user", "old")
+    await store.flush()
+
+    restarted = SessionStore(backend=storage)
+    to_thread = mocker.spy(asyncio, "to_thread")
+    assert (await restarted.fetch(1, "Prompt A")).turns == [("user", "hello")]
+    assert to_thread.call_args.args == (storage.load_conversation, 1)
+
+    loading = asyncio.ensure_future(restarted.fetch(2))
+    await asyncio.sleep(0)
+    restarted.reset(2, "Prompt C")
+    assert (await loading).messages() == [{"role": "system", "content": "Prompt C"}]
+    storage.close()
+
+async def test_user_data_writes_are_batched(tmp_path):
+    from src.persistence import SQLitePersistence, SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / "state.sqlite3"))
+    persistence = SQLitePersistence(storage)
+    await persistence.update_user_data(1, {"conversation_state": "translator", "translator_lang": "English"})
+    await persistence.update_user_data(2, {"conversation_state": "gpt"})
+    await persistence.drop_user_data(2)
+    await persistence.flush()
+
+    assert await SQLitePersistence(storage).get_user_data() == {
+        1: {"conversation_state": "translator", "translator_lang": "English"}
+    }
+
+
+async def test_stale_user_data_is_pruned_before_loading(tmp_path, mocker):
+    from src.persistence import SQLitePersistence, SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / "state.sqlite3"))
+    clock = mocker.patch("src.persistence.time.time", return_value=1000.0)
+    storage.save_user_data({1: {"conversation_state": "gpt"}})
+    storage.save_conversations([(1, "Prompt", None, [])])
+    clock.return_value = 5000.0
+    storage.save_user_data({2: {"conversation_state": "talk"}})
+
+    assert await SQLitePersistence(storage, retention=3000).get_user_data() == {2: {"conversation_state": "talk"}}
+    assert storage.load_conversation(1) is None
+    storage.close()
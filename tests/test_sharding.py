@@ -0,0 +1,34 @@
+from src.sharding import HashRing, Worker, raw_chat_key, worker_env
+
+
+def test_raw_chat_key_uses_chat_then_user():
+    assert raw_chat_key({"update_id": 1, "message": {"chat": {"id": 42}, "from": {"id": 7}}}) == 42
+    assert raw_chat_key({"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 42}}}}) == 42
+    assert raw_chat_key({"update_id": 3, "inline_query": {"from": {"id": 7}}}) == 7
+    assert raw_chat_key({"update_id": 4}) is None
+
+
+def test_hash_ring_is_stable_and_moves_few_keys():
+    ring = HashRing([0, 1, 2])
+    assert all(ring.node(key) == HashRing([0, 1, 2]).node(key) for key in range(100))
+    assert {ring.node(key) for key in range(1000)} == {0, 1, 2}
+
+    grown = HashRing([0, 1, 2, 3])
+    moved = [key for key in range(1000) if ring.node(key) != grown.node(key)]
+    assert all(grown.node(key) == 3 for key in moved)
+    assert len(moved) < 400
+
+
+def test_worker_buffer_drops_oldest_when_full():
+    worker = Worker(0, 0, {}, max_pending=2)
+    for line in (b"1\n", b"2\n", b"3\n"):
+        worker.send(line)
+    assert list(worker.pending) == [b"2\n", b"3\n"]
+    assert worker.dropped == 1
+
+
+def test_worker_env_splits_shared_budgets():
+    env = worker_env(1, 8601, 4, {"TELEGRAM_GLOBAL_RATE": 30.0, "ADMISSION_MAX_IN_FLIGHT": 64})
+    assert env["BOT_MODE"] == "worker" and env["WORKER_PORT"] == "8601"
+    assert env["TELEGRAM_GLOBAL_RATE"] == "7.5"
+    assert env["ADMISSION_MAX_IN_FLIGHT"] == "16"
@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+
+
+async def test_translations_fan_out_and_reassemble_segments(mocker):
+    from src import handlers
+
+    async def send_question(prompt, segment, cache=False, mode="default"):
+        language = prompt.split("на ")[1].split(",")[0]
+        await asyncio.sleep(0.05 if language == "англійську" else 0.01)
+        return f"{language}[{segment}]"
+
+    @contextlib.asynccontextmanager
+    async def slot():
+        yield
+
+    services = mocker.patch.object(handlers, "services")
+    services.admission.slot = slot
+    services.chatgpt.send_question = mocker.AsyncMock(side_effect=send_question)
+    mocker.patch.object(handlers, "TRANSLATOR_SEGMENT_LENGTH", 12)
+    send_answer = mocker.patch.object(handlers, "send_answer", mocker.AsyncMock())
+
+    async def with_typing(update, context, result):
+        return await result
+
+    mocker.patch.object(handlers, "with_typing", with_typing)
+
+    await handlers.send_translations(mocker.MagicMock(), mocker.MagicMock(), "One line\nTwo line", ["en", "la"])
+
+    assert services.chatgpt.send_question.await_count == 4
+    (first, first_buttons), (last, last_buttons) = [call.args[2:] for call in send_answer.await_args_list]
+    assert first == "**Latin 🏛**\n\nлатинську[One line]\nлатинську[Two line]"
+    assert last.startswith("**English 🇺🇸**") and first_buttons is None
+    assert last_buttons[handlers.callback_data("translator", "lang", "la")] == "✅ Latin 🏛"
+
+
+async def test_cancelled_translations_stop_every_language(mocker):
+    from src import handlers
+
+    finished = []
+
+    async def send_question(prompt, segment, cache=False, mode="default"):
+        await asyncio.sleep(0.2)
+        finished.append(segment)
+        return segment
+
+    @contextlib.asynccontextmanager
+    async def slot():
+        yield
+
+    services = mocker.patch.object(handlers, "services")
+    services.admission.slot = slot
+    services.chatgpt.send_question = mocker.AsyncMock(side_effect=send_question)
+    mocker.patch.object(handlers, "send_answer", mocker.AsyncMock())
+
+    async def with_typing(update, context, result):
+        return await result
+
+    mocker.patch.object(handlers, "with_typing", with_typing)
+
+    task = asyncio.create_task(
+        handlers.send_translations(mocker.MagicMock(), mocker.MagicMock(), "Text", ["en", "la", "zh"])
+    )
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.sleep(0.3)
+
+    assert task.cancelled()
+    assert finished == []
+
+def test_selected_languages_reads_state_of_single_language_mode():
+    from src.handlers import selected_languages
+
+    assert selected_languages({"translator_lang": "латинську"}) == ["la"]
+    assert selected_languages({"translator_langs": ["zh", "xx", "en"]}) == ["zh", "en"]
+    assert selected_languages({}) == []
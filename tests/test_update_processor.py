@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+from telegram import Chat, Message, Update
+from src.update_processor import ChatOrderedUpdateProcessor
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type="private")
+    return Update(update_id=update_id, message=Message(message_id=update_id, date=None, chat=chat, text="hi"))
+
+
+async def test_same_chat_is_ordered_and_chats_run_in_parallel():
+    processor = ChatOrderedUpdateProcessor(16)
+    handled = []
+
+    async def handle(update_id, chat_id, delay):
+        await asyncio.sleep(delay)
+        handled.append((chat_id, update_id))
+
+    jobs = [(1, 1, 0.2), (2, 1, 0.0), (3, 2, 0.2), (4, 1, 0.0), (5, 3, 0.2)]
+    started = time.perf_counter()
+    async with processor:
+        await asyncio.gather(*(
+            processor.process_update(make_update(update_id, chat_id), handle(update_id, chat_id, delay))
+            for update_id, chat_id, delay in jobs
+        ))
+    elapsed = time.perf_counter() - started
+
+    assert [update_id for chat_id, update_id in handled if chat_id == 1] == [1, 2, 4]
+    assert elapsed < 0.4
+    assert processor.busy_chats == 0
+
+
+async def test_queued_messages_are_coalesced_and_bounded():
+    processor = ChatOrderedUpdateProcessor(16, max_queued_per_chat=3)
+    taken = []
+    handled = []
+
+    async def first():
+        await asyncio.sleep(0.05)
+        taken.extend(processor.take_queued_texts(1))
+
+    async def handle(update_id):
+        handled.append(update_id)
+
+    async with processor:
+        jobs = [processor.process_update(make_update(1, 1), first())]
+        jobs += [processor.process_update(make_update(update_id, 1), handle(update_id)) for update_id in range(2, 7)]
+        await asyncio.gather(*jobs)
+
+    assert processor.dropped == 2
+    assert taken == ["hi", "hi", "hi"]
+    assert processor.coalesced == 3
+    assert handled == []
+
+
+def make_command(update_id: int, chat_id: int, text: str) -> Update:
+    chat = Chat(id=chat_id, type="private")
+    return Update(update_id=update_id, message=Message(message_id=update_id, date=None, chat=chat, text=text))
+
+
+def classify(update: Update) -> str:
+    return "interactive" if update.message.text.startswith("/") else "gpt"
+
+
+async def test_interactive_updates_overtake_gpt_ones_within_budget():
+    processor = ChatOrderedUpdateProcessor(16, max_gpt_updates=2, classify=classify)
+    handled = []
+    running = 0
+    peak = 0
+
+    async def answer(update_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.1)
+        running -= 1
+        handled.append(update_id)
+
+    async def navigate(update_id):
+        handled.append(update_id)
+
+    async with processor:
+        await asyncio.gather(*(processor.process_update(make_update(chat_id, chat_id), answer(chat_id))
+                               for chat_id in range(1, 5)))
+        await processor.process_update(make_command(10, 1, "/start"), navigate(10))
+        assert handled == [10]
+        assert processor.busy_chats == 4
+
+    assert peak == 2
+    assert sorted(handled) == [1, 2, 3, 4, 10]
+    assert processor.busy_chats == 0
+
+
+async def test_cancel_pending_stops_running_and_queued_gpt_updates():
+    processor = ChatOrderedUpdateProcessor(16, max_gpt_updates=4, classify=classify)
+    handled = []
+
+    async def answer(update_id):
+        await asyncio.sleep(0.2)
+        handled.append(update_id)
+
+    async def leave(update_id):
+        handled.append(update_id)
+        assert processor.cancel_pending(1) == 3
+        assert processor.cancel_pending(1) == 0
+
+    async with processor:
+        for update_id in range(1, 4):
+            await processor.process_update(make_update(update_id, 1), answer(update_id))
+        await processor.process_update(make_update(4, 2), answer(4))
+        await asyncio.sleep(0.01)
+        await processor.process_update(make_command(5, 1, "/gpt"), leave(5))
+
+    assert handled == [5, 4]
+    assert processor.cancelled == 3
+    assert processor.busy_chats == 0
+
+
+async def test_gpt_update_waits_for_the_command_received_before_it():
+    processor = ChatOrderedUpdateProcessor(16, max_gpt_updates=4, classify=classify)
+    user_data = {}
+    answered = []
+
+    async def gpt_command():
+        user_data.clear()
+        await asyncio.sleep(0.1)
+        user_data["conversation_state"] = "gpt"
+
+    async def text():
+        answered.append(user_data.get("conversation_state"))
+
+    async with processor:
+        await asyncio.gather(processor.process_update(make_command(1, 1, "/gpt"), gpt_command()),
+                             processor.process_update(make_update(2, 1), text()))
+
+    assert answered == ["gpt"]
+
+
+async def test_leaving_the_mode_keeps_messages_sent_after_the_command():
+    processor = ChatOrderedUpdateProcessor(16, max_gpt_updates=4, classify=classify)
+    answered = []
+    taken = []
+
+    async def answer(update_id, delay=0.0):
+        await asyncio.sleep(delay)
+        taken.extend(processor.take_queued_texts(1))
+        answered.append(update_id)
+
+    async def leave():
+        await asyncio.sleep(0.05)
+        processor.cancel_pending(1)
+
+    async with processor:
+        await processor.process_update(make_update(1, 1), answer(1, 0.2))
+        await processor.process_update(make_update(2, 1), answer(2))
+        command = asyncio.ensure_future(processor.process_update(make_command(3, 1, "/gpt"), leave()))
+        await asyncio.sleep(0.01)
+        await processor.process_update(make_update(4, 1), answer(4))
+        await processor.process_update(make_update(5, 1), answer(5))
+        await command
+
+    assert processor.cancelled == 2
+    assert answered == [4]
+    assert taken == ["hi"]
+
+
+async def test_messages_on_both_sides_of_a_command_are_not_merged():
+    processor = ChatOrderedUpdateProcessor(16, max_gpt_updates=4, classify=classify)
+    taken = {}
+
+    async def answer(update_id, delay=0.0):
+        await asyncio.sleep(delay)
+        taken[update_id] = processor.take_queued_texts(1)
+
+    async def navigate():
+        pass
+
+    async with processor:
+        await processor.process_update(make_update(1, 1), answer(1, 0.1))
+        await processor.process_update(make_update(2, 1), answer(2))
+        await processor.process_update(make_command(3, 1, "/talk"), navigate())
+        await processor.process_update(make_update(4, 1), answer(4))
+
+    assert taken == {1: ["hi"], 4: []}
@@ -12,4 +12,188 @@ def test_load_prompt_success():
 
 def test_load_message_file_not_found():
     with pytest.raises(FileNotFoundError):
-        load_message("non_existent_file")
\ No newline at end of file
+        load_message("non_existent_file")
+
+async def test_send_streaming_text_edits_one_message(mocker):
+    from src.utils import send_streaming_text
+
+    async def deltas():
+        for part in ["Hello", ", ", "world"]:
+            yield part
+
+    update = mocker.MagicMock()
+    update.effective_message.chat_id = 1
+    context = mocker.MagicMock()
+    context.bot.send_message = mocker.AsyncMock(return_value=mocker.MagicMock(message_id=7))
+    context.bot.edit_message_text = mocker.AsyncMock()
+
+    await send_streaming_text(update, context, deltas(), {"start": "Menu"}, min_interval=0)
+
+    context.bot.send_message.assert_awaited_once()
+    final = context.bot.edit_message_text.await_args_list[-1].kwargs
+    assert final["text"] == "Hello, world"
+    assert final["message_id"] == 7
+    assert final["reply_markup"] is not None
+    assert all(call.kwargs.get("reply_markup") is None for call in context.bot.edit_message_text.await_args_list[:-1])
+
+
+async def test_send_streaming_text_finishes_message_when_stream_breaks(mocker):
+    from telegram.error import BadRequest
+    from src.utils import send_streaming_text
+
+    async def deltas():
+        yield "Hello"
+        raise ConnectionError("stream closed")
+
+    update = mocker.MagicMock()
+    context = mocker.MagicMock()
+    context.bot.send_message = mocker.AsyncMock(return_value=mocker.MagicMock(message_id=7))
+    context.bot.edit_message_text = mocker.AsyncMock()
+
+    with pytest.raises(ConnectionError):
+        await send_streaming_text(update, context, deltas(), {"start": "Menu"}, min_interval=0)
+    final = context.bot.edit_message_text.await_args_list[-1].kwargs
+    assert final["text"] == "Hello" and final["reply_markup"] is not None
+
+    await send_streaming_text(update, context, deltas(), {"start": "Menu"}, min_interval=0,
+                              failure=lambda error: "Interrupted")
+    final = context.bot.edit_message_text.await_args_list[-1].kwargs
+    assert final["text"] == "Hello\n\nInterrupted" and final["reply_markup"] is not None
+    assert context.bot.send_message.await_count == 2
+
+    closed = []
+
+    async def endless():
+        try:
+            while True:
+                yield "more "
+        finally:
+            closed.append(True)
+
+    context.bot.edit_message_text.side_effect = BadRequest("Message can't be edited")
+    with pytest.raises(BadRequest):
+        await send_streaming_text(update, context, endless(), {"start": "Menu"}, min_interval=0,
+                                  failure=lambda error: "Interrupted")
+    assert closed == [True]
+
+async def test_send_image_reuses_file_id_and_reuploads_stale(mocker, tmp_path):
+    from telegram.error import BadRequest
+    from src import utils
+
+    mocker.patch.object(utils, "image_cache", utils.ImageCache(str(tmp_path / "image_cache.json")))
+    update = mocker.MagicMock()
+    context = mocker.MagicMock()
+    uploaded = mocker.MagicMock(photo=[mocker.MagicMock(file_id="small"), mocker.MagicMock(file_id="file-1")])
+    context.bot.send_photo = mocker.AsyncMock(return_value=uploaded)
+
+    await utils.send_image(update, context, "start")
+    await utils.send_image(update, context, "start")
+    assert context.bot.send_photo.await_args_list[1].kwargs["photo"] == "file-1"
+
+    context.bot.send_photo.side_effect = [BadRequest("Wrong file identifier"), uploaded]
+    await utils.send_image(update, context, "start")
+    assert context.bot.send_photo.await_args_list[-1].kwargs["photo"] != "file-1"
+    persisted = utils.ImageCache(str(tmp_path / "image_cache.json"))
+    persisted.load()
+    assert persisted.get("start", utils.registry.image("start").digest) == "file-1"
+    assert [path.name for path in tmp_path.iterdir()] == ["image_cache.json"]
+
+
+def test_registry_validates_and_hot_reloads(tmp_path):
+    from src.resource_registry import ResourceRegistry
+
+    for kind in ("prompts", "messages", "images"):
+        (tmp_path / kind).mkdir()
+    (tmp_path / "prompts" / "gpt.txt").write_text("v1", encoding="utf-8")
+    registry = ResourceRegistry(str(tmp_path))
+    registry.load()
+
+    with pytest.raises(FileNotFoundError, match="messages/start.txt"):
+        registry.validate({"prompts": ["gpt"], "messages": ["start"]})
+
+    assert registry.reload_if_changed() is False
+    (tmp_path / "prompts" / "gpt.txt").write_text("version 2", encoding="utf-8")
+    assert registry.reload_if_changed() is True
+    assert registry.prompt("gpt") == "version 2"
+
+async def test_outbound_scheduler_paces_chats_and_retries_flood_waits():
+    import time
+    from telegram.error import RetryAfter
+    from src.utils import OutboundScheduler
+
+    scheduler = OutboundScheduler(global_rate=0, chat_rate=10, chat_burst=2, max_retries=1)
+    sent = []
+
+    async def send(chat_id):
+        sent.append((chat_id, time.perf_counter()))
+        return True
+
+    started = time.perf_counter()
+    for _ in range(4):
+        await scheduler.process_request(send, (1,), {}, "sendMessage", {"chat_id": 1}, None)
+    await scheduler.process_request(send, (2,), {}, "sendMessage", {"chat_id": 2}, None)
+    await scheduler.process_request(send, (1,), {}, "sendChatAction", {"chat_id": 1}, None)
+    assert [at - started for chat_id, at in sent if chat_id == 1][3] >= 0.15
+    assert sent[4][1] - sent[3][1] < 0.05
+
+    failures = [RetryAfter(0.2)]
+
+    async def flaky():
+        if failures:
+            raise failures.pop()
+        return True
+
+    started = time.perf_counter()
+    assert await scheduler.process_request(flaky, (), {}, "deleteMessage", {"chat_id": 1}, None)
+    assert time.perf_counter() - started >= 0.2
+    assert scheduler.flood_waits == 1
+
+async def test_main_menu_is_registered_once_per_version(mocker, tmp_path):
+    from src.persistence import SQLiteStorage
+    from src.utils import MenuRegistry, register_default_menu, show_main_menu
+
+    storage = SQLiteStorage(str(tmp_path / "state.sqlite3"))
+    update = mocker.MagicMock()
+    update.effective_chat.id = 5
+    context = mocker.MagicMock()
+    context.bot.set_my_commands = mocker.AsyncMock()
+    context.bot.set_chat_menu_button = mocker.AsyncMock()
+    menus = MenuRegistry(storage)
+
+    await register_default_menu(context.bot, {"start": "Menu"}, menus)
+    await show_main_menu(update, context, {"start": "Menu"}, menus)
+    await show_main_menu(update, context, {"start": "Menu"}, menus)
+    assert context.bot.set_my_commands.await_count == 2
+
+    restarted = MenuRegistry(storage)
+    await register_default_menu(context.bot, {"start": "Menu"}, restarted)
+    await show_main_menu(update, context, {"start": "Menu"}, restarted)
+    assert context.bot.set_my_commands.await_count == 2
+
+    await show_main_menu(update, context, {"start": "Main menu"}, restarted)
+    assert context.bot.set_my_commands.await_count == 3
+    assert context.bot.set_chat_menu_button.await_count == 3
+    storage.close()
+
+async def test_send_streaming_text_splits_long_answers(mocker):
+    from src.utils import send_streaming_text
+
+    async def deltas():
+        for i in range(30):
+            yield f"Paragraph {i} " + "word " * 40 + "\n\n"
+
+    update = mocker.MagicMock()
+    update.effective_message.chat_id = 1
+    context = mocker.MagicMock()
+    context.bot.send_message = mocker.AsyncMock(side_effect=lambda **kwargs: mocker.MagicMock(message_id=len(
+        context.bot.send_message.await_args_list)))
+    context.bot.edit_message_text = mocker.AsyncMock()
+
+    await send_streaming_text(update, context, deltas(), {"start": "Menu"}, min_interval=0)
+
+    sent = context.bot.send_message.await_args_list
+    edits = context.bot.edit_message_text.await_args_list
+    assert len(sent) == 2
+    assert all(len(call.kwargs["text"]) <= 4096 for call in sent + edits)
+    assert [call.kwargs["message_id"] for call in edits if call.kwargs["reply_markup"] is not None] == [2]
+    assert edits[-1].kwargs["text"].endswith("word")